@@ -1,8 +1,8 @@
 import sqlite3
 
 
-def create_tables():
-    conn = sqlite3.connect("database.db")
+def create_tables(db_file="database.db"):
+    conn = sqlite3.connect(db_file)
     cur = conn.cursor()
 
     # Parking Lots
@@ -173,8 +173,8 @@ def create_tables():
 
     conn.commit()
     conn.close()
-    print("SQLite database and tables created successfully!")
 
 
 if __name__ == "__main__":
     create_tables()
+    print("SQLite database and tables created successfully!")
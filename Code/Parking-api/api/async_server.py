@@ -0,0 +1,229 @@
+"""asyncio front end for the Parking API.
+
+Serves the same routes as server.RequestHandler, but keeps HTTP/1.1
+connections open between requests so gate terminals don't pay for a new
+TCP connection on every call. An idle connection only costs a coroutine;
+the route handlers, which do blocking file I/O and price calculations,
+run on a thread pool.
+
+Start with: python async_server.py
+"""
+import asyncio
+import io
+import os
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from http.client import parse_headers
+
+from server import RequestHandler
+
+
+KEEP_ALIVE_TIMEOUT = float(os.getenv("API_KEEPALIVE_TIMEOUT", 75))
+
+
+def _wants_keep_alive(version, headers):
+    connection = headers.get("Connection", "").lower()
+    if version == "HTTP/1.1":
+        return connection != "close"
+    return connection == "keep-alive"
+
+
+class _ResponseWriter:
+    """wfile for a handler running on the thread pool.
+
+    Responses are collected and framed by _frame_response once the
+    handler returns, except chunked ones (RequestHandler.stream_body):
+    those are passed on to the connection as they are written, waiting
+    for the socket buffer to drain so a slow client holds back the
+    handler instead of filling memory.
+    """
+
+    def __init__(self, loop, writer, keep_alive):
+        self.loop = loop
+        self.writer = writer
+        self.keep_alive = keep_alive
+        self.buffer = bytearray()
+        self.streaming = False
+
+    def write(self, data):
+        if self.streaming:
+            self._send(bytes(data))
+            return len(data)
+        self.buffer += data
+        head, separator, body = bytes(self.buffer).partition(b"\r\n\r\n")
+        if separator and b"\r\ntransfer-encoding: chunked" in head.lower():
+            self.streaming = True
+            self.buffer.clear()
+            framed, self.keep_alive = _frame_response(head + separator, self.keep_alive)
+            self._send(framed + body)
+        return len(data)
+
+    def _send(self, data):
+        asyncio.run_coroutine_threadsafe(self._drain(data), self.loop).result()
+
+    async def _drain(self, data):
+        self.writer.write(data)
+        await self.writer.drain()
+
+    def getvalue(self):
+        return bytes(self.buffer)
+
+
+def _dispatch(method, target, version, headers, body, client_address, wfile=None):
+    """Run one request through RequestHandler and return the raw response.
+
+    With a _ResponseWriter as wfile a streamed response has been sent
+    already when this returns, and b"" is returned for it.
+    """
+    handler = RequestHandler.__new__(RequestHandler)
+    handler.server = None
+    handler.client_address = client_address
+    handler.command = method
+    handler.path = target
+    handler.request_version = version
+    handler.requestline = f"{method} {target} {version}"
+    handler.protocol_version = "HTTP/1.1"
+    handler.headers = headers
+    handler.close_connection = wfile is not None and not wfile.keep_alive
+    handler.rfile = io.BytesIO(body)
+    handler.wfile = wfile if wfile is not None else io.BytesIO()
+
+    do_method = getattr(handler, "do_" + method, None)
+    if do_method is None:
+        handler.send_error(501, f"Unsupported method ({method!r})")
+        return handler.wfile.getvalue()
+
+    try:
+        do_method()
+    except Exception:
+        traceback.print_exc()
+        if getattr(handler.wfile, "streaming", False):
+            # Part of the body is out, the client can only tell from
+            # the missing last chunk and a closed connection
+            handler.wfile.keep_alive = False
+            return b""
+        handler.wfile = io.BytesIO()
+        handler._headers_buffer = []
+        handler.send_error(500)
+    if getattr(handler.wfile, "streaming", False):
+        return b""
+    return handler.wfile.getvalue()
+
+
+def _frame_response(raw, keep_alive):
+    """Add Content-Length and Connection headers to a handler response.
+
+    RequestHandler frames the responses of its routes itself; this covers
+    whatever else it writes, and an empty reply.
+    """
+    head, separator, body = raw.partition(b"\r\n\r\n")
+    if not separator:
+        # The handler did not answer this route
+        head = b"HTTP/1.1 404 Not Found\r\nContent-Type: text/plain"
+        body = b"Not found"
+
+    lines = head.split(b"\r\n")
+    names = {line.split(b":", 1)[0].strip().lower() for line in lines[1:]}
+    status = lines[0].split(b" ", 2)[1:2]
+    if (
+        b"content-length" not in names
+        and b"transfer-encoding" not in names
+        and status != [b"304"]
+    ):
+        lines.append(b"Content-Length: %d" % len(body))
+    if b"connection" in names:
+        keep_alive = keep_alive and b"Connection: close" not in lines
+    else:
+        lines.append(b"Connection: keep-alive" if keep_alive else b"Connection: close")
+    return b"\r\n".join(lines) + b"\r\n\r\n" + body, keep_alive
+
+
+async def handle_connection(reader, writer, executor):
+    loop = asyncio.get_running_loop()
+    client_address = writer.get_extra_info("peername")[:2]
+    try:
+        while True:
+            try:
+                head = await asyncio.wait_for(
+                    reader.readuntil(b"\r\n\r\n"), KEEP_ALIVE_TIMEOUT
+                )
+            except (
+                asyncio.IncompleteReadError,
+                asyncio.LimitOverrunError,
+                asyncio.TimeoutError,
+                ConnectionError,
+            ):
+                break
+
+            request_line, _, header_block = head.partition(b"\r\n")
+            parts = request_line.decode("latin-1").split()
+            if len(parts) != 3:
+                writer.write(
+                    b"HTTP/1.1 400 Bad Request\r\n"
+                    b"Content-Length: 0\r\nConnection: close\r\n\r\n"
+                )
+                break
+            method, target, version = parts
+            headers = parse_headers(io.BytesIO(header_block))
+
+            if "chunked" in headers.get("Transfer-Encoding", "").lower():
+                writer.write(
+                    b"HTTP/1.1 411 Length Required\r\n"
+                    b"Content-Length: 0\r\nConnection: close\r\n\r\n"
+                )
+                break
+            length = int(headers.get("Content-Length", 0) or 0)
+            body = await reader.readexactly(length) if length > 0 else b""
+
+            wfile = _ResponseWriter(loop, writer, _wants_keep_alive(version, headers))
+            raw = await loop.run_in_executor(
+                executor, _dispatch, method, target, version, headers, body,
+                client_address, wfile,
+            )
+            if wfile.streaming:
+                keep_alive = wfile.keep_alive
+            else:
+                response, keep_alive = _frame_response(raw, wfile.keep_alive)
+                writer.write(response)
+                await writer.drain()
+            if not keep_alive:
+                break
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+async def serve(host="localhost", port=8000, threads=None, backlog=None, ready=None):
+    threads = threads or int(os.getenv("API_THREADS", 8))
+    backlog = backlog or int(os.getenv("API_BACKLOG", 128))
+    executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="api-worker")
+    server = await asyncio.start_server(
+        lambda reader, writer: handle_connection(reader, writer, executor),
+        host,
+        port,
+        backlog=backlog,
+    )
+    print(f"Async server running on http://{host}:{port} ({threads} threads)")
+    if ready is not None:
+        ready(server)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        executor.shutdown(wait=False)
+
+
+def run_async_server():
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    run_async_server()
@@ -0,0 +1,135 @@
+"""Compare parse and dump times of the JSON libraries on our data files.
+
+Run from Code/Parking-api/api:
+
+    python benchmarks/bench_json.py [payments.json] [sessions.json]
+
+Defaults to data/payments.json and the largest monthly session partition
+(data/pdata/p<lid>/<YYYY-MM>.json). A file that doesn't exist is replaced
+by generated records of the same shape (PAYMENTS and SESSIONS of them), so
+the numbers stay comparable on a machine without production data.
+"""
+import glob
+import json
+import os
+import sys
+import timeit
+import uuid
+from datetime import datetime, timedelta
+from hashlib import md5
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import json_codec
+
+
+PAYMENTS = int(os.getenv("BENCH_PAYMENTS", 100_000))
+SESSIONS = int(os.getenv("BENCH_SESSIONS", 20_000))
+REPEAT = int(os.getenv("BENCH_REPEAT", 5))
+
+
+def generate_payments(count):
+    start = datetime(2024, 1, 1)
+    return [
+        {
+            "transaction": md5(str(i).encode()).hexdigest(),
+            "amount": round(1 + i % 50 * 0.75, 2),
+            "initiator": f"user{i % 5000}",
+            "created_at": (start + timedelta(minutes=i)).strftime("%d-%m-%Y %H:%M:%S"),
+            "completed": (start + timedelta(minutes=i + 2)).strftime("%d-%m-%Y %H:%M:%S"),
+            "hash": str(uuid.UUID(int=i)),
+            "t_data": {
+                "amount": round(1 + i % 50 * 0.75, 2),
+                "date": (start + timedelta(minutes=i)).strftime("%Y-%m-%d %H:%M:%S"),
+                "method": "ideal",
+                "issuer": "XYY910HH",
+                "bank": "ABN-NL",
+            },
+        }
+        for i in range(count)
+    ]
+
+
+def generate_sessions(count):
+    start = datetime(2024, 1, 1)
+    return {
+        str(i): {
+            "licenseplate": f"{i % 100:02d}-ABC-{i % 10}",
+            "started": (start + timedelta(hours=i)).strftime("%d-%m-%Y %H:%M:%S"),
+            "stopped": (start + timedelta(hours=i + 2)).strftime("%d-%m-%Y %H:%M:%S"),
+            "user": f"user{i % 5000}",
+        }
+        for i in range(1, count + 1)
+    }
+
+
+def load_or_generate(path, generate, count):
+    if path and os.path.exists(path):
+        with open(path, "rb") as file:
+            text = file.read()
+        return f"{path} ({len(text) / 1e6:.1f} MB)", json.loads(text)
+    return f"{count} generated records", generate(count)
+
+
+def largest_partition(pdata="data/pdata"):
+    """Return the biggest month partition of any lot, or None."""
+    partitions = glob.glob(os.path.join(pdata, "p*", "[0-9][0-9][0-9][0-9]-[0-9][0-9].json"))
+    return max(partitions, key=os.path.getsize, default=None)
+
+
+def codecs():
+    """name -> (dumps returning bytes, loads) for every installed library."""
+    found = {
+        "json": (lambda obj: json.dumps(obj, default=str).encode("utf-8"), json.loads),
+    }
+    try:
+        import ujson
+
+        found["ujson"] = (
+            lambda obj: ujson.dumps(obj, default=str).encode("utf-8"),
+            ujson.loads,
+        )
+    except ImportError:
+        pass
+    try:
+        import orjson
+
+        found["orjson"] = (
+            lambda obj: orjson.dumps(
+                obj, default=str, option=orjson.OPT_PASSTHROUGH_DATETIME
+            ),
+            orjson.loads,
+        )
+    except ImportError:
+        pass
+    return found
+
+
+def best_of(function):
+    return min(timeit.repeat(function, number=1, repeat=REPEAT))
+
+
+def bench(label, data):
+    print(label)
+    print(f"  {'codec':8} {'dump ms':>10} {'parse ms':>10}")
+    for name, (dumps, loads) in codecs().items():
+        text = dumps(data)
+        dump = best_of(lambda: dumps(data))
+        parse = best_of(lambda: loads(text))
+        print(f"  {name:8} {dump * 1000:10.1f} {parse * 1000:10.1f}")
+    print()
+
+
+def main(argv):
+    payments_file = argv[1] if len(argv) > 1 else "data/payments.json"
+    sessions_file = argv[2] if len(argv) > 2 else largest_partition()
+
+    print(f"json_codec uses {json_codec.BACKEND}\n")
+    label, payments = load_or_generate(payments_file, generate_payments, PAYMENTS)
+    bench("payments: " + label, payments)
+    label, sessions = load_or_generate(sessions_file, generate_sessions, SESSIONS)
+    bench("sessions: " + label, sessions)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
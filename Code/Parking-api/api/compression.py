@@ -0,0 +1,94 @@
+"""gzip/deflate content encoding for API responses.
+
+The encoding is picked from the request's Accept-Encoding header.
+Responses smaller than API_COMPRESSION_MIN_SIZE bytes (default 1024)
+are sent as they are, since compressing them saves next to nothing.
+API_COMPRESSION_LEVEL sets the zlib level, 1 (fastest) to 9 (smallest),
+default 6; 0 turns compression off.
+"""
+import os
+import zlib
+
+
+LEVEL = int(os.getenv("API_COMPRESSION_LEVEL", 6))
+MIN_SIZE = int(os.getenv("API_COMPRESSION_MIN_SIZE", 1024))
+
+# Preferred first when the client accepts several equally
+ENCODINGS = ("gzip", "deflate")
+_WBITS = {"gzip": 16 + zlib.MAX_WBITS, "deflate": zlib.MAX_WBITS}
+
+
+def choose_encoding(accept_encoding):
+    """Return the encoding to use for an Accept-Encoding header, or None."""
+    if LEVEL <= 0 or not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.partition(";")
+        name = name.strip().lower()
+        weight = 1.0
+        params = params.strip().lower()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name] = weight
+    best, best_weight = None, 0.0
+    for name in ENCODINGS:
+        weight = weights.get(name, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = name, weight
+    return best
+
+
+def compressor(encoding):
+    """Return a zlib compressobj producing the given encoding."""
+    return zlib.compressobj(LEVEL, zlib.DEFLATED, _WBITS[encoding])
+
+
+def compress(data, encoding):
+    compress_obj = compressor(encoding)
+    return compress_obj.compress(data) + compress_obj.flush()
+
+
+def weaken_etag(line):
+    """Turn an ETag header line into a weak one.
+
+    A compressed body is not byte for byte the entity the strong tag
+    stands for, but If-None-Match compares weakly, so polls still match.
+    """
+    name, separator, value = line.partition(b":")
+    value = value.strip()
+    if name.strip().lower() != b"etag" or value.startswith(b"W/"):
+        return line
+    return b"ETag: W/" + value + line[len(line.rstrip(b"\r\n")):]
+
+
+def encode_response(raw, encoding):
+    """Compress the body of a raw HTTP response when it is large enough.
+
+    Returns the response with Content-Encoding, Content-Length and (unless
+    it has one) Vary headers added, or raw itself if it is below MIN_SIZE or already
+    encoded.
+    """
+    head, separator, body = raw.partition(b"\r\n\r\n")
+    if not separator or len(body) < MIN_SIZE:
+        return raw
+    lines = head.split(b"\r\n")
+    names = {line.split(b":", 1)[0].strip().lower() for line in lines[1:]}
+    if b"content-encoding" in names or b"transfer-encoding" in names:
+        return raw
+    body = compress(body, encoding)
+    lines = [lines[0]] + [
+        weaken_etag(line)
+        for line in lines[1:]
+        if line.split(b":", 1)[0].strip().lower() != b"content-length"
+    ]
+    lines += [
+        b"Content-Encoding: " + encoding.encode("ascii"),
+        b"Content-Length: %d" % len(body),
+    ]
+    if b"vary" not in names:
+        lines.append(b"Vary: Accept-Encoding")
+    return b"\r\n".join(lines) + b"\r\n\r\n" + body
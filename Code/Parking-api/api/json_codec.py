@@ -0,0 +1,93 @@
+"""JSON encoding and decoding for the data files and API responses.
+
+Uses orjson when it is installed, then ujson, and the standard library
+json module otherwise; JSON_CODEC=orjson|ujson|json picks one explicitly.
+Whichever is used, the output decodes to the same data: objects json
+can't encode, such as the datetimes stored with vehicles, are written as
+str(value), and invalid input raises json.JSONDecodeError.
+"""
+import json
+import os
+
+
+def _load_backend(preferred):
+    names = [preferred] if preferred else ["orjson", "ujson", "json"]
+    for name in names:
+        if name == "json":
+            return "json", json
+        try:
+            return name, __import__(name)
+        except ImportError:
+            if preferred:
+                raise
+    return "json", json
+
+
+BACKEND, _module = _load_backend(os.getenv("JSON_CODEC"))
+
+
+if BACKEND == "orjson":
+    # Keep datetimes as str() instead of orjson's ISO format, so files
+    # and responses look the same whichever codec wrote them
+    _OPTIONS = _module.OPT_NON_STR_KEYS | _module.OPT_PASSTHROUGH_DATETIME
+
+    def encode(obj):
+        """Return obj as UTF-8 encoded JSON."""
+        return _module.dumps(obj, default=str, option=_OPTIONS)
+
+    def dumps(obj):
+        """Return obj as a JSON string."""
+        return encode(obj).decode("utf-8")
+
+    def loads(data):
+        """Parse JSON from str or bytes."""
+        return _module.loads(data)
+
+elif BACKEND == "ujson":
+
+    def dumps(obj):
+        return _module.dumps(
+            obj, default=str, ensure_ascii=False, escape_forward_slashes=False
+        )
+
+    def encode(obj):
+        return dumps(obj).encode("utf-8")
+
+    def loads(data):
+        try:
+            return _module.loads(data)
+        except ValueError as error:
+            raise json.JSONDecodeError(str(error), str(data), 0) from None
+
+else:
+
+    def dumps(obj):
+        return json.dumps(obj, default=str)
+
+    def encode(obj):
+        return dumps(obj).encode("utf-8")
+
+    def loads(data):
+        return json.loads(data)
+
+
+def iter_array(items):
+    """Encode an iterable as a JSON array, one piece of bytes per item.
+
+    Only the current item is held in memory, so a long result can be
+    written out while it is still being produced.
+    """
+    separator = b"["
+    for item in items:
+        yield separator + encode(item)
+        separator = b","
+    yield b"[]" if separator == b"[" else b"]"
+
+
+def iter_object(pairs):
+    """Encode an iterable of (key, value) pairs as a JSON object."""
+    separator = b"{"
+    for key, value in pairs:
+        yield separator + encode(str(key)) + b":" + encode(value)
+        separator = b","
+    yield b"{}" if separator == b"{" else b"}"
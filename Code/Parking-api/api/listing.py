@@ -0,0 +1,90 @@
+"""Paging, filtering and field selection for the list endpoints.
+
+List endpoints take ?limit=N to return at most N items and ?cursor=<id>
+to continue after the last item of the previous page; the cursor for the
+next page is sent in the X-Next-Cursor header, which is left out on the
+last page. ?fields=a,b returns only those fields of every item. Without
+these parameters the full list is returned, as before.
+"""
+from datetime import datetime
+from itertools import islice
+from urllib.parse import urlparse, parse_qs
+
+
+MAX_LIMIT = 1000
+
+
+class QueryError(ValueError):
+    """A query parameter has an invalid value."""
+
+
+def query_params(path):
+    """Return the query string of path as name -> first value."""
+    return {
+        name: values[0]
+        for name, values in parse_qs(urlparse(path).query).items()
+    }
+
+
+def parse_limit(value):
+    if value is None:
+        return None
+    if not value.isdigit() or not 1 <= int(value) <= MAX_LIMIT:
+        raise QueryError(f"limit must be a number from 1 to {MAX_LIMIT}")
+    return int(value)
+
+
+def parse_cursor(value):
+    if value is None:
+        return None
+    if not value.isdigit():
+        raise QueryError("cursor must be an ID")
+    return int(value)
+
+
+def parse_date(value, end_of_day=False):
+    """Parse a YYYY-MM-DD parameter; None stays None."""
+    if value is None:
+        return None
+    try:
+        date = datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise QueryError("Dates must be YYYY-MM-DD") from None
+    if end_of_day:
+        date = date.replace(hour=23, minute=59, second=59)
+    return date
+
+
+def parse_fields(value):
+    if not value:
+        return None
+    return [field for field in value.split(",") if field]
+
+
+def parse_choice(name, value, choices):
+    if value is not None and value not in choices:
+        raise QueryError(f"{name} must be one of: {', '.join(choices)}")
+    return value
+
+
+def project(item, fields):
+    """Return item with only the given fields, or item itself if None."""
+    if fields is None:
+        return item
+    return {field: item[field] for field in fields if field in item}
+
+
+def paginate(items, limit):
+    """Take one page from an iterable of (id, item) sorted by id.
+
+    Returns the (id, item) pairs of the page and the cursor of the next
+    page, or None when there is nothing after it. Only one item more than
+    the page is consumed from items; without a limit items is returned
+    as it is, so it can be streamed.
+    """
+    if limit is None:
+        return items, None
+    page = list(islice(items, limit + 1))
+    if len(page) > limit:
+        return page[:limit], page[limit - 1][0]
+    return page, None
@@ -0,0 +1,287 @@
+"""Side index for logs/api.log, so admin log queries don't scan the log.
+
+IndexedRotatingFileHandler writes, next to every log file, an .idx file
+with one short line per record: where the record starts in the log, its
+length, the minute it was written and its level, method and path. The
+.idx files are rotated together with the logs (api.log.1.idx, ...).
+
+search() loads those into posting lists per level, method and path and
+a time-ordered list of minutes, picks the entries matching every filter
+by intersecting the lists, and only reads those records from the log.
+Every record read is checked against the filters again, so an entry
+that is off, for instance because several processes append to the same
+log, can only leave a record out, never add a wrong one. Log files
+without an .idx are searched by reading them backwards (log_reader).
+"""
+import json
+import os
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+
+import log_reader
+
+
+FIELDS = ("level", "method", "path")
+
+
+def index_filename(filename):
+    return filename + ".idx"
+
+
+def _clean(value):
+    # Tabs and newlines separate the fields of an index line
+    return "" if value is None else str(value).replace("\t", " ").replace("\n", " ")
+
+
+def _index_line(offset, length, minute, level, method, path):
+    fields = [str(offset), str(length), str(minute)] + [_clean(v) for v in (level, method, path)]
+    return "\t".join(fields) + "\n"
+
+
+def build_index(log_name):
+    """Write the .idx of a log file that was written without one."""
+    with open(log_name, "rb") as log, open(index_filename(log_name), "w", encoding="utf-8") as index:
+        offset = 0
+        for line in log:
+            try:
+                record = json.loads(line)
+                minute = _minute(datetime.fromisoformat(record["timestamp"]))
+                index.write(_index_line(
+                    offset, len(line), minute,
+                    record.get("level"), record.get("method"), record.get("path"),
+                ))
+            except (ValueError, KeyError, TypeError, AttributeError):
+                pass
+            offset += len(line)
+
+
+class IndexedRotatingFileHandler(RotatingFileHandler):
+    """RotatingFileHandler that also writes the side index of its log."""
+
+    def __init__(self, filename, *args, **kwargs):
+        super().__init__(filename, *args, **kwargs)
+        self.index_stream = None
+
+    def _open_index(self):
+        filename = index_filename(self.baseFilename)
+        if not os.path.exists(filename) and os.path.exists(self.baseFilename):
+            # Logged to before there was an index
+            build_index(self.baseFilename)
+        return open(filename, "a", encoding="utf-8", buffering=1)
+
+    def emit(self, record):
+        try:
+            if self.shouldRollover(record):
+                self.doRollover()
+            if self.stream is None:
+                self.stream = self._open()
+            if self.index_stream is None:
+                self.index_stream = self._open_index()
+            line = self.format(record) + self.terminator
+            self.stream.seek(0, os.SEEK_END)
+            offset = self.stream.tell()
+            self.stream.write(line)
+            self.flush()
+            self.index_stream.write(_index_line(
+                offset,
+                len(line.encode(self.encoding or "utf-8")),
+                int(record.created // 60),
+                record.levelname,
+                getattr(record, "method", None),
+                getattr(record, "path", None),
+            ))
+        except Exception:
+            self.handleError(record)
+
+    def _move_index(self, source, target):
+        if os.path.exists(index_filename(source)):
+            os.replace(index_filename(source), index_filename(target))
+        elif os.path.exists(index_filename(target)):
+            # Its log gets replaced by one without an index
+            os.remove(index_filename(target))
+
+    def doRollover(self):
+        if self.index_stream is not None:
+            self.index_stream.close()
+            self.index_stream = None
+        if self.backupCount > 0:
+            # The same moves RotatingFileHandler is about to make for the logs
+            base = self.baseFilename
+            for n in range(self.backupCount - 1, 0, -1):
+                if os.path.exists(f"{base}.{n}"):
+                    self._move_index(f"{base}.{n}", f"{base}.{n + 1}")
+            if os.path.exists(base):
+                self._move_index(base, f"{base}.1")
+        super().doRollover()
+
+    def close(self):
+        self.acquire()
+        try:
+            if self.index_stream is not None:
+                self.index_stream.close()
+                self.index_stream = None
+        finally:
+            self.release()
+        super().close()
+
+
+class _FileIndex:
+    """Posting lists of one log file, read from its .idx file.
+
+    Entries are numbered in the order they were logged. The .idx of the
+    live log keeps growing; refresh() only reads what was added.
+    """
+
+    def __init__(self, inode):
+        self.inode = inode
+        self.position = 0
+        self.rest = b""
+        self.offsets = array("Q")
+        self.lengths = array("L")
+        self.minutes = array("L")
+        self.postings = {}
+
+    def refresh(self, filename, size):
+        with open(filename, "rb") as file:
+            file.seek(self.position)
+            data = file.read(size - self.position)
+        self.position += len(data)
+        lines = (self.rest + data).split(b"\n")
+        self.rest = lines.pop()
+        for line in lines:
+            parts = line.decode("utf-8", "replace").split("\t")
+            if len(parts) != 3 + len(FIELDS):
+                continue
+            try:
+                offset, length, minute = int(parts[0]), int(parts[1]), int(parts[2])
+            except ValueError:
+                continue
+            entry = len(self.offsets)
+            self.offsets.append(offset)
+            self.lengths.append(length)
+            self.minutes.append(minute)
+            for field, value in zip(FIELDS, parts[3:]):
+                self.postings.setdefault((field, value), array("L")).append(entry)
+
+
+_indexes = {}
+_indexes_guard = threading.Lock()
+
+
+def _load_index(log_name):
+    """Return the up to date _FileIndex of a log file, or None without one."""
+    filename = index_filename(log_name)
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    with _indexes_guard:
+        index = _indexes.get(filename)
+        if index is None or index.inode != stat.st_ino or stat.st_size < index.position:
+            # New file, or another one rotated into this name
+            index = _indexes[filename] = _FileIndex(stat.st_ino)
+        if stat.st_size > index.position:
+            index.refresh(filename, stat.st_size)
+        return index
+
+
+def _minute(moment):
+    return int(moment.replace(tzinfo=timezone.utc).timestamp() // 60)
+
+
+def _candidates(index, filters, start, end):
+    """Yield the entry numbers that can match, newest first."""
+    count = len(index.offsets)
+    lo, hi = 0, count
+    # Minutes only go up in a single process; one minute either side
+    # covers records logged just out of order by another thread
+    if start is not None:
+        lo = bisect_left(index.minutes, _minute(start) - 1, 0, count)
+    if end is not None:
+        hi = bisect_right(index.minutes, _minute(end) + 1, lo, count)
+    lists = []
+    for field, value in filters.items():
+        entries = index.postings.get((field, _clean(value)))
+        if entries is None:
+            return
+        lists.append(entries)
+    if not lists:
+        yield from range(hi - 1, lo - 1, -1)
+        return
+    lists.sort(key=len)
+    shortest, others = lists[0], lists[1:]
+    first = bisect_left(shortest, lo)
+    last = bisect_left(shortest, hi, first)
+    for position in range(last - 1, first - 1, -1):
+        entry = shortest[position]
+        if all(_contains(entries, entry) for entries in others):
+            yield entry
+
+
+def _contains(entries, entry):
+    position = bisect_left(entries, entry)
+    return position < len(entries) and entries[position] == entry
+
+
+def _matches(log, filters, text, start, end):
+    if not isinstance(log, dict):
+        return False
+    for field, value in filters.items():
+        if log.get(field) != value:
+            return False
+    if text and text not in (log.get("message") or ""):
+        return False
+    if start is not None or end is not None:
+        try:
+            moment = datetime.fromisoformat(log.get("timestamp") or "")
+        except ValueError:
+            return False
+        if (start is not None and moment < start) or (end is not None and moment > end):
+            return False
+    return True
+
+
+def _indexed_records(log_name, index, filters, start, end):
+    with open(log_name, "rb") as file:
+        for entry in _candidates(index, filters, start, end):
+            file.seek(index.offsets[entry])
+            try:
+                yield json.loads(file.read(index.lengths[entry]))
+            except ValueError:
+                continue
+
+
+def search(filename, backups=0, level=None, path=None, method=None, text=None,
+           start=None, end=None, limit=100):
+    """Return the latest limit records of a log and its backups that match.
+
+    start and end are naive UTC datetimes, like the log timestamps.
+    """
+    filters = {
+        field: value
+        for field, value in (("level", level), ("method", method), ("path", path))
+        if value
+    }
+    results = []
+    if limit <= 0:
+        return results
+    for log_name in log_reader.log_files(filename, backups):
+        index = _load_index(log_name)
+        if index is None:
+            records = log_reader.reverse_records(log_name)
+        else:
+            records = _indexed_records(log_name, index, filters, start, end)
+        try:
+            for log in records:
+                if _matches(log, filters, text, start, end):
+                    results.append(log)
+                    if len(results) >= limit:
+                        return results
+        except FileNotFoundError:
+            continue  # rotated away in the meantime
+        finally:
+            records.close()
+    return results
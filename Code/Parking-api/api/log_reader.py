@@ -0,0 +1,63 @@
+"""Read the JSON lines of logs/api.log from newest to oldest.
+
+The files are read backwards in blocks from the end, so finding the
+latest matches costs about as much as the lines that are looked at, not
+the size of the log. When a file runs out the rotated backups
+(api.log.1, api.log.2, ...) are read next, newest first.
+"""
+import json
+import os
+
+
+BLOCK_SIZE = 64 * 1024
+
+
+def reverse_lines(file, block_size=BLOCK_SIZE):
+    """Yield the lines of a binary file from last to first, without the
+    line endings. Empty lines are skipped."""
+    file.seek(0, os.SEEK_END)
+    position = file.tell()
+    rest = b""
+    while position > 0:
+        size = min(block_size, position)
+        position -= size
+        file.seek(position)
+        lines = (file.read(size) + rest).split(b"\n")
+        # The first line may continue in the block before this one
+        rest = lines.pop(0)
+        for line in reversed(lines):
+            if line:
+                yield line
+    if rest:
+        yield rest
+
+
+def log_files(filename, backups):
+    """Return filename and its rotated backups that exist, newest first."""
+    names = [filename] + [f"{filename}.{n}" for n in range(1, backups + 1)]
+    return [name for name in names if os.path.exists(name)]
+
+
+def reverse_records(filename, backups=0, block_size=BLOCK_SIZE):
+    """Yield the JSON records of a log and its backups, newest first.
+
+    All files are opened before reading, so they keep their contents if
+    the log rotates while the records are being read. Lines that aren't
+    valid JSON, such as one still being written, are skipped.
+    """
+    files = []
+    try:
+        for name in log_files(filename, backups):
+            try:
+                files.append(open(name, "rb"))
+            except FileNotFoundError:
+                continue  # rotated away in the meantime
+        for file in files:
+            for line in reverse_lines(file, block_size):
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+    finally:
+        for file in files:
+            file.close()
@@ -0,0 +1,95 @@
+"""Route table for RequestHandler.
+
+Routes are registered per HTTP method with a path pattern such as
+"/parking-lots/{lid:id}/sessions/{sid:id}". Paths without parameters are
+looked up in a dict; all patterns of a method are compiled into a single
+regular expression, so resolving a request is one dict lookup or one
+regex match, whatever the number of routes.
+
+Parameter types:
+    id   digits, passed on as a string (the data files key on strings)
+    int  digits, converted to int
+    str  anything up to the next "/" (the default)
+"""
+import re
+
+
+CONVERTERS = {
+    "id": (r"\d+", str),
+    "int": (r"\d+", int),
+    "str": (r"[^/]+", str),
+}
+
+_PARAM = re.compile(r"{(\w+)(?::(\w+))?}")
+
+
+class Router:
+    def __init__(self):
+        self._static = {}
+        self._dynamic = {}
+        self._compiled = {}
+
+    def add(self, method, pattern, handler):
+        """Register handler(request_handler, **params) for method and pattern."""
+        method = method.upper()
+        if not _PARAM.search(pattern):
+            self._static[(method, pattern)] = handler
+            return handler
+
+        params = []
+        regex = ""
+        position = 0
+        for match in _PARAM.finditer(pattern):
+            name, kind = match.group(1), match.group(2) or "str"
+            if kind not in CONVERTERS:
+                raise ValueError(f"Unknown parameter type {kind!r} in {pattern!r}")
+            params.append((name, CONVERTERS[kind][1]))
+            regex += re.escape(pattern[position:match.start()])
+            regex += f"(?P<{{route}}_{name}>{CONVERTERS[kind][0]})"
+            position = match.end()
+        regex += re.escape(pattern[position:])
+
+        self._dynamic.setdefault(method, []).append((regex, handler, params))
+        self._compiled.pop(method, None)
+        return handler
+
+    def route(self, method, pattern):
+        """Decorator form of add()."""
+
+        def register(handler):
+            return self.add(method, pattern, handler)
+
+        return register
+
+    def _compile(self, method):
+        routes = self._dynamic.get(method, [])
+        alternatives = [
+            f"(?P<r{index}>{regex.replace('{route}', f'r{index}')})"
+            for index, (regex, _, _) in enumerate(routes)
+        ]
+        compiled = re.compile("|".join(alternatives)) if alternatives else None
+        self._compiled[method] = compiled
+        return compiled
+
+    def match(self, method, path):
+        """Return (handler, params) for a request, or (None, None).
+
+        The query string, if any, is ignored.
+        """
+        method = method.upper()
+        path = path.split("?", 1)[0]
+        handler = self._static.get((method, path))
+        if handler is not None:
+            return handler, {}
+
+        compiled = self._compiled.get(method) or self._compile(method)
+        if compiled is None:
+            return None, None
+        found = compiled.fullmatch(path)
+        if found is None:
+            return None, None
+        route = found.lastgroup
+        _, handler, params = self._dynamic[method][int(route[1:])]
+        return handler, {
+            name: convert(found.group(f"{route}_{name}")) for name, convert in params
+        }
@@ -1,26 +1,67 @@
 import json
 import hashlib
-import uuid
-from datetime import datetime
+import io
+import zlib
+from datetime import datetime, timezone
 from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit
 from storage_utils import (
-    load_json,
-    save_data,
-    save_user_data,
+    get_user,
+    add_user,
+    update_user,
     load_parking_lot_data,
     save_parking_lot_data,
-    save_reservation_data,
+    get_parking_lot,
+    parking_lot_version,
+    save_parking_lot,
+    delete_parking_lot,
     load_reservation_data,
+    get_reservation,
+    save_reservation,
+    delete_reservation,
+    load_user_vehicles,
+    save_vehicle,
+    delete_vehicle,
+    load_parking_sessions,
+    iter_parking_sessions,
+    get_parking_session,
+    save_parking_session,
+    delete_parking_session,
+    find_open_session,
+    next_id,
     load_payment_data,
-    save_payment_data,
+    load_user_payments,
+    find_payment,
+    append_payment,
+    update_payment,
+    locked,
+    set_write_behind,
+)
+from session_manager import (
+    add_session,
+    create_session,
+    remove_session,
+    get_session,
+    use_store,
+    is_shared,
+    TOKEN_MODE,
 )
-from session_manager import add_session, remove_session, get_session
 import session_calculator as sc
+import signed_tokens
+import json_codec
+import listing
+import compression
+import log_index
+from router import Router
 import logging
 import os
-from logging.handlers import RotatingFileHandler
 import threading
 import time
+import selectors
+import signal
+import socket
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
 from session_manager import add_session
 
 
@@ -44,7 +85,7 @@ class JsonFormatter(logging.Formatter):
         return json.dumps(log_record)
 
 
-handler = RotatingFileHandler("logs/api.log", maxBytes=2_000_000, backupCount=5)
+handler = log_index.IndexedRotatingFileHandler("logs/api.log", maxBytes=2_000_000, backupCount=5)
 handler.setFormatter(JsonFormatter())
 
 logger = logging.getLogger("api")
@@ -52,6 +93,27 @@ logger.setLevel(logging.INFO)
 logger.addHandler(handler)
 
 
+def make_etag(version, *parts):
+    """Build a strong ETag from a storage data_version and what else
+    the response depends on."""
+    if parts:
+        key = "\0".join(str(part) for part in parts).encode("utf-8")
+        version = f"{version}-{zlib.crc32(key):08x}"
+    return f'"{version}"'
+
+
+def parse_log_time(value, end_of_day=False):
+    """Parse YYYY-MM-DD or an ISO time for the /logs range; None stays None."""
+    if value is None:
+        return None
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    if end_of_day and len(value) == 10:
+        moment = moment.replace(hour=23, minute=59, second=59, microsecond=999999)
+    return moment
+
+
 def log_request(handler, message, level=logging.INFO):
     logger.log(
         level,
@@ -64,304 +126,535 @@ def log_request(handler, message, level=logging.INFO):
     )
 
 
+routes = Router()
+
+# Streamed responses are written in pieces of about this many bytes
+STREAM_CHUNK_SIZE = 16 * 1024
+
+# A kept-alive connection is closed after this many idle seconds, and after
+# KEEPALIVE_MAX requests
+KEEPALIVE_TIMEOUT = float(os.getenv("API_KEEPALIVE_TIMEOUT", 5))
+KEEPALIVE_MAX = int(os.getenv("API_KEEPALIVE_MAX", 100))
+
+
 class RequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps connections open between requests. Every response
+    # needs a length for that: _dispatch collects what a route writes and
+    # adds a Content-Length, streamed responses are sent chunked.
+    protocol_version = "HTTP/1.1"
+    timeout = KEEPALIVE_TIMEOUT
+    requests_handled = 0
+    # gzip or deflate when the client accepts it, see compression.py
+    content_encoding = None
+    # Set while the connection waits for its next request without a worker
+    # thread, see ThreadPoolHTTPServer
+    idle = False
+
+    def handle(self):
+        self.close_connection = True
+        self.handle_one_request()
+        self._handle_kept_alive()
+
+    def resume(self):
+        """Serve the next request on a connection that was idle."""
+        self.idle = False
+        try:
+            self.handle_one_request()
+            self._handle_kept_alive()
+        finally:
+            self.finish()
+
+    def finish(self):
+        if not self.idle:
+            super().finish()
+
+    def _handle_kept_alive(self):
+        parks = getattr(self.server, "parks_idle_connections", False)
+        while not self.close_connection:
+            if parks and not self._request_buffered():
+                # Leave the wait for the next request to the server
+                self.idle = True
+                return
+            self.handle_one_request()
+
+    def _request_buffered(self):
+        """True when the next request has been read from the socket already,
+        as happens with pipelined requests."""
+        self.connection.settimeout(0)
+        try:
+            return bool(self.rfile.peek(1))
+        except OSError:
+            return True  # for handle_one_request to run into
+        finally:
+            self.connection.settimeout(self.timeout)
+
+    def get_session(self, token):
+        """get_session() for this request, so a route that checks the token
+        and then reads the user verifies it only once."""
+        if token not in self._sessions:
+            self._sessions[token] = get_session(token)
+        return self._sessions[token]
+
+    def _dispatch(self):
+        self.requests_handled += 1
+        self._sessions = {}
+        if "chunked" in self.headers.get("Transfer-Encoding", "").lower():
+            self.send_error(411)
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            self.send_error(400, "Bad Content-Length")
+            return
+        # Read the whole body up front, routes that answer without reading
+        # it would otherwise leave it to be parsed as the next request
+        body = self.rfile.read(length) if length > 0 else b""
+
+        handler, params = routes.match(self.command, self.path)
+        self.content_encoding = compression.choose_encoding(
+            self.headers.get("Accept-Encoding")
+        )
+        # stream_body switches back to the connection itself
+        self._connection_rfile, self.rfile = self.rfile, io.BytesIO(body)
+        self._connection_wfile, self.wfile = self.wfile, io.BytesIO()
+        try:
+            if handler is None:
+                self.send_response(404)
+                self.send_header("Content-type", "text/plain")
+                self.end_headers()
+                self.wfile.write(b"Not found")
+            else:
+                handler(self, **params)
+        finally:
+            self.rfile = self._connection_rfile
+            buffered, self.wfile = self.wfile, self._connection_wfile
+        if buffered is not self.wfile:
+            response = buffered.getvalue()
+            if self.content_encoding is not None:
+                response = compression.encode_response(response, self.content_encoding)
+            self.wfile.write(self._frame_response(response))
+
+    def _keep_alive_header(self):
+        """Return the Connection header value for this response, if any."""
+        if self.requests_handled >= KEEPALIVE_MAX:
+            self.close_connection = True
+        if self.close_connection:
+            return "close"
+        if self.request_version != "HTTP/1.1":
+            # HTTP/1.0 clients that asked for keep-alive need to hear it back
+            return "keep-alive"
+        return None
+
+    def _frame_response(self, raw):
+        """Add Content-Length and Connection headers to a collected response."""
+        head, separator, body = raw.partition(b"\r\n\r\n")
+        if not separator:
+            # Nothing sensible was written, the client can only tell by
+            # the connection closing
+            self.close_connection = True
+            return raw
+        lines = head.split(b"\r\n")
+        names = {line.split(b":", 1)[0].strip().lower() for line in lines[1:]}
+        status = lines[0].split(b" ", 2)[1:2]
+        if b"content-length" not in names and status != [b"304"]:
+            lines.append(b"Content-Length: %d" % len(body))
+        if b"connection" in names:
+            if b"connection: close" in head.lower():
+                self.close_connection = True
+        else:
+            connection = self._keep_alive_header()
+            if connection is not None:
+                lines.append(b"Connection: " + connection.encode("ascii"))
+        return b"\r\n".join(lines) + b"\r\n\r\n" + body
+
+    def not_modified(self, etag):
+        """Answer 304 Not Modified if the client already has this version.
+
+        Returns True when the response has been sent. Otherwise the caller
+        sends the full response, including an ETag header with etag.
+        """
+        tags = [
+            tag.strip().removeprefix("W/")
+            for tag in self.headers.get("If-None-Match", "").split(",")
+        ]
+        if etag not in tags and "*" not in tags:
+            return False
+        self.send_response(304)
+        self.send_etag(etag)
+        self.end_headers()
+        return True
+
+    def send_etag(self, etag):
+        """Send the ETag and Vary headers of a response that may be compressed.
+
+        With a negotiated content_encoding the tag is weak whatever the size
+        of the body, so a 304 carries the same validator as the 200 it
+        stands for.
+        """
+        self.send_header("Vary", "Accept-Encoding")
+        if self.content_encoding is not None:
+            etag = "W/" + etag
+        self.send_header("ETag", etag)
+
+    def stream_body(self, pieces):
+        """End the headers and write the body while it is being produced.
+
+        pieces is an iterable of bytes, such as json_codec.iter_array().
+        HTTP/1.1 clients get it with Transfer-Encoding: chunked; for
+        HTTP/1.0 the end of the body is marked by closing the connection.
+        With a content_encoding every write is compressed and flushed, so
+        the client can decode what it has received so far. A body that
+        ends within the first STREAM_CHUNK_SIZE bytes is sent like any
+        other response instead, with a Content-Length and only compressed
+        from compression.MIN_SIZE on.
+        """
+        pieces = iter(pieces)
+        buffer = bytearray()
+        for piece in pieces:
+            buffer += piece
+            if len(buffer) >= STREAM_CHUNK_SIZE:
+                break
+        else:
+            # Left for _dispatch to frame and encode
+            self.end_headers()
+            self.wfile.write(buffer)
+            return
+
+        self.wfile = self._connection_wfile
+        chunked = self.request_version == "HTTP/1.1"
+        if chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+        else:
+            self.close_connection = True
+        connection = self._keep_alive_header()
+        if connection is not None:
+            self.send_header("Connection", connection)
+        compress_obj = None
+        if self.content_encoding is not None:
+            compress_obj = compression.compressor(self.content_encoding)
+            self.send_header("Content-Encoding", self.content_encoding)
+            if not any(line.lower().startswith(b"vary:") for line in self._headers_buffer):
+                self.send_header("Vary", "Accept-Encoding")
+            self._headers_buffer = [
+                compression.weaken_etag(line) for line in self._headers_buffer
+            ]
+        self.end_headers()
+
+        def send(data):
+            if not data:
+                return  # an empty chunk would end the response
+            if chunked:
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            else:
+                self.wfile.write(data)
+
+        def write(data):
+            if compress_obj is not None:
+                data = compress_obj.compress(data) + compress_obj.flush(zlib.Z_SYNC_FLUSH)
+            send(data)
+
+        write(buffer)
+        buffer.clear()
+        for piece in pieces:
+            buffer += piece
+            if len(buffer) >= STREAM_CHUNK_SIZE:
+                write(buffer)
+                buffer.clear()
+        if buffer:
+            write(buffer)
+        if compress_obj is not None:
+            send(compress_obj.flush())
+        if chunked:
+            self.wfile.write(b"0\r\n\r\n")
+
     def do_POST(self):
+        self._dispatch()
 
-        if self.path == "/register":
-            log_request(self, "Register endpoint called")
+    def do_PUT(self):
+        self._dispatch()
 
-            # Read body safely
-            length = int(self.headers.get("Content-Length", 0))
-            try:
-                raw_body = self.rfile.read(length) if length > 0 else b"{}"
-                data = json.loads(raw_body)
-            except json.JSONDecodeError:
-                self.send_response(400)
-                self.send_header("Content-type", "application/json")
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": "Invalid JSON"}).encode("utf-8"))
-                return
+    def do_DELETE(self):
+        self._dispatch()
 
-            username = data.get("username")
-            password = data.get("password")
-            name = data.get("name")
+    def do_GET(self):
+        self._dispatch()
 
-            if not username or not password or not name:
-                self.send_response(400)
+    @routes.route("POST", "/register")
+    def register(self):
+        log_request(self, "Register endpoint called")
+
+        # Read body safely
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            raw_body = self.rfile.read(length) if length > 0 else b"{}"
+            data = json_codec.loads(raw_body)
+        except json.JSONDecodeError:
+            self.send_response(400)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(json_codec.encode({"error": "Invalid JSON"}))
+            return
+
+        username = data.get("username")
+        password = data.get("password")
+        name = data.get("name")
+
+        if not username or not password or not name:
+            self.send_response(400)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(json_codec.encode({"error": "Missing field(s)"}))
+            return
+
+        with locked("data/users.json"):
+            if get_user(username) is not None:
+                self.send_response(200)
                 self.send_header("Content-type", "application/json")
                 self.end_headers()
                 self.wfile.write(
-                    json.dumps({"error": "Missing field(s)"}).encode("utf-8")
+                    json_codec.encode(
+                        {"status": "error", "message": "Username already taken"}
+                    )
                 )
                 return
 
-            # Load users safely
-            users = load_json("data/users.json") or []
-            if not isinstance(users, list):
-                users = []
-
-            for user in users:
-                if username == user.get("username"):
-                    self.send_response(200)
-                    self.send_header("Content-type", "application/json")
-                    self.end_headers()
-                    self.wfile.write(
-                        json.dumps(
-                            {"status": "error", "message": "Username already taken"}
-                        ).encode("utf-8")
-                    )
-                    return
-
-            # Append new user
+            # Add new user
             hashed_password = hashlib.md5(password.encode()).hexdigest()
-            users.append(
-                {"username": username, "password": hashed_password, "name": name}
-            )
-            save_user_data(users)
+            add_user({"username": username, "password": hashed_password, "name": name})
 
             self.send_response(201)
             self.send_header("Content-type", "application/json")
             self.end_headers()
             self.wfile.write(
-                json.dumps({"status": "success", "message": "User created"}).encode(
-                    "utf-8"
-                )
+                json_codec.encode({"status": "success", "message": "User created"})
             )
 
-        elif self.path == "/login":
-            log_request(self, "Login endpoint called")
+    @routes.route("POST", "/login")
+    def login(self):
+        log_request(self, "Login endpoint called")
 
-            length = int(self.headers.get("Content-Length", 0))
-            try:
-                raw_body = self.rfile.read(length) if length > 0 else b"{}"
-                data = json.loads(raw_body)
-            except json.JSONDecodeError:
-                self.send_response(400)
-                self.send_header("Content-type", "application/json")
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": "Invalid JSON"}).encode("utf-8"))
-                return
-
-            username = data.get("username")
-            password = data.get("password")
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            raw_body = self.rfile.read(length) if length > 0 else b"{}"
+            data = json_codec.loads(raw_body)
+        except json.JSONDecodeError:
+            self.send_response(400)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(json_codec.encode({"error": "Invalid JSON"}))
+            return
 
-            if not username or not password:
-                self.send_response(400)
-                self.send_header("Content-type", "application/json")
-                self.end_headers()
-                self.wfile.write(
-                    json.dumps({"error": "Missing credentials"}).encode("utf-8")
-                )
-                return
+        username = data.get("username")
+        password = data.get("password")
 
-            # Load users safely
-            users = load_json("data/users.json") or []
-            if not isinstance(users, list):
-                users = []
+        if not username or not password:
+            self.send_response(400)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(json_codec.encode({"error": "Missing credentials"}))
+            return
 
-            hashed_password = hashlib.md5(password.encode()).hexdigest()
-            for user in users:
-                if (
-                    user.get("username") == username
-                    and user.get("password") == hashed_password
-                ):
-                    token = str(uuid.uuid4())
-                    add_session(token, user)
-
-                    self.send_response(200)
-                    self.send_header("Content-type", "application/json")
-                    self.end_headers()
-                    self.wfile.write(
-                        json.dumps(
-                            {"message": "User logged in", "session_token": token}
-                        ).encode("utf-8")
-                    )
-                    return
+        hashed_password = hashlib.md5(password.encode()).hexdigest()
+        user = get_user(username)
+        if user is not None and user.get("password") == hashed_password:
+            token = create_session(user)
 
-            # No matching user found
-            self.send_response(401)
+            self.send_response(200)
             self.send_header("Content-type", "application/json")
             self.end_headers()
             self.wfile.write(
-                json.dumps({"error": "Invalid username or password"}).encode("utf-8")
+                json_codec.encode({"message": "User logged in", "session_token": token})
             )
+            return
+
+        # No matching user found
+        self.send_response(401)
+        self.send_header("Content-type", "application/json")
+        self.end_headers()
+        self.wfile.write(json_codec.encode({"error": "Invalid username or password"}))
+        log_request(self, "Unauthorized access attempt", logging.WARNING)
+
+    @routes.route("POST", "/parking-lots")
+    @routes.route("POST", "/parking-lots/")
+    def create_parking_lot(self):
+        log_request(self, "parking lots endpoint called")
+
+        token = self.headers.get("Authorization")
+        if not token or not self.get_session(token):
+            self.send_response(401)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"Unauthorized: Invalid or missing session token")
+            log_request(self, "Unauthorized access attempt", logging.WARNING)
+
+            return
+        session_user = self.get_session(token)
+        if not "ADMIN" == session_user.get("role"):
+            self.send_response(403)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"Access denied")
+            return
+        data = json_codec.loads(self.rfile.read(int(self.headers.get("Content-Length", -1))))
+        with locked("data/parking-lots.json"):
+            parking_lots = load_parking_lot_data()
+            # Make sure parking_lots is a dictionary, not a list
+            if isinstance(parking_lots, list):
+                # Convert list to dict if needed
+                parking_lots_dict = {}
+                for i, lot in enumerate(parking_lots, 1):
+                    parking_lots_dict[str(i)] = lot
+                parking_lots = parking_lots_dict
+                save_parking_lot_data(parking_lots)
+
+            new_lid = next_id("parking-lots", load_parking_lot_data)
+            save_parking_lot(new_lid, data)
+            self.send_response(201)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(f"Parking lot saved under ID: {new_lid}".encode("utf-8"))
+
+    @routes.route("POST", "/parking-lots/{lid:id}/sessions/start")
+    def start_session(self, lid):
+        log_request(self, "parking lots endpoint called")
+
+        token = self.headers.get("Authorization")
+        if not token or not self.get_session(token):
+            self.send_response(401)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"Unauthorized: Invalid or missing session token")
             log_request(self, "Unauthorized access attempt", logging.WARNING)
 
-        elif self.path.startswith("/parking-lots"):
-            log_request(self, "parking lots endpoint called")
+            return
+        session_user = self.get_session(token)
+        log_request(self, "Sessions endpoint called")
+        data = json_codec.loads(self.rfile.read(int(self.headers.get("Content-Length", -1))))
+        with locked(f"data/pdata/p{lid}-sessions.json"):
+            log_request(self, "start endpoint called")
 
-            token = self.headers.get("Authorization")
-            if not token or not get_session(token):
+            if "licenseplate" not in data:
                 self.send_response(401)
                 self.send_header("Content-type", "application/json")
                 self.end_headers()
-                self.wfile.write(b"Unauthorized: Invalid or missing session token")
-                log_request(self, "Unauthorized access attempt", logging.WARNING)
-
+                self.wfile.write(
+                    json_codec.encode(
+                        {
+                            "error": "Require field missing",
+                            "field": "licenseplate",
+                        }
+                    )
+                )
                 return
-            session_user = get_session(token)
-            if "sessions" in self.path:
-                log_request(self, "Sessions endpoint called")
-
-                lid = self.path.split("/")[2]
-                data = json.loads(
-                    self.rfile.read(int(self.headers.get("Content-Length", -1)))
+            sid, session = find_open_session(lid, data["licenseplate"])
+            if sid is not None:
+                self.send_response(401)
+                self.send_header("Content-type", "application/json")
+                self.end_headers()
+                self.wfile.write(
+                    b"Cannot start a session when another sessions for this licesenplate is already started."
                 )
-                sessions = load_json(f"data/pdata/p{lid}-sessions.json")
-                if self.path.endswith("start"):
-                    log_request(self, "start endpoint called")
+                return
+            session = {
+                "licenseplate": data["licenseplate"],
+                "started": datetime.now().strftime("%d-%m-%Y %H:%M:%S"),
+                "stopped": None,
+                "user": session_user["username"],
+            }
+            sid = next_id(f"sessions-{lid}", lambda: load_parking_sessions(lid))
+            save_parking_session(lid, sid, session)
+            self.send_response(200)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(
+                f"Session started for: {data['licenseplate']}".encode("utf-8")
+            )
 
-                    if "licenseplate" not in data:
-                        self.send_response(401)
-                        self.send_header("Content-type", "application/json")
-                        self.end_headers()
-                        self.wfile.write(
-                            json.dumps(
-                                {
-                                    "error": "Require field missing",
-                                    "field": "licenseplate",
-                                }
-                            ).encode("utf-8")
-                        )
-                        return
-                    filtered = {
-                        key: value
-                        for key, value in sessions.items()
-                        if value.get("licenseplate") == data["licenseplate"]
-                        and not value.get("stopped")
-                    }
-                    if len(filtered) > 0:
-                        self.send_response(401)
-                        self.send_header("Content-type", "application/json")
-                        self.end_headers()
-                        self.wfile.write(
-                            b"Cannot start a session when another sessions for this licesenplate is already started."
-                        )
-                        return
-                    session = {
-                        "licenseplate": data["licenseplate"],
-                        "started": datetime.now().strftime("%d-%m-%Y %H:%M:%S"),
-                        "stopped": None,
-                        "user": session_user["username"],
-                    }
-                    sessions[str(len(sessions) + 1)] = session
-                    save_data(f"data/pdata/p{lid}-sessions.json", sessions)
-                    self.send_response(200)
-                    self.send_header("Content-type", "application/json")
-                    self.end_headers()
-                    self.wfile.write(
-                        f"Session started for: {data['licenseplate']}".encode("utf-8")
-                    )
+    @routes.route("POST", "/parking-lots/{lid:id}/sessions/stop")
+    def stop_session(self, lid):
+        log_request(self, "parking lots endpoint called")
 
-                elif self.path.endswith("stop"):
-                    log_request(self, "stop endpoint called")
+        token = self.headers.get("Authorization")
+        if not token or not self.get_session(token):
+            self.send_response(401)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"Unauthorized: Invalid or missing session token")
+            log_request(self, "Unauthorized access attempt", logging.WARNING)
 
-                    if "licenseplate" not in data:
-                        self.send_response(401)
-                        self.send_header("Content-type", "application/json")
-                        self.end_headers()
-                        self.wfile.write(
-                            json.dumps(
-                                {
-                                    "error": "Require field missing",
-                                    "field": "licenseplate",
-                                }
-                            ).encode("utf-8")
-                        )
-                        return
-                    filtered = {
-                        key: value
-                        for key, value in sessions.items()
-                        if value.get("licenseplate") == data["licenseplate"]
-                        and not value.get("stopped")
-                    }
-                    if len(filtered) < 0:
-                        self.send_response(401)
-                        self.send_header("Content-type", "application/json")
-                        self.end_headers()
-                        self.wfile.write(
-                            b"Cannot stop a session when there is no session for this licesenplate."
-                        )
-                        return
-                    sid = next(iter(filtered))
-                    sessions[sid]["stopped"] = datetime.now().strftime(
-                        "%d-%m-%Y %H:%M:%S"
-                    )
-                    save_data(f"data/pdata/p{lid}-sessions.json", sessions)
-                    self.send_response(200)
-                    self.send_header("Content-type", "application/json")
-                    self.end_headers()
-                    self.wfile.write(
-                        f"Session stopped for: {data['licenseplate']}".encode("utf-8")
-                    )
+            return
+        log_request(self, "Sessions endpoint called")
+        data = json_codec.loads(self.rfile.read(int(self.headers.get("Content-Length", -1))))
+        with locked(f"data/pdata/p{lid}-sessions.json"):
+            log_request(self, "stop endpoint called")
 
-            else:
-                if not "ADMIN" == session_user.get("role"):
-                    self.send_response(403)
-                    self.send_header("Content-type", "application/json")
-                    self.end_headers()
-                    self.wfile.write(b"Access denied")
-                    return
-                data = json.loads(
-                    self.rfile.read(int(self.headers.get("Content-Length", -1)))
-                )
-                parking_lots = load_parking_lot_data()
-                new_lid = str(len(parking_lots) + 1)
-                # Make sure parking_lots is a dictionary, not a list
-                if isinstance(parking_lots, list):
-                    # Convert list to dict if needed
-                    parking_lots_dict = {}
-                    for i, lot in enumerate(parking_lots, 1):
-                        parking_lots_dict[str(i)] = lot
-                    parking_lots = parking_lots_dict
-                    save_parking_lot_data(parking_lots)
-
-                parking_lots[new_lid] = data
-                save_parking_lot_data(parking_lots)
-                self.send_response(201)
+            if "licenseplate" not in data:
+                self.send_response(401)
                 self.send_header("Content-type", "application/json")
                 self.end_headers()
                 self.wfile.write(
-                    f"Parking lot saved under ID: {new_lid}".encode("utf-8")
+                    json_codec.encode(
+                        {
+                            "error": "Require field missing",
+                            "field": "licenseplate",
+                        }
+                    )
                 )
-
-        elif self.path == "/reservations":
-            log_request(self, "Reservations endpoint called")
-
-            token = self.headers.get("Authorization")
-            if not token or not get_session(token):
+                return
+            sid, session = find_open_session(lid, data["licenseplate"])
+            if sid is None:
                 self.send_response(401)
                 self.send_header("Content-type", "application/json")
                 self.end_headers()
-                self.wfile.write(b"Unauthorized: Invalid or missing session token")
-                log_request(self, "Unauthorized access attempt", logging.WARNING)
+                self.wfile.write(
+                    b"Cannot stop a session when there is no session for this licesenplate."
+                )
                 return
-            session_user = get_session(token)
-            data = json.loads(
-                self.rfile.read(int(self.headers.get("Content-Length", -1)))
+            session = dict(session)
+            session["stopped"] = datetime.now().strftime("%d-%m-%Y %H:%M:%S")
+            save_parking_session(lid, sid, session)
+            self.send_response(200)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(
+                f"Session stopped for: {data['licenseplate']}".encode("utf-8")
             )
-            reservations = load_reservation_data()
-            parking_lots = load_parking_lot_data()
-            rid = str(len(reservations) + 1)
+
+    @routes.route("POST", "/reservations")
+    def create_reservation(self):
+        log_request(self, "Reservations endpoint called")
+
+        token = self.headers.get("Authorization")
+        if not token or not self.get_session(token):
+            self.send_response(401)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"Unauthorized: Invalid or missing session token")
+            log_request(self, "Unauthorized access attempt", logging.WARNING)
+            return
+        session_user = self.get_session(token)
+        data = json_codec.loads(self.rfile.read(int(self.headers.get("Content-Length", -1))))
+        with locked("data/reservations.json", "data/parking-lots.json"):
             for field in ["licenseplate", "startdate", "enddate", "parkinglot"]:
                 if not field in data:
                     self.send_response(401)
                     self.send_header("Content-type", "application/json")
                     self.end_headers()
                     self.wfile.write(
-                        json.dumps(
+                        json_codec.encode(
                             {"error": "Require field missing", "field": field}
-                        ).encode("utf-8")
+                        )
                     )
                     return
-            if data.get("parkinglot", -1) not in parking_lots:
+            parking_lot = get_parking_lot(data["parkinglot"])
+            if parking_lot is None:
                 self.send_response(404)
                 self.send_header("Content-type", "application/json")
                 self.end_headers()
                 self.wfile.write(
-                    json.dumps(
+                    json_codec.encode(
                         {"error": "Parking lot not found", "field": "parkinglot"}
-                    ).encode("utf-8")
+                    )
                 )
                 return
             if "ADMIN" == session_user.get("role"):
@@ -370,52 +663,51 @@ class RequestHandler(BaseHTTPRequestHandler):
                     self.send_header("Content-type", "application/json")
                     self.end_headers()
                     self.wfile.write(
-                        json.dumps(
+                        json_codec.encode(
                             {"error": "Require field missing", "field": "user"}
-                        ).encode("utf-8")
+                        )
                     )
                     return
             else:
                 data["user"] = session_user["username"]
-            reservations[rid] = data
+            rid = next_id("reservations", load_reservation_data)
             data["id"] = rid
-            parking_lots[data["parkinglot"]]["reserved"] += 1
-            save_reservation_data(reservations)
-            save_parking_lot_data(parking_lots)
+            parking_lot["reserved"] = parking_lot.get("reserved", 0) + 1
+            save_reservation(rid, data)
+            save_parking_lot(data["parkinglot"], parking_lot)
             self.send_response(201)
             self.send_header("Content-type", "application/json")
             self.end_headers()
             self.wfile.write(
-                json.dumps({"status": "Success", "reservation": data}).encode("utf-8")
+                json_codec.encode({"status": "Success", "reservation": data})
             )
             return
 
-        elif self.path == "/vehicles":
-            log_request(self, "Vehicles endpoint called")
+    @routes.route("POST", "/vehicles")
+    def create_vehicle(self):
+        log_request(self, "Vehicles endpoint called")
 
-            token = self.headers.get("Authorization")
-            if not token or not get_session(token):
-                self.send_response(401)
-                self.send_header("Content-type", "application/json")
-                self.end_headers()
-                self.wfile.write(b"Unauthorized: Invalid or missing session token")
-                log_request(self, "Unauthorized access attempt", logging.WARNING)
-                return
-            session_user = get_session(token)
-            data = json.loads(
-                self.rfile.read(int(self.headers.get("Content-Length", -1)))
-            )
-            vehicles = load_json("data/vehicles.json")
-            uvehicles = vehicles.get(session_user["username"], {})
+        token = self.headers.get("Authorization")
+        if not token or not self.get_session(token):
+            self.send_response(401)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"Unauthorized: Invalid or missing session token")
+            log_request(self, "Unauthorized access attempt", logging.WARNING)
+            return
+        session_user = self.get_session(token)
+        data = json_codec.loads(self.rfile.read(int(self.headers.get("Content-Length", -1))))
+        with locked("data/vehicles.json"):
+            uvehicles = load_user_vehicles(session_user["username"])
             for field in ["name", "license_plate"]:
                 if not field in data:
                     self.send_response(400)
                     self.send_header("Content-type", "application/json")
                     self.end_headers()
                     self.wfile.write(
-                        json.dumps(
+                        json_codec.encode(
                             {"error": "Require field missing", "field": field}
-                        ).encode("utf-8")
+                        )
                     )
                     return
             lid = data["license_plate"].replace("-", "")
@@ -424,368 +716,359 @@ class RequestHandler(BaseHTTPRequestHandler):
                 self.send_header("Content-type", "application/json")
                 self.end_headers()
                 self.wfile.write(
-                    json.dumps(
+                    json_codec.encode(
                         {"error": "Vehicle already exists", "data": uvehicles.get(lid)}
-                    ).encode("utf-8")
+                    )
                 )
                 return
-            if not uvehicles:
-                vehicles[session_user["username"]] = {}
-            vehicles[session_user["username"]][lid] = {
-                "licenseplate": data["license_plate"],
-                "name": data["name"],
-                "created_at": datetime.now(),
-                "updated_at": datetime.now(),
-            }
-            save_data("data/vehicles.json", vehicles)
+            save_vehicle(
+                session_user["username"],
+                lid,
+                {
+                    "licenseplate": data["license_plate"],
+                    "name": data["name"],
+                    "created_at": datetime.now(),
+                    "updated_at": datetime.now(),
+                },
+            )
             self.send_response(201)
             self.send_header("Content-type", "application/json")
             self.end_headers()
-            self.wfile.write(
-                json.dumps({"status": "Success", "vehicle": data}).encode("utf-8")
-            )
+            self.wfile.write(json_codec.encode({"status": "Success", "vehicle": data}))
             return
 
-        elif self.path.startswith("/vehicles/"):
-            log_request(self, "Vehicles endpoint called")
+    @routes.route("POST", "/vehicles/{lid}/entry")
+    def vehicle_entry(self, lid):
+        log_request(self, "Vehicles endpoint called")
 
-            token = self.headers.get("Authorization")
-            if not token or not get_session(token):
-                self.send_response(401)
-                self.send_header("Content-type", "application/json")
-                self.end_headers()
-                self.wfile.write(b"Unauthorized: Invalid or missing session token")
-                log_request(self, "Unauthorized access attempt", logging.WARNING)
-                return
-            session_user = get_session(token)
-            data = json.loads(
-                self.rfile.read(int(self.headers.get("Content-Length", -1)))
-            )
-            vehicles = load_json("data/vehicles.json")
-            uvehicles = vehicles.get(session_user["username"], {})
-            for field in ["parkinglot"]:
-                if not field in data:
-                    self.send_response(400)
-                    self.send_header("Content-type", "application/json")
-                    self.end_headers()
-                    self.wfile.write(
-                        json.dumps(
-                            {"error": "Require field missing", "field": field}
-                        ).encode("utf-8")
-                    )
-                    return
-            lid = self.path.replace("/vehicles/", "").replace("/entry", "")
-            if lid not in uvehicles:
-                self.send_response(404)
+        token = self.headers.get("Authorization")
+        if not token or not self.get_session(token):
+            self.send_response(401)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"Unauthorized: Invalid or missing session token")
+            log_request(self, "Unauthorized access attempt", logging.WARNING)
+            return
+        session_user = self.get_session(token)
+        data = json_codec.loads(self.rfile.read(int(self.headers.get("Content-Length", -1))))
+        uvehicles = load_user_vehicles(session_user["username"])
+        for field in ["parkinglot"]:
+            if not field in data:
+                self.send_response(400)
                 self.send_header("Content-type", "application/json")
                 self.end_headers()
                 self.wfile.write(
-                    json.dumps({"error": "Vehicle does not exist", "data": lid}).encode(
-                        "utf-8"
+                    json_codec.encode(
+                        {"error": "Require field missing", "field": field}
                     )
                 )
                 return
-            self.send_response(200)
+        if lid not in uvehicles:
+            self.send_response(404)
             self.send_header("Content-type", "application/json")
             self.end_headers()
             self.wfile.write(
-                json.dumps(
-                    {
-                        "status": "Accepted",
-                        "vehicle": vehicles[session_user["username"]][lid],
-                    }
-                ).encode("utf-8")
+                json_codec.encode({"error": "Vehicle does not exist", "data": lid})
             )
             return
+        self.send_response(200)
+        self.send_header("Content-type", "application/json")
+        self.end_headers()
+        self.wfile.write(
+            json_codec.encode(
+                {
+                    "status": "Accepted",
+                    "vehicle": uvehicles[lid],
+                }
+            )
+        )
+        return
 
-        elif self.path.startswith("/payments"):
-            log_request(self, "Payments endpoint called")
+    @routes.route("POST", "/payments")
+    def create_payment(self):
+        log_request(self, "Payments endpoint called")
 
-            token = self.headers.get("Authorization")
-            if not token or not get_session(token):
+        token = self.headers.get("Authorization")
+        if not token or not self.get_session(token):
+            self.send_response(401)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"Unauthorized: Invalid or missing session token")
+            return
+
+        session_user = self.get_session(token)
+
+        length = int(self.headers.get("Content-Length", 0))
+        raw_body = self.rfile.read(length) if length > 0 else b"{}"
+        data = json_codec.loads(raw_body)
+        for field in ["transaction", "amount"]:
+            if not field in data:
                 self.send_response(401)
                 self.send_header("Content-type", "application/json")
                 self.end_headers()
-                self.wfile.write(b"Unauthorized: Invalid or missing session token")
+                self.wfile.write(
+                    json_codec.encode(
+                        {"error": "Require field missing", "field": field}
+                    )
+                )
                 return
+        payment = {
+            "transaction": data.get("transaction"),
+            "amount": data.get("amount", 0),
+            "initiator": session_user["username"],
+            "created_at": datetime.now().strftime("%d-%m-%Y %H:%I:%S"),
+            "completed": False,
+            "hash": sc.generate_transaction_validation_hash(),
+        }
+        append_payment(payment)
+        self.send_response(201)
+        self.send_header("Content-type", "application/json")
+        self.end_headers()
+        self.wfile.write(json_codec.encode({"status": "Success", "payment": payment}))
+        return
+
+    @routes.route("POST", "/payments/refund")
+    def refund_payment(self):
+        log_request(self, "Payments endpoint called")
+
+        token = self.headers.get("Authorization")
+        if not token or not self.get_session(token):
+            self.send_response(401)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"Unauthorized: Invalid or missing session token")
+            return
 
-            payments = load_payment_data()
-            session_user = get_session(token)
+        session_user = self.get_session(token)
 
-            length = int(self.headers.get("Content-Length", 0))
-            raw_body = self.rfile.read(length) if length > 0 else b"{}"
-            data = json.loads(raw_body)
-            if self.path.endswith("/refund"):
-                log_request(self, "Refund endpoint called")
+        length = int(self.headers.get("Content-Length", 0))
+        raw_body = self.rfile.read(length) if length > 0 else b"{}"
+        data = json_codec.loads(raw_body)
+        log_request(self, "Refund endpoint called")
 
+        if not "ADMIN" == session_user.get("role"):
+            self.send_response(403)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"Access denied")
+            return
+        for field in ["transaction", "amount"]:
+            if not field in data:
+                self.send_response(401)
+                self.send_header("Content-type", "application/json")
+                self.end_headers()
+                self.wfile.write(
+                    json_codec.encode(
+                        {"error": "Require field missing", "field": field}
+                    )
+                )
+                return
+        payment = {
+            "transaction": (
+                data["transaction"]
+                if data.get("transaction")
+                else sc.generate_payment_hash(
+                    session_user["username"], str(datetime.now())
+                )
+            ),
+            "amount": -abs(data.get("amount", 0)),
+            "coupled_to": data.get("coupled_to"),
+            "processed_by": session_user["username"],
+            "created_at": datetime.now().strftime("%d-%m-%Y %H:%I:%S"),
+            "completed": False,
+            "hash": sc.generate_transaction_validation_hash(),
+        }
+        append_payment(payment)
+        self.send_response(201)
+        self.send_header("Content-type", "application/json")
+        self.end_headers()
+        self.wfile.write(json_codec.encode({"status": "Success", "payment": payment}))
+        return
+
+    @routes.route("PUT", "/parking-lots/{lid:id}")
+    def update_parking_lot(self, lid):
+        log_request(self, "Parking lots endpoint called")
+
+        with locked("data/parking-lots.json"):
+            if get_parking_lot(lid) is not None:
+                token = self.headers.get("Authorization")
+                if not token or not self.get_session(token):
+                    self.send_response(401)
+                    self.send_header("Content-type", "application/json")
+                    self.end_headers()
+                    self.wfile.write(b"Unauthorized: Invalid or missing session token")
+                    return
+                session_user = self.get_session(token)
                 if not "ADMIN" == session_user.get("role"):
                     self.send_response(403)
                     self.send_header("Content-type", "application/json")
                     self.end_headers()
                     self.wfile.write(b"Access denied")
                     return
-                for field in ["transaction", "amount"]:
-                    if not field in data:
-                        self.send_response(401)
-                        self.send_header("Content-type", "application/json")
-                        self.end_headers()
-                        self.wfile.write(
-                            json.dumps(
-                                {"error": "Require field missing", "field": field}
-                            ).encode("utf-8")
-                        )
-                        return
-                payment = {
-                    "transaction": (
-                        data["transaction"]
-                        if data.get("transaction")
-                        else sc.generate_payment_hash(
-                            session_user["username"], str(datetime.now())
-                        )
-                    ),
-                    "amount": -abs(data.get("amount", 0)),
-                    "coupled_to": data.get("coupled_to"),
-                    "processed_by": session_user["username"],
-                    "created_at": datetime.now().strftime("%d-%m-%Y %H:%I:%S"),
-                    "completed": False,
-                    "hash": sc.generate_transaction_validation_hash(),
-                }
+                data = json_codec.loads(
+                    self.rfile.read(int(self.headers.get("Content-Length", -1)))
+                )
+                save_parking_lot(lid, data)
+                self.send_response(200)
+                self.send_header("Content-type", "application/json")
+                self.end_headers()
+                self.wfile.write(b"Parking lot modified")
             else:
-                for field in ["transaction", "amount"]:
+                self.send_response(404)
+                self.send_header("Content-type", "application/json")
+                self.end_headers()
+                self.wfile.write(b"Parking lot not found")
+                return
+
+    @routes.route("PUT", "/profile")
+    def update_profile(self):
+        log_request(self, "Profile endpoint called")
+
+        token = self.headers.get("Authorization")
+        if not token or not self.get_session(token):
+            self.send_response(401)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"Unauthorized: Invalid or missing session token")
+            return
+        session_user = self.get_session(token)
+        data = json_codec.loads(self.rfile.read(int(self.headers.get("Content-Length", -1))))
+        data["username"] = session_user["username"]
+        if data.get("password"):
+            data["password"] = hashlib.md5(data["password"].encode()).hexdigest()
+        with locked("data/users.json"):
+            update_user(session_user["username"], data)
+        self.send_response(200)
+        self.send_header("Content-type", "application/json")
+        self.end_headers()
+        self.wfile.write(b"User updated succesfully")
+
+    @routes.route("PUT", "/reservations/{rid:id}")
+    def update_reservation(self, rid):
+        log_request(self, "Reservations endpoint called")
+
+        data = json_codec.loads(self.rfile.read(int(self.headers.get("Content-Length", -1))))
+        with locked("data/reservations.json"):
+            if get_reservation(rid) is not None:
+                token = self.headers.get("Authorization")
+                if not token or not self.get_session(token):
+                    self.send_response(401)
+                    self.send_header("Content-type", "application/json")
+                    self.end_headers()
+                    self.wfile.write(b"Unauthorized: Invalid or missing session token")
+                    log_request(self, "Unauthorized access attempt", logging.WARNING)
+                    return
+                session_user = self.get_session(token)
+                for field in ["licenseplate", "startdate", "enddate", "parkinglot"]:
                     if not field in data:
                         self.send_response(401)
                         self.send_header("Content-type", "application/json")
                         self.end_headers()
                         self.wfile.write(
-                            json.dumps(
+                            json_codec.encode(
                                 {"error": "Require field missing", "field": field}
-                            ).encode("utf-8")
+                            )
                         )
                         return
-                payment = {
-                    "transaction": data.get("transaction"),
-                    "amount": data.get("amount", 0),
-                    "initiator": session_user["username"],
-                    "created_at": datetime.now().strftime("%d-%m-%Y %H:%I:%S"),
-                    "completed": False,
-                    "hash": sc.generate_transaction_validation_hash(),
-                }
-            payments.append(payment)
-            save_payment_data(payments)
-            self.send_response(201)
-            self.send_header("Content-type", "application/json")
-            self.end_headers()
-            self.wfile.write(
-                json.dumps({"status": "Success", "payment": payment}).encode("utf-8")
-            )
-            return
-
-    def do_PUT(self):
-        if self.path.startswith("/parking-lots/"):
-            log_request(self, "Parking lots endpoint called")
-
-            lid = self.path.split("/")[2]
-            parking_lots = load_parking_lot_data()
-            if lid:
-                if lid in parking_lots:
-                    token = self.headers.get("Authorization")
-                    if not token or not get_session(token):
+                if "ADMIN" == session_user.get("role"):
+                    if not "user" in data:
                         self.send_response(401)
                         self.send_header("Content-type", "application/json")
                         self.end_headers()
                         self.wfile.write(
-                            b"Unauthorized: Invalid or missing session token"
+                            json_codec.encode(
+                                {"error": "Require field missing", "field": "user"}
+                            )
                         )
                         return
-                    session_user = get_session(token)
-                    if not "ADMIN" == session_user.get("role"):
-                        self.send_response(403)
-                        self.send_header("Content-type", "application/json")
-                        self.end_headers()
-                        self.wfile.write(b"Access denied")
-                        return
-                    data = json.loads(
-                        self.rfile.read(int(self.headers.get("Content-Length", -1)))
-                    )
-                    parking_lots[lid] = data
-                    save_parking_lot_data(parking_lots)
-                    self.send_response(200)
-                    self.send_header("Content-type", "application/json")
-                    self.end_headers()
-                    self.wfile.write(b"Parking lot modified")
                 else:
-                    self.send_response(404)
-                    self.send_header("Content-type", "application/json")
-                    self.end_headers()
-                    self.wfile.write(b"Parking lot not found")
-                    return
-
-        elif self.path == "/profile":
-            log_request(self, "Profile endpoint called")
-
-            token = self.headers.get("Authorization")
-            if not token or not get_session(token):
-                self.send_response(401)
+                    data["user"] = session_user["username"]
+                save_reservation(rid, data)
+                self.send_response(200)
                 self.send_header("Content-type", "application/json")
                 self.end_headers()
-                self.wfile.write(b"Unauthorized: Invalid or missing session token")
+                self.wfile.write(
+                    json_codec.encode({"status": "Updated", "reservation": data})
+                )
                 return
-            session_user = get_session(token)
-            data = json.loads(
-                self.rfile.read(int(self.headers.get("Content-Length", -1)))
-            )
-            data["username"] = session_user["username"]
-            if data["password"]:
-                data["password"] = hashlib.md5(data["password"].encode()).hexdigest()
-            save_user_data(data)
-            self.send_response(200)
-            self.send_header("Content-type", "application/json")
-            self.end_headers()
-            self.wfile.write(b"User updated succesfully")
-
-        elif self.path.startswith("/reservations/"):
-            log_request(self, "Reservations endpoint called")
-
-            data = json.loads(
-                self.rfile.read(int(self.headers.get("Content-Length", -1)))
-            )
-            reservations = load_reservation_data()
-            rid = self.path.replace("/reservations/", "")
-            if rid:
-                if rid in reservations:
-                    token = self.headers.get("Authorization")
-                    if not token or not get_session(token):
-                        self.send_response(401)
-                        self.send_header("Content-type", "application/json")
-                        self.end_headers()
-                        self.wfile.write(
-                            b"Unauthorized: Invalid or missing session token"
-                        )
-                        log_request(
-                            self, "Unauthorized access attempt", logging.WARNING
-                        )
-                        return
-                    session_user = get_session(token)
-                    for field in ["licenseplate", "startdate", "enddate", "parkinglot"]:
-                        if not field in data:
-                            self.send_response(401)
-                            self.send_header("Content-type", "application/json")
-                            self.end_headers()
-                            self.wfile.write(
-                                json.dumps(
-                                    {"error": "Require field missing", "field": field}
-                                ).encode("utf-8")
-                            )
-                            return
-                    if "ADMIN" == session_user.get("role"):
-                        if not "user" in data:
-                            self.send_response(401)
-                            self.send_header("Content-type", "application/json")
-                            self.end_headers()
-                            self.wfile.write(
-                                json.dumps(
-                                    {"error": "Require field missing", "field": "user"}
-                                ).encode("utf-8")
-                            )
-                            return
-                    else:
-                        data["user"] = session_user["username"]
-                    reservations[rid] = data
-                    save_reservation_data(reservations)
-                    self.send_response(200)
-                    self.send_header("Content-type", "application/json")
-                    self.end_headers()
-                    self.wfile.write(
-                        json.dumps({"status": "Updated", "reservation": data}).encode(
-                            "utf-8"
-                        )
-                    )
-                    return
-                else:
-                    self.send_response(404)
-                    self.send_header("Content-type", "application/json")
-                    self.end_headers()
-                    self.wfile.write(b"Reservation not found")
-                    return
-
-        elif self.path.startswith("/vehicles/"):
-            log_request(self, "Vehicles endpoint called")
-
-            token = self.headers.get("Authorization")
-            if not token or not get_session(token):
-                self.send_response(401)
+            else:
+                self.send_response(404)
                 self.send_header("Content-type", "application/json")
                 self.end_headers()
-                self.wfile.write(b"Unauthorized: Invalid or missing session token")
-                log_request(self, "Unauthorized access attempt", logging.WARNING)
+                self.wfile.write(b"Reservation not found")
                 return
-            session_user = get_session(token)
-            data = json.loads(
-                self.rfile.read(int(self.headers.get("Content-Length", -1)))
-            )
-            vehicles = load_json("data/vehicles.json")
-            uvehicles = vehicles.get(session_user["username"], {})
+
+    @routes.route("PUT", "/vehicles/{lid}")
+    def update_vehicle(self, lid):
+        log_request(self, "Vehicles endpoint called")
+
+        token = self.headers.get("Authorization")
+        if not token or not self.get_session(token):
+            self.send_response(401)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"Unauthorized: Invalid or missing session token")
+            log_request(self, "Unauthorized access attempt", logging.WARNING)
+            return
+        session_user = self.get_session(token)
+        data = json_codec.loads(self.rfile.read(int(self.headers.get("Content-Length", -1))))
+        with locked("data/vehicles.json"):
+            uvehicles = load_user_vehicles(session_user["username"])
             for field in ["name"]:
                 if not field in data:
                     self.send_response(401)
                     self.send_header("Content-type", "application/json")
                     self.end_headers()
                     self.wfile.write(
-                        json.dumps(
+                        json_codec.encode(
                             {"error": "Require field missing", "field": field}
-                        ).encode("utf-8")
+                        )
                     )
                     return
-            lid = self.path.replace("/vehicles/", "")
-            if not uvehicles:
-                vehicles[session_user["username"]] = {}
             if lid not in uvehicles:
-                vehicles[session_user["username"]][lid] = {
+                uvehicles[lid] = {
                     "licenseplate": data.get("license_plate"),
                     "name": data["name"],
                     "created_at": datetime.now(),
                     "updated_at": datetime.now(),
                 }
-            vehicles[session_user["username"]][lid]["name"] = data["name"]
-            vehicles[session_user["username"]][lid]["updated_at"] = datetime.now()
-            save_data("data/vehicles.json", vehicles)
+            uvehicles[lid]["name"] = data["name"]
+            uvehicles[lid]["updated_at"] = datetime.now()
+            save_vehicle(session_user["username"], lid, uvehicles[lid])
             self.send_response(200)
             self.send_header("Content-type", "application/json")
             self.end_headers()
             self.wfile.write(
-                json.dumps(
+                json_codec.encode(
                     {
                         "status": "Success",
-                        "vehicle": vehicles[session_user["username"]][lid],
-                    },
-                    default=str,
-                ).encode("utf-8")
+                        "vehicle": uvehicles[lid],
+                    }
+                )
             )
             return
 
-        elif self.path.startswith("/payments/"):
-            log_request(self, "Payments endpoint called")
+    @routes.route("PUT", "/payments/{pid}")
+    def complete_payment(self, pid):
+        log_request(self, "Payments endpoint called")
 
-            token = self.headers.get("Authorization")
-            if not token or not get_session(token):
-                self.send_response(401)
-                self.send_header("Content-type", "application/json")
-                self.end_headers()
-                self.wfile.write(b"Unauthorized: Invalid or missing session token")
-                log_request(self, "Unauthorized access attempt", logging.WARNING)
-                return
-
-            pid = self.path.replace("/payments/", "")
-            payments = load_payment_data()
-            session_user = get_session(token)
+        token = self.headers.get("Authorization")
+        if not token or not self.get_session(token):
+            self.send_response(401)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"Unauthorized: Invalid or missing session token")
+            log_request(self, "Unauthorized access attempt", logging.WARNING)
+            return
 
+        with locked("data/payments.json"):
             length = int(self.headers.get("Content-Length", 0))
             raw_body = self.rfile.read(length) if length > 0 else b"{}"
-            data = json.loads(raw_body)
+            data = json_codec.loads(raw_body)
 
-            payment = next((p for p in payments if p.get("transaction") == pid), None)
+            index, payment = find_payment(pid)
 
-            if not payment:
+            if payment is None:
                 self.send_response(404)
                 self.send_header("Content-type", "application/json")
                 self.end_headers()
@@ -798,9 +1081,9 @@ class RequestHandler(BaseHTTPRequestHandler):
                     self.send_header("Content-type", "application/json")
                     self.end_headers()
                     self.wfile.write(
-                        json.dumps(
+                        json_codec.encode(
                             {"error": "Required field missing", "field": field}
-                        ).encode("utf-8")
+                        )
                     )
                     return
 
@@ -809,589 +1092,646 @@ class RequestHandler(BaseHTTPRequestHandler):
                 self.send_header("Content-type", "application/json")
                 self.end_headers()
                 self.wfile.write(
-                    json.dumps(
+                    json_codec.encode(
                         {
                             "error": "Validation failed",
                             "info": "The validation of the security hash could not be validated for this transaction.",
                         }
-                    ).encode("utf-8")
+                    )
                 )
                 return
 
+            payment = dict(payment)
             payment["completed"] = datetime.now().strftime("%d-%m-%Y %H:%M:%S")
             payment["t_data"] = data.get("t_data", {})
 
-            save_payment_data(payments)
+            update_payment(index, payment)
 
             self.send_response(200)
             self.send_header("Content-type", "application/json")
             self.end_headers()
             self.wfile.write(
-                json.dumps({"status": "Success", "payment": payment}).encode("utf-8")
+                json_codec.encode({"status": "Success", "payment": payment})
             )
             return
 
-    def do_DELETE(self):
-        if self.path.startswith("/parking-lots/"):
-            log_request(self, "Parking lots endpoint called")
+    @routes.route("DELETE", "/parking-lots/{lid:id}")
+    def remove_parking_lot(self, lid):
+        log_request(self, "Parking lots endpoint called")
 
-            lid = self.path.split("/")[2]
-            parking_lots = load_parking_lot_data()
-            if lid:
-                if lid in parking_lots:
-                    token = self.headers.get("Authorization")
-                    if not token or not get_session(token):
-                        self.send_response(401)
-                        self.send_header("Content-type", "application/json")
-                        self.end_headers()
-                        self.wfile.write(
-                            b"Unauthorized: Invalid or missing session token"
-                        )
-                        return
-                    session_user = get_session(token)
-                    if not "ADMIN" == session_user.get("role"):
-                        self.send_response(403)
-                        self.send_header("Content-type", "application/json")
-                        self.end_headers()
-                        self.wfile.write(b"Access denied")
-                        return
-                    if "sessions" in self.path:
-                        sessions = load_json(f"data/pdata/p{lid}-sessions.json")
-                        sid = self.path.split("/")[-1]
-                        if sid.isnumeric():
-                            del sessions[sid]
-                            save_data(f"data/pdata/p{lid}-sessions.json", sessions)
-                            self.send_response(200)
-                            self.send_header("Content-type", "application/json")
-                            self.end_headers()
-                            self.wfile.write(b"Sessions deleted")
-                        else:
-                            self.send_response(403)
-                            self.send_header("Content-type", "application/json")
-                            self.end_headers()
-                            self.wfile.write(
-                                b"Session ID is required, cannot delete all sessions"
-                            )
-                    else:
-                        del parking_lots[lid]
-                        save_parking_lot_data(parking_lots)
-                        self.send_response(200)
-                        self.send_header("Content-type", "application/json")
-                        self.end_headers()
-                        self.wfile.write(b"Parking lot deleted")
-                else:
-                    self.send_response(404)
+        with locked("data/parking-lots.json"):
+            if get_parking_lot(lid) is not None:
+                token = self.headers.get("Authorization")
+                if not token or not self.get_session(token):
+                    self.send_response(401)
                     self.send_header("Content-type", "application/json")
                     self.end_headers()
-                    self.wfile.write(b"Parking lot not found")
+                    self.wfile.write(b"Unauthorized: Invalid or missing session token")
                     return
+                session_user = self.get_session(token)
+                if not "ADMIN" == session_user.get("role"):
+                    self.send_response(403)
+                    self.send_header("Content-type", "application/json")
+                    self.end_headers()
+                    self.wfile.write(b"Access denied")
+                    return
+                delete_parking_lot(lid)
+                self.send_response(200)
+                self.send_header("Content-type", "application/json")
+                self.end_headers()
+                self.wfile.write(b"Parking lot deleted")
+            else:
+                self.send_response(404)
+                self.send_header("Content-type", "application/json")
+                self.end_headers()
+                self.wfile.write(b"Parking lot not found")
+            return
 
-        elif self.path.startswith("/reservations/"):
-            log_request(self, "Reservations endpoint called")
+    @routes.route("DELETE", "/parking-lots/{lid:id}/sessions")
+    @routes.route("DELETE", "/parking-lots/{lid:id}/sessions/{sid:id}")
+    def remove_lot_sessions(self, lid, sid=None):
+        log_request(self, "Parking lots endpoint called")
 
-            reservations = load_reservation_data()
-            parking_lots = load_parking_lot_data()
-            rid = self.path.replace("/reservations/", "")
-            if rid:
-                if rid in reservations:
-                    token = self.headers.get("Authorization")
-                    if not token or not get_session(token):
-                        self.send_response(401)
-                        self.send_header("Content-type", "application/json")
-                        self.end_headers()
-                        self.wfile.write(
-                            b"Unauthorized: Invalid or missing session token"
-                        )
-                        return
-                    session_user = get_session(token)
-                    if "ADMIN" == session_user.get("role") or session_user[
-                        "username"
-                    ] == reservations[rid].get("user"):
-                        del reservations[rid]
-                    else:
-                        self.send_response(403)
-                        self.send_header("Content-type", "application/json")
-                        self.end_headers()
-                        self.wfile.write(b"Access denied")
-                        return
-                    pid = reservations[rid]["parkinglot"]
-                    parking_lots[pid]["reserved"] -= 1
-                    save_reservation_data(reservations)
-                    save_parking_lot_data(parking_lots)
-                    self.send_response(200)
+        with locked("data/parking-lots.json"):
+            if get_parking_lot(lid) is not None:
+                token = self.headers.get("Authorization")
+                if not token or not self.get_session(token):
+                    self.send_response(401)
                     self.send_header("Content-type", "application/json")
                     self.end_headers()
-                    self.wfile.write(json.dumps({"status": "Deleted"}).encode("utf-8"))
+                    self.wfile.write(b"Unauthorized: Invalid or missing session token")
                     return
-                else:
-                    self.send_response(404)
+                session_user = self.get_session(token)
+                if not "ADMIN" == session_user.get("role"):
+                    self.send_response(403)
                     self.send_header("Content-type", "application/json")
                     self.end_headers()
-                    self.wfile.write(b"Reservation not found")
+                    self.wfile.write(b"Access denied")
                     return
+                with locked(f"data/pdata/p{lid}-sessions.json"):
+                    if sid is not None:
+                        delete_parking_session(lid, sid)
+                        self.send_response(200)
+                        self.send_header("Content-type", "application/json")
+                        self.end_headers()
+                        self.wfile.write(b"Sessions deleted")
+                    else:
+                        self.send_response(403)
+                        self.send_header("Content-type", "application/json")
+                        self.end_headers()
+                        self.wfile.write(
+                            b"Session ID is required, cannot delete all sessions"
+                        )
+            else:
+                self.send_response(404)
+                self.send_header("Content-type", "application/json")
+                self.end_headers()
+                self.wfile.write(b"Parking lot not found")
+            return
 
-        elif self.path.startswith("/vehicles/"):
-            log_request(self, "Vehicles endpoint called")
+    @routes.route("DELETE", "/reservations/{rid:id}")
+    def remove_reservation(self, rid):
+        log_request(self, "Reservations endpoint called")
 
-            lid = self.path.replace("/vehicles/", "")
-            if lid:
+        with locked("data/reservations.json", "data/parking-lots.json"):
+            reservation = get_reservation(rid)
+            if reservation is not None:
                 token = self.headers.get("Authorization")
-                if not token or not get_session(token):
+                if not token or not self.get_session(token):
                     self.send_response(401)
                     self.send_header("Content-type", "application/json")
                     self.end_headers()
                     self.wfile.write(b"Unauthorized: Invalid or missing session token")
-                    log_request(self, "Unauthorized access attempt", logging.WARNING)
                     return
-                session_user = get_session(token)
-                vehicles = load_json("data/vehicles.json")
-                uvehicles = vehicles.get(session_user["username"], {})
-                if lid not in uvehicles:
+                session_user = self.get_session(token)
+                if "ADMIN" == session_user.get("role") or session_user[
+                    "username"
+                ] == reservation.get("user"):
+                    delete_reservation(rid)
+                else:
                     self.send_response(403)
                     self.send_header("Content-type", "application/json")
                     self.end_headers()
-                    self.wfile.write(b"Vehicle not found!")
+                    self.wfile.write(b"Access denied")
                     return
-                del vehicles[session_user["username"]][lid]
-                save_data("data/vehicles.json", vehicles)
+                pid = reservation["parkinglot"]
+                parking_lot = get_parking_lot(pid)
+                if parking_lot is not None:
+                    parking_lot["reserved"] = parking_lot.get("reserved", 1) - 1
+                    save_parking_lot(pid, parking_lot)
                 self.send_response(200)
                 self.send_header("Content-type", "application/json")
                 self.end_headers()
-                self.wfile.write(json.dumps({"status": "Deleted"}).encode("utf-8"))
+                self.wfile.write(json_codec.encode({"status": "Deleted"}))
+                return
+            else:
+                self.send_response(404)
+                self.send_header("Content-type", "application/json")
+                self.end_headers()
+                self.wfile.write(b"Reservation not found")
                 return
 
-    def do_GET(self):
-
-        if self.path == "/":
+    @routes.route("DELETE", "/vehicles/{lid}")
+    def remove_vehicle(self, lid):
+        log_request(self, "Vehicles endpoint called")
 
-            self.send_response(200)
-            self.send_header("Content-type", "text/plain")
+        token = self.headers.get("Authorization")
+        if not token or not self.get_session(token):
+            self.send_response(401)
+            self.send_header("Content-type", "application/json")
             self.end_headers()
-            self.wfile.write(b"Server is running")
+            self.wfile.write(b"Unauthorized: Invalid or missing session token")
+            log_request(self, "Unauthorized access attempt", logging.WARNING)
             return
-
-        if self.path == "/profile":
-            log_request(self, "Profile endpoint called")
-
-            token = self.headers.get("Authorization")
-            if not token or not get_session(token):
-                self.send_response(401)
+        session_user = self.get_session(token)
+        with locked("data/vehicles.json"):
+            uvehicles = load_user_vehicles(session_user["username"])
+            if lid not in uvehicles:
+                self.send_response(403)
                 self.send_header("Content-type", "application/json")
                 self.end_headers()
-                self.wfile.write(b"Unauthorized: Invalid or missing session token")
-                log_request(self, "Unauthorized access attempt", logging.WARNING)
+                self.wfile.write(b"Vehicle not found!")
                 return
-            session_user = get_session(token)
+            delete_vehicle(session_user["username"], lid)
             self.send_response(200)
             self.send_header("Content-type", "application/json")
             self.end_headers()
-            self.wfile.write(json.dumps(session_user).encode("utf-8"))
+            self.wfile.write(json_codec.encode({"status": "Deleted"}))
+            return
 
-        elif self.path.startswith("/logs"):
-            token = self.headers.get("Authorization")
-            if not token or not get_session(token):
-                self.send_response(401)
-                self.end_headers()
-                return
+    @routes.route("GET", "/")
+    def index(self):
+        self.send_response(200)
+        self.send_header("Content-type", "text/plain")
+        self.end_headers()
+        self.wfile.write(b"Server is running")
+        return
 
-            session_user = get_session(token)
-            if session_user.get("role") != "ADMIN":
-                self.send_response(403)
-                self.end_headers()
-                return
+    @routes.route("GET", "/profile")
+    def show_profile(self):
+        log_request(self, "Profile endpoint called")
 
-            # Query parameters
-            from urllib.parse import urlparse, parse_qs
-
-            query = parse_qs(urlparse(self.path).query)
-
-            level = query.get("level", [None])[0]
-            path_q = query.get("path", [None])[0]
-            method = query.get("method", [None])[0]
-            text = query.get("q", [None])[0]
-            limit = int(query.get("limit", [100])[0])
-
-            results = []
-
-            with open("logs/api.log", "r") as f:
-                for line in reversed(f.readlines()):
-                    try:
-                        log = json.loads(line)
-
-                        if level and log["level"] != level:
-                            continue
-                        if path_q and log["path"] != path_q:
-                            continue
-                        if method and log["method"] != method:
-                            continue
-                        if text and text not in log["message"]:
-                            continue
-
-                        results.append(log)
-                        if len(results) >= limit:
-                            break
-                    except json.JSONDecodeError:
-                        continue
-
-            self.send_response(200)
+        token = self.headers.get("Authorization")
+        if not token or not self.get_session(token):
+            self.send_response(401)
             self.send_header("Content-type", "application/json")
             self.end_headers()
-            self.wfile.write(json.dumps(results).encode("utf-8"))
+            self.wfile.write(b"Unauthorized: Invalid or missing session token")
+            log_request(self, "Unauthorized access attempt", logging.WARNING)
+            return
+        session_user = self.get_session(token)
+        if TOKEN_MODE == "signed" and signed_tokens.is_signed(token):
+            # A signed token only carries the username and role
+            user = get_user(session_user["username"])
+            if user is not None:
+                session_user = {
+                    key: value for key, value in user.items() if key != "password"
+                } | session_user
+        self.send_response(200)
+        self.send_header("Content-type", "application/json")
+        self.end_headers()
+        self.wfile.write(json_codec.encode(session_user))
+
+    @routes.route("GET", "/logs")
+    def show_logs(self):
+        token = self.headers.get("Authorization")
+        if not token or not self.get_session(token):
+            self.send_response(401)
+            self.end_headers()
             return
 
-        elif self.path == "/logout":
-            log_request(self, "Logout endpoint called")
-
-            token = self.headers.get("Authorization")
-            if token and get_session(token):
-                remove_session(token)
-                self.send_response(200)
-                self.send_header("Content-type", "application/json")
-                self.end_headers()
-                self.wfile.write(b"User logged out")
-                return
-            self.send_response(400)
-            self.send_header("Content-type", "application/json")
+        session_user = self.get_session(token)
+        if session_user.get("role") != "ADMIN":
+            self.send_response(403)
             self.end_headers()
-            self.wfile.write(b"Invalid session token")
+            return
 
-        elif self.path.startswith("/parking-lots/"):
-            log_request(self, "Parking lots endpoint called")
+        # Query parameters
+        from urllib.parse import urlparse, parse_qs
 
-            lid = self.path.split("/")[2]
-            parking_lots = load_parking_lot_data()
-            token = self.headers.get("Authorization")
-            if lid:
-                if lid not in parking_lots:
-                    self.send_response(404)
-                    self.send_header("Content-type", "application/json")
-                    self.end_headers()
-                    self.wfile.write(b"Parking lot not found")
-                    return
-                if "sessions" in self.path:
-                    if not token or not get_session(token):
-                        self.send_response(401)
-                        self.send_header("Content-type", "application/json")
-                        self.end_headers()
-                        self.wfile.write(
-                            b"Unauthorized: Invalid or missing session token"
-                        )
-                        return
-                    sessions = load_json(f"data/pdata/p{lid}-sessions.json")
-                    rsessions = []
-                    if self.path.endswith("/sessions"):
-                        if "ADMIN" == session_user.get("role"):
-                            rsessions = sessions
-                        else:
-                            for session in sessions:
-                                if session["user"] == session_user["username"]:
-                                    rsessions.append(session)
-                        self.send_response(200)
-                        self.send_header("Content-type", "application/json")
-                        self.end_headers()
-                        self.wfile.write(json.dumps(rsessions).encode("utf-8"))
-                    else:
-                        sid = self.path.split("/")[-1]
-                        if not "ADMIN" == session_user.get("role") and not session_user[
-                            "username"
-                        ] == sessions[sid].get("user"):
-                            self.send_response(403)
-                            self.send_header("Content-type", "application/json")
-                            self.end_headers()
-                            self.wfile.write(b"Access denied")
-                            log_request(
-                                self, "Unauthorized access attempt", logging.WARNING
-                            )
-                            return
-                        self.send_response(200)
-                        self.send_header("Content-type", "application/json")
-                        self.end_headers()
-                        self.wfile.write(json.dumps(sessions[sid]).encode("utf-8"))
-                        return
-                else:
-                    self.send_response(200)
-                    self.send_header("Content-type", "application/json")
-                    self.end_headers()
-                    self.wfile.write(json.dumps(parking_lots[lid]).encode("utf-8"))
-                    return
-            self.send_response(200)
+        query = parse_qs(urlparse(self.path).query)
+
+        level = query.get("level", [None])[0]
+        path_q = query.get("path", [None])[0]
+        method = query.get("method", [None])[0]
+        text = query.get("q", [None])[0]
+        limit = int(query.get("limit", [100])[0])
+        try:
+            start = parse_log_time(query.get("from", [None])[0])
+            end = parse_log_time(query.get("to", [None])[0], end_of_day=True)
+        except ValueError:
+            self.send_response(400)
             self.send_header("Content-type", "application/json")
             self.end_headers()
-            self.wfile.write(json.dumps(parking_lots).encode("utf-8"))
-
-        elif self.path.startswith("/reservations/"):
-            log_request(self, "Reservations endpoint called")
-
-            reservations = load_reservation_data()
-            rid = self.path.replace("/reservations/", "")
-            if rid:
-                if rid in reservations:
-                    token = self.headers.get("Authorization")
-                    if not token or not get_session(token):
-                        self.send_response(401)
-                        self.send_header("Content-type", "application/json")
-                        self.end_headers()
-                        self.wfile.write(
-                            b"Unauthorized: Invalid or missing session token"
-                        )
-                        return
-                    session_user = get_session(token)
-                    if not "ADMIN" == session_user.get("role") and not session_user[
-                        "username"
-                    ] == reservations[rid].get("user"):
-                        self.send_response(403)
-                        self.send_header("Content-type", "application/json")
-                        self.end_headers()
-                        self.wfile.write(b"Access denied")
-                        return
-                    save_reservation_data(reservations)
-                    self.send_response(200)
-                    self.send_header("Content-type", "application/json")
-                    self.end_headers()
-                    self.wfile.write(json.dumps(reservations[rid]).encode("utf-8"))
-                    return
-                else:
-                    self.send_response(404)
-                    self.send_header("Content-type", "application/json")
-                    self.end_headers()
-                    self.wfile.write(b"Reservation not found")
-                    return
+            self.wfile.write(
+                json_codec.encode({"error": "from and to must be ISO dates or times (UTC)"})
+            )
+            return
 
-        elif self.path == "/payments":
-            log_request(self, "Payments endpoint called")
+        results = search_logs(
+            level=level, path=path_q, method=method, text=text, limit=limit,
+            start=start, end=end,
+        )
 
-            token = self.headers.get("Authorization")
-            if not token or not get_session(token):
-                self.send_response(401)
-                self.send_header("Content-type", "application/json")
-                self.end_headers()
-                self.wfile.write(b"Unauthorized: Invalid or missing session token")
-                return
+        self.send_response(200)
+        self.send_header("Content-type", "application/json")
+        self.end_headers()
+        self.wfile.write(json_codec.encode(results))
+        return
 
-            session_user = get_session(token)
-            payments = [
-                p
-                for p in load_payment_data()
-                if p.get("initiator") == session_user["username"]
-            ]
+    @routes.route("GET", "/logout")
+    def logout(self):
+        log_request(self, "Logout endpoint called")
 
+        token = self.headers.get("Authorization")
+        if token and self.get_session(token):
+            remove_session(token)
             self.send_response(200)
             self.send_header("Content-type", "application/json")
             self.end_headers()
-            self.wfile.write(json.dumps(payments).encode("utf-8"))
+            self.wfile.write(b"User logged out")
             return
-
-        elif self.path.startswith("/payments/"):
-            log_request(self, "Payments endpoint called")
-
-            token = self.headers.get("Authorization")
-            if not token or not get_session(token):
-                self.send_response(401)
-                self.send_header("Content-type", "application/json")
-                self.end_headers()
-                self.wfile.write(b"Unauthorized: Invalid or missing session token")
-                return
-            payments = []
-            session_user = get_session(token)
-            user = self.path.replace("/payments/", "")
-            if not "ADMIN" == session_user.get("role"):
-                self.send_response(403)
-                self.send_header("Content-type", "application/json")
-                self.end_headers()
-                self.wfile.write(b"Access denied")
-                return
-            for payment in load_payment_data():
-                if payment["username"] == session_user["username"]:
-                    payments.append(payment)
-            self.send_response(200)
+        self.send_response(400)
+        self.send_header("Content-type", "application/json")
+        self.end_headers()
+        self.wfile.write(b"Invalid session token")
+
+    @routes.route("GET", "/parking-lots")
+    @routes.route("GET", "/parking-lots/")
+    def list_parking_lots(self):
+        log_request(self, "Parking lots endpoint called")
+
+        query = listing.query_params(self.path)
+        try:
+            limit = listing.parse_limit(query.get("limit"))
+            after = listing.parse_cursor(query.get("cursor"))
+        except listing.QueryError as error:
+            self.send_response(400)
             self.send_header("Content-type", "application/json")
             self.end_headers()
-            self.wfile.write(json.dumps(payments).encode("utf-8"))
+            self.wfile.write(json_codec.encode({"error": str(error)}))
             return
-
-        elif self.path == "/billing":
-            log_request(self, "Billing endpoint called")
-
-            token = self.headers.get("Authorization")
-            if not token or not get_session(token):
-                self.send_response(401)
-                self.send_header("Content-type", "application/json")
-                self.end_headers()
-                self.wfile.write(b"Unauthorized: Invalid or missing session token")
-                return
-            data = []
-            session_user = get_session(token)
-            for pid, parkinglot in load_parking_lot_data().items():
-                for sid, session in load_json(
-                    f"data/pdata/p{pid}-sessions.json"
-                ).items():
-                    if session["user"] == session_user["username"]:
-                        amount, hours, days = sc.calculate_price(
-                            parkinglot, sid, session
-                        )
-                        transaction = sc.generate_payment_hash(sid, session)
-                        payed = sc.check_payment_amount(transaction)
-                        data.append(
-                            {
-                                "session": {
-                                    k: v
-                                    for k, v in session.items()
-                                    if k in ["licenseplate", "started", "stopped"]
-                                }
-                                | {"hours": hours, "days": days},
-                                "parking": {
-                                    k: v
-                                    for k, v in parkinglot.items()
-                                    if k in ["name", "location", "tariff", "daytariff"]
-                                },
-                                "amount": amount,
-                                "thash": transaction,
-                                "payed": payed,
-                                "balance": amount - payed,
-                            }
-                        )
-            self.send_response(200)
+        fields = listing.parse_fields(query.get("fields"))
+        filters = {
+            name: query[name].lower()
+            for name in ("name", "location")
+            if name in query
+        }
+        # Each page, filter and field selection is a version of its own
+        etag = make_etag(parking_lot_version(), urlsplit(self.path).query)
+        if self.not_modified(etag):
+            return
+        parking_lots = load_parking_lot_data()
+        lots = (
+            (lid, parking_lots[lid])
+            for lid in sorted(parking_lots, key=lambda lid: int(lid) if lid.isdigit() else 0)
+            if (after is None or (lid.isdigit() and int(lid) > after))
+            and all(
+                text in str(parking_lots[lid].get(name, "")).lower()
+                for name, text in filters.items()
+            )
+        )
+        page, cursor = listing.paginate(lots, limit)
+        self.send_response(200)
+        self.send_header("Content-type", "application/json")
+        self.send_etag(etag)
+        if cursor is not None:
+            self.send_header("X-Next-Cursor", cursor)
+        self.stream_body(
+            json_codec.iter_object((lid, listing.project(lot, fields)) for lid, lot in page)
+        )
+
+    @routes.route("GET", "/parking-lots/{lid:id}")
+    def show_parking_lot(self, lid):
+        log_request(self, "Parking lots endpoint called")
+
+        etag = make_etag(parking_lot_version(), lid)
+        parking_lot = get_parking_lot(lid)
+        if parking_lot is None:
+            self.send_response(404)
             self.send_header("Content-type", "application/json")
             self.end_headers()
-            self.wfile.write(json.dumps(data, default=str).encode("utf-8"))
+            self.wfile.write(b"Parking lot not found")
             return
-
-        elif self.path.startswith("/billing/"):
+        if self.not_modified(etag):
+            return
+        self.send_response(200)
+        self.send_header("Content-type", "application/json")
+        self.send_etag(etag)
+        self.end_headers()
+        self.wfile.write(json_codec.encode(parking_lot))
+        return
+
+    @routes.route("GET", "/parking-lots/{lid:id}/sessions")
+    def list_lot_sessions(self, lid):
+        log_request(self, "Parking lots endpoint called")
+
+        token = self.headers.get("Authorization")
+        parking_lot = get_parking_lot(lid)
+        if parking_lot is None:
+            self.send_response(404)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"Parking lot not found")
+            return
+        if not token or not self.get_session(token):
+            self.send_response(401)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"Unauthorized: Invalid or missing session token")
+            return
+        session_user = self.get_session(token)
+        query = listing.query_params(self.path)
+        try:
+            limit = listing.parse_limit(query.get("limit"))
+            after = listing.parse_cursor(query.get("cursor"))
+            start = listing.parse_date(query.get("from"))
+            end = listing.parse_date(query.get("to"), end_of_day=True)
+            state = listing.parse_choice("state", query.get("state"), ("open", "closed"))
+        except listing.QueryError as error:
+            self.send_response(400)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(json_codec.encode({"error": str(error)}))
+            return
+        fields = listing.parse_fields(query.get("fields"))
+        admin = "ADMIN" == session_user.get("role")
+        sessions = iter_parking_sessions(
+            lid,
+            after=after,
+            start=start,
+            end=end,
+            # Users only ever see their own sessions
+            user=query.get("user") if admin else session_user["username"],
+            state=state,
+            licenseplate=query.get("licenseplate"),
+        )
+        page, cursor = listing.paginate(sessions, limit)
+        self.send_response(200)
+        self.send_header("Content-type", "application/json")
+        if cursor is not None:
+            self.send_header("X-Next-Cursor", cursor)
+        if admin:
+            self.stream_body(json_codec.iter_object(
+                (sid, listing.project(session, fields)) for sid, session in page
+            ))
+        else:
+            self.stream_body(json_codec.iter_array(
+                listing.project(session, fields) for sid, session in page
+            ))
+
+    @routes.route("GET", "/parking-lots/{lid:id}/sessions/{sid:id}")
+    def show_lot_session(self, lid, sid):
+        log_request(self, "Parking lots endpoint called")
+
+        token = self.headers.get("Authorization")
+        parking_lot = get_parking_lot(lid)
+        if parking_lot is None:
+            self.send_response(404)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"Parking lot not found")
+            return
+        if not token or not self.get_session(token):
+            self.send_response(401)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"Unauthorized: Invalid or missing session token")
+            return
+        session_user = self.get_session(token)
+        session = get_parking_session(lid, sid)
+        if session is None:
+            self.send_response(404)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"Session not found")
+            return
+        if not "ADMIN" == session_user.get("role") and not session_user[
+            "username"
+        ] == session.get("user"):
+            self.send_response(403)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"Access denied")
+            log_request(self, "Unauthorized access attempt", logging.WARNING)
+            return
+        self.send_response(200)
+        self.send_header("Content-type", "application/json")
+        self.end_headers()
+        self.wfile.write(json_codec.encode(session))
+        return
+
+    @routes.route("GET", "/reservations/{rid:id}")
+    def show_reservation(self, rid):
+        log_request(self, "Reservations endpoint called")
+
+        reservation = get_reservation(rid)
+        if reservation is not None:
             token = self.headers.get("Authorization")
-            if not token or not get_session(token):
+            if not token or not self.get_session(token):
                 self.send_response(401)
                 self.send_header("Content-type", "application/json")
                 self.end_headers()
                 self.wfile.write(b"Unauthorized: Invalid or missing session token")
                 return
-            data = []
-            session_user = get_session(token)
-            user = self.path.replace("/billing/", "")
-            if not "ADMIN" == session_user.get("role"):
+            session_user = self.get_session(token)
+            if not "ADMIN" == session_user.get("role") and not session_user[
+                "username"
+            ] == reservation.get("user"):
                 self.send_response(403)
                 self.send_header("Content-type", "application/json")
                 self.end_headers()
                 self.wfile.write(b"Access denied")
                 return
-            for pid, parkinglot in load_parking_lot_data().items():
-                for sid, session in load_json(
-                    f"data/pdata/p{pid}-sessions.json"
-                ).items():
-                    if session["user"] == user:
-                        amount, hours, days = sc.calculate_price(
-                            parkinglot, sid, session
-                        )
-                        transaction = sc.generate_payment_hash(sid, session)
-                        payed = sc.check_payment_amount(transaction)
-                        data.append(
-                            {
-                                "session": {
-                                    k: v
-                                    for k, v in session.items()
-                                    if k in ["licenseplate", "started", "stopped"]
-                                }
-                                | {"hours": hours, "days": days},
-                                "parking": {
-                                    k: v
-                                    for k, v in parkinglot.items()
-                                    if k in ["name", "location", "tariff", "daytariff"]
-                                },
-                                "amount": amount,
-                                "thash": transaction,
-                                "payed": payed,
-                                "balance": amount - payed,
-                            }
-                        )
             self.send_response(200)
             self.send_header("Content-type", "application/json")
             self.end_headers()
-            self.wfile.write(json.dumps(data, default=str).encode("utf-8"))
+            self.wfile.write(json_codec.encode(reservation))
+            return
+        else:
+            self.send_response(404)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"Reservation not found")
             return
 
-        elif self.path.startswith("/vehicles"):
-            token = self.headers.get("Authorization")
-            if not token or not get_session(token):
-                self.send_response(401)
-                self.send_header("Content-type", "application/json")
-                self.end_headers()
-                self.wfile.write(b"Unauthorized: Invalid or missing session token")
-                return
-            session_user = get_session(token)
-            if self.path.endswith("/reservations"):
-                vid = self.path.split("/")[2]
-                vehicles = load_json("data/vehicles.json")
-                uvehicles = vehicles.get(session_user["username"], {})
-                if vid not in uvehicles:
-                    self.send_response(404)
-                    self.send_header("Content-type", "application/json")
-                    self.end_headers()
-                    self.wfile.write(b"Not found!")
-                    return
-                self.send_response(200)
-                self.send_header("Content-type", "application/json")
-                self.end_headers()
-                self.wfile.write(json.dumps([]).encode("utf-8"))
-                return
-            elif self.path.endswith("/history"):
-                vid = self.path.split("/")[2]
-                vehicles = load_json("data/vehicles.json")
-                uvehicles = vehicles.get(session_user["username"], {})
-                if vid not in uvehicles:
-                    self.send_response(404)
-                    self.send_header("Content-type", "application/json")
-                    self.end_headers()
-                    self.wfile.write(b"Not found!")
-                    return
-                self.send_response(200)
-                self.send_header("Content-type", "application/json")
-                self.end_headers()
-                self.wfile.write(json.dumps([]).encode("utf-8"))
-                return
-            else:
-                vehicles = load_json("data/vehicles.json")
-                users = load_json("data/users.json")
-                user = session_user["username"]
-                if "ADMIN" == session_user.get("role") and self.path != "/vehicles":
-                    user = self.path.replace("/vehicles/", "")
-                    if user not in [u["username"] for u in users]:
-                        self.send_response(404)
-                        self.send_header("Content-type", "application/json")
-                        self.end_headers()
-                        self.wfile.write(b"User not found")
-                        return
-                self.send_response(200)
-                self.send_header("Content-type", "application/json")
-                self.end_headers()
-                self.wfile.write(
-                    json.dumps(vehicles.get(user, {}), default=str).encode("utf-8")
-                )
-                return
-
+    @routes.route("GET", "/payments")
+    def list_payments(self):
+        log_request(self, "Payments endpoint called")
 
-def search_logs(level=None, path=None, method=None, text=None, limit=100):
-    results = []
+        token = self.headers.get("Authorization")
+        if not token or not self.get_session(token):
+            self.send_response(401)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"Unauthorized: Invalid or missing session token")
+            return
 
-    with open("logs/api.log", "r") as f:
-        for line in reversed(f.readlines()):
-            try:
-                log = json.loads(line)
+        session_user = self.get_session(token)
+        payments = load_user_payments(session_user["username"])
 
-                if level and log["level"] != level:
-                    continue
-                if path and log["path"] != path:
-                    continue
-                if method and log["method"] != method:
-                    continue
-                if text and text not in log["message"]:
-                    continue
+        self.send_response(200)
+        self.send_header("Content-type", "application/json")
+        self.stream_body(json_codec.iter_array(payments))
+        return
 
-                results.append(log)
-                if len(results) >= limit:
-                    break
-            except json.JSONDecodeError:
-                continue
+    @routes.route("GET", "/payments/{user}")
+    def list_user_payments(self, user):
+        log_request(self, "Payments endpoint called")
 
-    return results
+        token = self.headers.get("Authorization")
+        if not token or not self.get_session(token):
+            self.send_response(401)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"Unauthorized: Invalid or missing session token")
+            return
+        payments = []
+        session_user = self.get_session(token)
+        if not "ADMIN" == session_user.get("role"):
+            self.send_response(403)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"Access denied")
+            return
+        for payment in load_payment_data():
+            if payment["username"] == session_user["username"]:
+                payments.append(payment)
+        self.send_response(200)
+        self.send_header("Content-type", "application/json")
+        self.end_headers()
+        self.wfile.write(json_codec.encode(payments))
+        return
+
+    @routes.route("GET", "/billing")
+    def show_billing(self):
+        log_request(self, "Billing endpoint called")
+
+        token = self.headers.get("Authorization")
+        if not token or not self.get_session(token):
+            self.send_response(401)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"Unauthorized: Invalid or missing session token")
+            return
+        session_user = self.get_session(token)
+        self.send_response(200)
+        self.send_header("Content-type", "application/json")
+        self.stream_body(json_codec.iter_array(sc.iter_billing(session_user["username"])))
+        return
+
+    @routes.route("GET", "/billing/{user}")
+    def show_user_billing(self, user):
+        token = self.headers.get("Authorization")
+        if not token or not self.get_session(token):
+            self.send_response(401)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"Unauthorized: Invalid or missing session token")
+            return
+        session_user = self.get_session(token)
+        if not "ADMIN" == session_user.get("role"):
+            self.send_response(403)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"Access denied")
+            return
+        self.send_response(200)
+        self.send_header("Content-type", "application/json")
+        self.stream_body(json_codec.iter_array(sc.iter_billing(user)))
+        return
+
+    @routes.route("GET", "/vehicles/{vid}/reservations")
+    def list_vehicle_reservations(self, vid):
+        token = self.headers.get("Authorization")
+        if not token or not self.get_session(token):
+            self.send_response(401)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"Unauthorized: Invalid or missing session token")
+            return
+        session_user = self.get_session(token)
+        uvehicles = load_user_vehicles(session_user["username"])
+        if vid not in uvehicles:
+            self.send_response(404)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"Not found!")
+            return
+        self.send_response(200)
+        self.send_header("Content-type", "application/json")
+        self.end_headers()
+        self.wfile.write(json_codec.encode([]))
+        return
+
+    @routes.route("GET", "/vehicles/{vid}/history")
+    def vehicle_history(self, vid):
+        token = self.headers.get("Authorization")
+        if not token or not self.get_session(token):
+            self.send_response(401)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"Unauthorized: Invalid or missing session token")
+            return
+        session_user = self.get_session(token)
+        uvehicles = load_user_vehicles(session_user["username"])
+        if vid not in uvehicles:
+            self.send_response(404)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"Not found!")
+            return
+        self.send_response(200)
+        self.send_header("Content-type", "application/json")
+        self.end_headers()
+        self.wfile.write(json_codec.encode([]))
+        return
+
+    @routes.route("GET", "/vehicles")
+    @routes.route("GET", "/vehicles/{username}")
+    def list_vehicles(self, username=None):
+        token = self.headers.get("Authorization")
+        if not token or not self.get_session(token):
+            self.send_response(401)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"Unauthorized: Invalid or missing session token")
+            return
+        session_user = self.get_session(token)
+        user = session_user["username"]
+        if "ADMIN" == session_user.get("role") and username is not None:
+            user = username
+            if get_user(user) is None:
+                self.send_response(404)
+                self.send_header("Content-type", "application/json")
+                self.end_headers()
+                self.wfile.write(b"User not found")
+                return
+        self.send_response(200)
+        self.send_header("Content-type", "application/json")
+        self.end_headers()
+        self.wfile.write(json_codec.encode(load_user_vehicles(user)))
+        return
+
+
+def search_logs(level=None, path=None, method=None, text=None, limit=100,
+                start=None, end=None):
+    """Return the latest limit log records that match, newest first.
+
+    Searches api.log and its rotated backups through their side index,
+    see log_index. start and end are UTC datetimes.
+    """
+    return log_index.search(
+        handler.baseFilename,
+        handler.backupCount,
+        level=level,
+        path=path,
+        method=method,
+        text=text,
+        start=start,
+        end=end,
+        limit=limit,
+    )
 
 
 def log_search_ui():
@@ -1416,12 +1756,224 @@ def log_search_ui():
     print(f"Found {len(results)} results.")
 
 
-def run_server():
-    server = HTTPServer(("localhost", 8000), RequestHandler)
-    print("Server running on http://localhost:8000")
+class ThreadPoolHTTPServer(HTTPServer):
+    """HTTPServer that serves connections on a bounded pool of worker threads.
+
+    When every worker is busy the accept loop blocks, so further connections
+    wait in the listen backlog instead of piling up in memory.
+
+    Between requests a kept-alive connection gives its worker back. It is
+    parked with a selector thread, which hands it to the pool again once the
+    next request arrives and closes it after KEEPALIVE_TIMEOUT idle seconds,
+    so idle clients can't keep the workers from new connections.
+    """
+
+    parks_idle_connections = True
+
+    def __init__(self, server_address, handler_class, threads=8, backlog=64):
+        self.request_queue_size = backlog
+        self._slots = threading.BoundedSemaphore(threads)
+        self._pool = ThreadPoolExecutor(
+            max_workers=threads, thread_name_prefix="api-worker"
+        )
+        self._parked = []
+        self._parked_guard = threading.Lock()
+        self._closing = False
+        # Workers hand over parked connections through _parked and wake the
+        # selector thread with a byte on this socket pair. All of this is set
+        # up before binding: when the bind fails TCPServer calls server_close
+        # before raising
+        self._wakeup, self._wakeup_sender = socket.socketpair()
+        self._idle_thread = threading.Thread(
+            target=self._watch_idle, name="api-idle", daemon=True
+        )
+        self._idle_thread.start()
+        super().__init__(server_address, handler_class)
+
+    def finish_request(self, request, client_address):
+        return self.RequestHandlerClass(request, client_address, self)
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        try:
+            self._pool.submit(self._process_request_worker, request, client_address)
+        except RuntimeError:
+            # Pool already shut down
+            self._slots.release()
+            self.shutdown_request(request)
+
+    def _process_request_worker(self, request, client_address, handler=None):
+        try:
+            if handler is None:
+                handler = self.finish_request(request, client_address)
+            else:
+                handler.resume()
+        except Exception:
+            handler = None
+            self.handle_error(request, client_address)
+        finally:
+            if handler is not None and handler.idle:
+                self._park(handler)
+            else:
+                self.shutdown_request(request)
+            self._slots.release()
+
+    def _park(self, handler):
+        with self._parked_guard:
+            if not self._closing:
+                self._parked.append(handler)
+                handler = None
+        if handler is not None:
+            self._close_idle(handler)
+            return
+        try:
+            self._wakeup_sender.send(b"\0")
+        except OSError:
+            pass  # closing down
+
+    def _close_idle(self, handler):
+        handler.idle = False
+        try:
+            handler.finish()
+        except OSError:
+            pass
+        self.shutdown_request(handler.request)
+
+    def _resume(self, handler):
+        self._slots.acquire()
+        try:
+            self._pool.submit(
+                self._process_request_worker,
+                handler.request, handler.client_address, handler,
+            )
+        except RuntimeError:
+            self._slots.release()
+            self._close_idle(handler)
+
+    def _watch_idle(self):
+        selector = selectors.DefaultSelector()
+        selector.register(self._wakeup, selectors.EVENT_READ)
+        deadlines = {}
+        try:
+            while True:
+                timeout = None
+                if deadlines:
+                    timeout = max(0, min(deadlines.values()) - time.monotonic())
+                for key, _ in selector.select(timeout):
+                    if key.fileobj is self._wakeup:
+                        self._wakeup.recv(4096)
+                        continue
+                    selector.unregister(key.fileobj)
+                    del deadlines[key.data]
+                    self._resume(key.data)
+                with self._parked_guard:
+                    parked, self._parked = self._parked, []
+                    closing = self._closing
+                if closing:
+                    for handler in list(deadlines) + parked:
+                        self._close_idle(handler)
+                    return
+                now = time.monotonic()
+                for handler in parked:
+                    selector.register(handler.connection, selectors.EVENT_READ, handler)
+                    deadlines[handler] = now + KEEPALIVE_TIMEOUT
+                for handler, deadline in list(deadlines.items()):
+                    if deadline <= now:
+                        selector.unregister(handler.connection)
+                        del deadlines[handler]
+                        self._close_idle(handler)
+        finally:
+            selector.close()
+
+    def server_close(self):
+        with self._parked_guard:
+            self._closing = True
+        self._wakeup_sender.send(b"\0")
+        self._idle_thread.join()
+        self._wakeup.close()
+        self._wakeup_sender.close()
+        super().server_close()
+        self._pool.shutdown(wait=True)
+
+
+def run_server(threads=None, backlog=None):
+    threads = threads or int(os.getenv("API_THREADS", 8))
+    backlog = backlog or int(os.getenv("API_BACKLOG", 64))
+    server = ThreadPoolHTTPServer(
+        ("localhost", 8000), RequestHandler, threads=threads, backlog=backlog
+    )
+    print(f"Server running on http://localhost:8000 ({threads} threads)")
     server.serve_forever()
 
 
+class ReusePortHTTPServer(ThreadPoolHTTPServer):
+    """ThreadPoolHTTPServer whose socket is bound with SO_REUSEPORT, so that
+    every prefork worker can listen on the same port and the kernel spreads
+    incoming connections over them.
+    """
+
+    def server_bind(self):
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+
+def run_prefork(workers=None, threads=None, backlog=None):
+    if not hasattr(os, "fork") or not hasattr(socket, "SO_REUSEPORT"):
+        raise SystemExit("Prefork mode needs fork() and SO_REUSEPORT support")
+
+    workers = workers or int(os.getenv("API_WORKERS", os.cpu_count() or 1))
+    threads = threads or int(os.getenv("API_THREADS", 8))
+    backlog = backlog or int(os.getenv("API_BACKLOG", 64))
+
+    # Login sessions must be visible to every worker; the data files are
+    # shared through the file system and guarded by flock() in storage_utils.
+    # Saves held back by write-behind would only be seen by one worker
+    set_write_behind(0)
+    manager = None
+    if not is_shared():
+        manager = multiprocessing.Manager()
+        use_store(manager.dict())
+
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            try:
+                server = ReusePortHTTPServer(
+                    ("localhost", 8000), RequestHandler, threads=threads, backlog=backlog
+                )
+                server.serve_forever()
+            finally:
+                os._exit(1)
+        children.append(pid)
+
+    print(
+        f"Server running on http://localhost:8000 "
+        f"({workers} workers x {threads} threads)"
+    )
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        for pid in children:
+            os.waitpid(pid, 0)
+    except KeyboardInterrupt:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in children:
+            os.waitpid(pid, 0)
+    finally:
+        if manager is not None:
+            manager.shutdown()
+
+
 def start_server_thread():
     t = threading.Thread(target=run_server, daemon=True)
     t.start()
@@ -1434,6 +1986,9 @@ if __name__ == "__main__":
         # Interactive log search mode (local dev only)
         while True:
             log_search_ui()
+    elif "--prefork" in sys.argv:
+        # One process per core sharing port 8000 (Linux / macOS)
+        run_prefork()
     else:
         # Normal server mode (CI / production)
         run_server()
@@ -1,5 +1,5 @@
 from datetime import datetime
-from storage_utils import load_payment_data
+from storage_utils import load_payment_totals, load_billing_ledger, get_parking_lot
 from hashlib import md5
 import math
 import uuid
@@ -41,11 +41,38 @@ def generate_transaction_validation_hash():
     return str(uuid.uuid4())
 
 def check_payment_amount(hash):
-    payments = load_payment_data()
-    total = 0
+    return load_payment_totals().get(hash, 0)
 
-    for payment in payments:
-        if payment["transaction"] == hash:
-            total += payment["amount"]
 
-    return total
\ No newline at end of file
+def iter_billing(username):
+    """Yield the billing rows of a user one at a time."""
+    totals = load_payment_totals()
+    for entry in load_billing_ledger(username).values():
+        parkinglot = get_parking_lot(entry["parkinglot"])
+        if parkinglot is None:
+            continue
+        sid, session = entry["sid"], entry["session"]
+        amount, hours, days = calculate_price(parkinglot, sid, session)
+        transaction = generate_payment_hash(sid, session)
+        payed = totals.get(transaction, 0)
+        yield {
+            "session": {
+                k: v
+                for k, v in session.items()
+                if k in ["licenseplate", "started", "stopped"]
+            }
+            | {"hours": hours, "days": days},
+            "parking": {
+                k: v
+                for k, v in parkinglot.items()
+                if k in ["name", "location", "tariff", "daytariff"]
+            },
+            "amount": amount,
+            "thash": transaction,
+            "payed": payed,
+            "balance": amount - payed,
+        }
+
+
+def build_billing(username):
+    return list(iter_billing(username))
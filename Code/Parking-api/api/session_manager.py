@@ -1,4 +1,198 @@
-sessions = {}
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", 2 * 60 * 60))
+MAX_AGE = float(os.getenv("SESSION_MAX_AGE", 24 * 60 * 60))
+MAX_SESSIONS = int(os.getenv("SESSION_MAX", 100_000))
+SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", 60))
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+SESSION_DB = os.getenv("SESSION_DB", "data/sessions.db")
+TOKEN_MODE = os.getenv("SESSION_TOKENS", "store")
+
+
+class SessionStore:
+    """Login sessions by token.
+
+    A session is dropped once it has not been used for idle_ttl seconds or
+    max_age seconds after login, whichever comes first. At most
+    max_sessions are kept; past that the least recently used one goes.
+    Expired sessions are removed when they are looked up, and by a sweep
+    that runs at most once per sweep_interval as part of the regular calls.
+
+    Entries are (user, created, last_seen) tuples in entries, which may be
+    a shared mapping such as a multiprocessing.Manager dict or the SQLite
+    table of session_sqlite. Times are wall clock, so they stay valid for
+    entries kept across a restart.
+    """
+
+    def __init__(
+        self,
+        entries=None,
+        idle_ttl=IDLE_TTL,
+        max_age=MAX_AGE,
+        max_sessions=MAX_SESSIONS,
+        sweep_interval=SWEEP_INTERVAL,
+        clock=time.time,
+    ):
+        self._entries = OrderedDict() if entries is None else entries
+        self._ordered = isinstance(self._entries, OrderedDict)
+        self._lock = threading.RLock()
+        self.idle_ttl = idle_ttl
+        self.max_age = max_age
+        self.max_sessions = max_sessions
+        self.sweep_interval = sweep_interval
+        self._clock = clock
+        self._last_sweep = clock()
+        self.expired = 0
+        self.evicted = 0
+
+    def _is_expired(self, entry, now):
+        _, created, last_seen = entry
+        return now - last_seen > self.idle_ttl or now - created > self.max_age
+
+    def _maybe_sweep(self, now):
+        if now - self._last_sweep >= self.sweep_interval:
+            self.sweep(now)
+
+    def sweep(self, now=None):
+        """Remove every expired session, returning how many there were."""
+        now = self._clock() if now is None else now
+        with self._lock:
+            self._last_sweep = now
+            if hasattr(self._entries, "delete_expired"):
+                count = self._entries.delete_expired(
+                    now - self.idle_ttl, now - self.max_age
+                )
+                self.expired += count
+                return count
+            expired = [
+                token
+                for token, entry in list(self._entries.items())
+                if self._is_expired(entry, now)
+            ]
+            for token in expired:
+                self._entries.pop(token, None)
+            self.expired += len(expired)
+            return len(expired)
+
+    def _evict(self):
+        while len(self._entries) > self.max_sessions:
+            if self._ordered:
+                self._entries.popitem(last=False)
+            elif hasattr(self._entries, "pop_least_recent"):
+                self._entries.pop_least_recent()
+            else:
+                entries = list(self._entries.items())
+                token = min(entries, key=lambda item: item[1][2])[0]
+                self._entries.pop(token, None)
+            self.evicted += 1
+
+    def get(self, token, default=None):
+        now = self._clock()
+        with self._lock:
+            self._maybe_sweep(now)
+            entry = self._entries.get(token)
+            if entry is None:
+                return default
+            if self._is_expired(entry, now):
+                self._entries.pop(token, None)
+                self.expired += 1
+                return default
+            user, created, last_seen = entry
+            # Skip the write for back-to-back calls, it is a round trip
+            # for a shared store
+            if now - last_seen >= 1:
+                self._entries[token] = (user, created, now)
+            if self._ordered:
+                self._entries.move_to_end(token)
+            return user
+
+    def __getitem__(self, token):
+        user = self.get(token)
+        if user is None:
+            raise KeyError(token)
+        return user
+
+    def __setitem__(self, token, user):
+        now = self._clock()
+        with self._lock:
+            self._maybe_sweep(now)
+            self._entries[token] = (user, now, now)
+            if self._ordered:
+                self._entries.move_to_end(token)
+            self._evict()
+
+    def __contains__(self, token):
+        return self.get(token) is not None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def pop(self, token, default=None):
+        with self._lock:
+            entry = self._entries.pop(token, None)
+        return default if entry is None else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def entries(self):
+        with self._lock:
+            return dict(self._entries.items())
+
+    def stats(self):
+        with self._lock:
+            return {
+                "live": len(self._entries),
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "max": self.max_sessions,
+            }
+
+
+if TOKEN_MODE == "signed":
+    import signed_tokens
+
+if SESSION_BACKEND == "sqlite":
+    from session_sqlite import SqliteSessionEntries
+
+    sessions = SessionStore(SqliteSessionEntries(SESSION_DB))
+else:
+    sessions = SessionStore()
+
+
+def is_shared():
+    """True when the sessions are already visible to every worker process."""
+    return not isinstance(sessions._entries, OrderedDict)
+
+
+def use_store(store):
+    """Keep sessions in store from now on, e.g. a multiprocessing.Manager
+    dict shared by all worker processes. Existing sessions are copied over.
+    """
+    global sessions
+    store.update(sessions.entries())
+    sessions = SessionStore(
+        store,
+        idle_ttl=sessions.idle_ttl,
+        max_age=sessions.max_age,
+        max_sessions=sessions.max_sessions,
+        sweep_interval=sessions.sweep_interval,
+    )
+
+
+def create_session(user):
+    """Log user in and return the token for the Authorization header."""
+    if TOKEN_MODE == "signed":
+        return signed_tokens.issue(user, MAX_AGE)
+    token = str(uuid.uuid4())
+    add_session(token, user)
+    return token
 
 
 def add_session(token, user):
@@ -6,13 +200,22 @@ def add_session(token, user):
 
 
 def remove_session(token):
+    if TOKEN_MODE == "signed" and signed_tokens.is_signed(token):
+        return signed_tokens.revoke(token)
     return sessions.pop(token, None)
 
 
 def get_session(token):
+    if TOKEN_MODE == "signed" and signed_tokens.is_signed(token):
+        return signed_tokens.verify(token)
     return sessions.get(token)
 
 
+def session_stats():
+    """Live sessions and how many expired or were evicted in this process."""
+    return sessions.stats()
+
+
 # def get_session(token):
 #     # Voor testen: accepteer altijd "abc123"
 #     if token == "abc123":
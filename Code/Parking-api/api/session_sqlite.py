@@ -0,0 +1,146 @@
+"""SQLite session entries, enabled with SESSION_BACKEND=sqlite.
+
+Keeps the (user, created, last_seen) entries of session_manager in a
+database file (SESSION_DB, default data/sessions.db), so logins survive a
+restart and every worker process sees the same sessions. Lookups are
+served from an in-process cache, which is dropped whenever SQLite reports
+that another connection changed the database.
+"""
+import json
+import os
+import sqlite3
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    token TEXT PRIMARY KEY,
+    user TEXT NOT NULL,
+    created REAL NOT NULL,
+    last_seen REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_last_seen ON sessions (last_seen);
+
+-- Kept up to date by triggers, so len() doesn't count the whole table
+CREATE TABLE IF NOT EXISTS session_count (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    live INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO session_count (id, live) SELECT 1, COUNT(*) FROM sessions;
+CREATE TRIGGER IF NOT EXISTS sessions_count_insert AFTER INSERT ON sessions
+BEGIN
+    UPDATE session_count SET live = live + 1 WHERE id = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS sessions_count_delete AFTER DELETE ON sessions
+BEGIN
+    UPDATE session_count SET live = live - 1 WHERE id = 1;
+END;
+"""
+
+
+class SqliteSessionEntries:
+    """Mapping of token -> (user, created, last_seen) stored in SQLite.
+
+    Not thread-safe on its own; SessionStore serialises access to it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._pid = None
+        self._cache = {}
+        self._version = None
+
+    def _connect(self):
+        if self._conn is not None and self._pid == os.getpid():
+            return self._conn
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(
+            self.path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.executescript("BEGIN IMMEDIATE;" + SCHEMA + "COMMIT;")
+        self._conn = conn
+        self._pid = os.getpid()
+        self._cache = {}
+        self._version = None
+        return conn
+
+    def _fresh_cache(self):
+        conn = self._connect()
+        # data_version only changes for commits made by other connections
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._version:
+            self._cache.clear()
+            self._version = version
+        return conn
+
+    def get(self, token, default=None):
+        conn = self._fresh_cache()
+        entry = self._cache.get(token)
+        if entry is None:
+            row = conn.execute(
+                "SELECT user, created, last_seen FROM sessions WHERE token = ?",
+                (token,),
+            ).fetchone()
+            if row is None:
+                return default
+            entry = (json.loads(row[0]), row[1], row[2])
+            self._cache[token] = entry
+        return entry
+
+    def __setitem__(self, token, entry):
+        user, created, last_seen = entry
+        # Sessions only need who is logged in; keep password hashes off disk
+        user = {key: value for key, value in user.items() if key != "password"}
+        # An upsert rather than INSERT OR REPLACE, whose implicit delete
+        # would not run the count trigger
+        self._fresh_cache().execute(
+            "INSERT INTO sessions (token, user, created, last_seen) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT (token) DO UPDATE SET user = excluded.user,"
+            " created = excluded.created, last_seen = excluded.last_seen",
+            (token, json.dumps(user, default=str), created, last_seen),
+        )
+        self._cache[token] = (user, created, last_seen)
+
+    def pop(self, token, default=None):
+        entry = self.get(token)
+        if entry is None:
+            return default
+        self._connect().execute("DELETE FROM sessions WHERE token = ?", (token,))
+        self._cache.pop(token, None)
+        return entry
+
+    def pop_least_recent(self):
+        row = self._connect().execute(
+            "SELECT token FROM sessions ORDER BY last_seen LIMIT 1"
+        ).fetchone()
+        if row is not None:
+            self.pop(row[0])
+
+    def delete_expired(self, idle_before, created_before):
+        cursor = self._connect().execute(
+            "DELETE FROM sessions WHERE last_seen < ? OR created < ?",
+            (idle_before, created_before),
+        )
+        self._cache.clear()
+        return cursor.rowcount
+
+    def items(self):
+        rows = self._connect().execute(
+            "SELECT token, user, created, last_seen FROM sessions"
+        ).fetchall()
+        return [(row[0], (json.loads(row[1]), row[2], row[3])) for row in rows]
+
+    def update(self, entries):
+        for token, entry in dict(entries).items():
+            self[token] = entry
+
+    def clear(self):
+        self._connect().execute("DELETE FROM sessions")
+        self._cache.clear()
+
+    def __len__(self):
+        return self._connect().execute("SELECT live FROM session_count").fetchone()[0]
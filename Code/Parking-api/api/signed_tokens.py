@@ -0,0 +1,166 @@
+"""HMAC-signed session tokens, enabled with SESSION_TOKENS=signed.
+
+A token carries the username, role and expiry of the login, signed with
+SESSION_SECRET, so checking it needs no session store. Logging out puts
+the token's id on a deny-list until the token would have expired anyway.
+The deny-list is kept in memory and shared between worker processes
+through an append-only file, which each process re-reads at most every
+DENYLIST_REFRESH seconds, so the per-request check does no I/O.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+
+from storage_utils import locked
+
+
+PREFIX = "v1."
+DENYLIST_FILE = "data/revoked-tokens.jsonl"
+DENYLIST_REFRESH = float(os.getenv("DENYLIST_REFRESH", 1))
+
+_secret = os.getenv("SESSION_SECRET", "").encode()
+if not _secret:
+    # Tokens will not survive a restart; set SESSION_SECRET to keep them
+    _secret = secrets.token_bytes(32)
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(payload):
+    return _b64encode(hmac.new(_secret, payload.encode("ascii"), hashlib.sha256).digest())
+
+
+def issue(user, max_age, now=None):
+    now = time.time() if now is None else now
+    claims = {
+        "sub": user["username"],
+        "exp": int(now + max_age),
+        "jti": secrets.token_urlsafe(9),
+    }
+    if user.get("role"):
+        claims["role"] = user["role"]
+    payload = PREFIX + _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+    return payload + "." + _sign(payload)
+
+
+def is_signed(token):
+    return token.startswith(PREFIX)
+
+
+def _claims(token, now):
+    payload, _, signature = token.rpartition(".")
+    try:
+        if not payload or not hmac.compare_digest(_sign(payload), signature):
+            return None
+        claims = json.loads(_b64decode(payload[len(PREFIX):]))
+    except (ValueError, TypeError):
+        return None
+    if claims.get("exp", 0) <= now:
+        return None
+    return claims
+
+
+def verify(token, now=None):
+    """Return the session user of a valid token, or None."""
+    now = time.time() if now is None else now
+    claims = _claims(token, now)
+    if claims is None or _denylist.contains(claims["jti"], now):
+        return None
+    user = {"username": claims["sub"]}
+    if "role" in claims:
+        user["role"] = claims["role"]
+    return user
+
+
+def revoke(token, now=None):
+    """Deny a token until it expires; returns its user, or None if invalid."""
+    now = time.time() if now is None else now
+    user = verify(token, now)
+    if user is not None:
+        claims = _claims(token, now)
+        _denylist.add(claims["jti"], claims["exp"], now)
+    return user
+
+
+class DenyList:
+    """Revoked token ids with their expiry, shared through an append-only file."""
+
+    def __init__(self, filename, refresh=DENYLIST_REFRESH):
+        self.filename = filename
+        self.refresh = refresh
+        self._denied = {}
+        self._lock = threading.Lock()
+        self._inode = None
+        self._offset = 0
+        self._checked = None
+
+    def _read_new(self):
+        try:
+            with open(self.filename, "rb") as file:
+                inode = os.fstat(file.fileno()).st_ino
+                if inode != self._inode:
+                    # Compacted by another process, start over
+                    self._inode = inode
+                    self._offset = 0
+                file.seek(self._offset)
+                data = file.read()
+        except FileNotFoundError:
+            return
+        # Only whole lines; a line being appended right now is read next time
+        end = data.rfind(b"\n") + 1
+        self._offset += end
+        for line in data[:end].splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            self._denied[record["jti"]] = record["exp"]
+
+    def _prune(self, now):
+        for jti in [jti for jti, exp in self._denied.items() if exp <= now]:
+            del self._denied[jti]
+
+    def contains(self, jti, now):
+        with self._lock:
+            if self._checked is None or now - self._checked >= self.refresh:
+                self._checked = now
+                self._read_new()
+                self._prune(now)
+            return jti in self._denied
+
+    def add(self, jti, exp, now):
+        with locked(self.filename):
+            with self._lock:
+                self._read_new()
+                self._prune(now)
+                self._denied[jti] = exp
+                size = os.path.getsize(self.filename) if os.path.exists(self.filename) else 0
+                # Rewrite once most lines are for tokens that have expired
+                if size > 4096 and size > 128 * len(self._denied):
+                    self._compact()
+                else:
+                    with open(self.filename, "a") as file:
+                        file.write(json.dumps({"jti": jti, "exp": exp}) + "\n")
+
+    def _compact(self):
+        temp = self.filename + ".tmp"
+        with open(temp, "w") as file:
+            for jti, exp in self._denied.items():
+                file.write(json.dumps({"jti": jti, "exp": exp}) + "\n")
+        os.replace(temp, self.filename)
+        self._inode = None
+        self._offset = 0
+
+
+_denylist = DenyList(DENYLIST_FILE)
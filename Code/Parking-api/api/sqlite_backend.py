@@ -0,0 +1,672 @@
+"""SQLite storage backend, enabled with STORAGE_BACKEND=sqlite.
+
+Provides the record-level functions of storage_utils on top of the
+database built by Database/create_tables.py (Database/database.db, or the
+path in SQLITE_PATH). Users and parking lots live in the migrated tables,
+with the fields that have no column of their own in an extra JSON column,
+so records come back the way the JSON backend returns them.
+Reservations, vehicles, parking sessions and payments are kept as the full
+API record in JSON next to indexed key columns, because the migrated tables
+cannot hold what the API stores for them (payments.transaction is UNIQUE
+there, while refunds share the transaction of the original payment).
+
+Every thread gets its own connection in WAL mode, so readers never block
+the writer. All queries are parameterised and served from the statement
+cache of the connection.
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import json_codec
+from Database.create_tables import create_tables
+
+
+__all__ = [
+    "next_id",
+    "load_user_data",
+    "save_user_data",
+    "get_user",
+    "add_user",
+    "update_user",
+    "load_parking_lot_data",
+    "save_parking_lot_data",
+    "get_parking_lot",
+    "parking_lot_version",
+    "save_parking_lot",
+    "delete_parking_lot",
+    "load_reservation_data",
+    "save_reservation_data",
+    "get_reservation",
+    "save_reservation",
+    "delete_reservation",
+    "load_user_vehicles",
+    "save_vehicle",
+    "delete_vehicle",
+    "load_parking_sessions",
+    "iter_parking_sessions",
+    "get_parking_session",
+    "save_parking_session",
+    "delete_parking_session",
+    "find_open_session",
+    "load_billing_ledger",
+    "load_payment_data",
+    "save_payment_data",
+    "append_payment",
+    "update_payment",
+    "find_payment",
+    "load_user_payments",
+    "load_payment_totals",
+    "compact_payment_journal",
+]
+
+DB_PATH = os.getenv("SQLITE_PATH", "Database/database.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS api_reservations (
+    id TEXT PRIMARY KEY,
+    user TEXT,
+    data TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS api_vehicles (
+    username TEXT NOT NULL,
+    vehicle_key TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (username, vehicle_key)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS parking_sessions (
+    parking_lot_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    licenseplate TEXT,
+    user TEXT,
+    stopped TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (parking_lot_id, id)
+);
+CREATE INDEX IF NOT EXISTS parking_sessions_user ON parking_sessions (user);
+CREATE INDEX IF NOT EXISTS parking_sessions_open
+    ON parking_sessions (parking_lot_id, licenseplate) WHERE stopped IS NULL;
+
+CREATE TABLE IF NOT EXISTS api_payments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    "transaction" TEXT,
+    initiator TEXT,
+    amount REAL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS api_payments_transaction ON api_payments ("transaction");
+CREATE INDEX IF NOT EXISTS api_payments_initiator ON api_payments (initiator);
+
+CREATE TABLE IF NOT EXISTS id_sequences (
+    name TEXT PRIMARY KEY,
+    last INTEGER NOT NULL
+);
+
+-- Bumped on every change to parking_lots, for the ETags of the lot endpoints
+CREATE TABLE IF NOT EXISTS table_versions (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO table_versions (name, version) VALUES ('parking_lots', 0);
+CREATE TRIGGER IF NOT EXISTS parking_lots_insert_version AFTER INSERT ON parking_lots
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'parking_lots';
+END;
+CREATE TRIGGER IF NOT EXISTS parking_lots_update_version AFTER UPDATE ON parking_lots
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'parking_lots';
+END;
+CREATE TRIGGER IF NOT EXISTS parking_lots_delete_version AFTER DELETE ON parking_lots
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'parking_lots';
+END;
+"""
+
+USER_COLUMNS = (
+    "username",
+    "password",
+    "name",
+    "email",
+    "phone",
+    "role",
+    "created_at",
+    "birth_year",
+    "active",
+)
+LOT_COLUMNS = (
+    "name",
+    "location",
+    "address",
+    "capacity",
+    "reserved",
+    "tariff",
+    "daytariff",
+    "created_at",
+)
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_pid = None
+
+
+def _ensure_schema():
+    global _schema_pid
+    with _schema_lock:
+        if _schema_pid == os.getpid():
+            return
+        directory = os.path.dirname(DB_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        create_tables(DB_PATH)
+        conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+        try:
+            conn.executescript(SCHEMA)
+            _add_extra_columns(conn)
+            _import_migrated_payments(conn)
+        finally:
+            conn.close()
+        _schema_pid = os.getpid()
+
+
+def _add_extra_columns(conn):
+    """Add the extra column to the migrated users and parking_lots tables."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for table in ("users", "parking_lots"):
+            columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            if "extra" not in columns:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN extra TEXT")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _extra_fields(record, columns):
+    return _dumps({key: value for key, value in record.items() if key not in columns})
+
+
+def _import_migrated_payments(conn):
+    """Copy rows from the migrated payments table into api_payments once."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if conn.execute("SELECT 1 FROM api_payments LIMIT 1").fetchone() is None:
+            rows = conn.execute(
+                'SELECT "transaction", amount, initiator, processed_by, coupled_to,'
+                " created_at, completed, validation_hash, t_data FROM payments"
+                " ORDER BY id"
+            ).fetchall()
+            records = []
+            for row in rows:
+                payment = {
+                    "transaction": row[0],
+                    "amount": row[1],
+                    "initiator": row[2],
+                    "created_at": row[5],
+                    "completed": row[6] or False,
+                    "hash": row[7],
+                }
+                if row[3] is not None:
+                    payment["processed_by"] = row[3]
+                    payment["coupled_to"] = row[4]
+                if row[8] is not None:
+                    payment["t_data"] = json_codec.loads(row[8])
+                records.append(_payment_params(payment))
+            conn.executemany(INSERT_PAYMENT, records)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _connect():
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.pid == os.getpid():
+        return conn
+    _ensure_schema()
+    conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    _local.conn = conn
+    _local.pid = os.getpid()
+    return conn
+
+
+@contextmanager
+def _transaction():
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def _dumps(data):
+    return json_codec.dumps(data)
+
+
+def _int_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def next_id(sequence, existing=None):
+    with _transaction() as conn:
+        row = conn.execute(
+            "SELECT last FROM id_sequences WHERE name = ?", (sequence,)
+        ).fetchone()
+        if row is None:
+            keys = existing() if existing is not None else ()
+            last = max((int(key) for key in keys if str(key).isdigit()), default=0)
+        else:
+            last = row["last"]
+        last += 1
+        conn.execute(
+            "INSERT OR REPLACE INTO id_sequences (name, last) VALUES (?, ?)",
+            (sequence, last),
+        )
+    return str(last)
+
+
+# ---------- USERS ----------
+
+SELECT_USER = "SELECT * FROM users WHERE username = ?"
+INSERT_USER = (
+    "INSERT INTO users (username, password, name, email, phone, role,"
+    " created_at, birth_year, active, extra) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+UPDATE_USER = (
+    "UPDATE users SET username = ?, password = ?, name = ?, email = ?, phone = ?,"
+    " role = ?, created_at = ?, birth_year = ?, active = ?, extra = ? WHERE username = ?"
+)
+
+
+def _user_from_row(row):
+    user = {}
+    if row["extra"] is None:
+        # Imported by Database/migrate_users.py, from records that had an id
+        user["id"] = str(row["id"])
+    for column in USER_COLUMNS:
+        if row[column] is not None:
+            user[column] = row[column]
+    if "active" in user:
+        user["active"] = bool(user["active"])
+    if row["extra"] is not None:
+        user.update(json_codec.loads(row["extra"]))
+    return user
+
+
+def _user_params(user):
+    params = [user.get(column) for column in USER_COLUMNS]
+    if params[-1] is not None:
+        params[-1] = 1 if params[-1] else 0
+    return params + [_extra_fields(user, USER_COLUMNS)]
+
+
+def load_user_data():
+    rows = _connect().execute("SELECT * FROM users ORDER BY id").fetchall()
+    return [_user_from_row(row) for row in rows]
+
+
+def save_user_data(data):
+    with _transaction() as conn:
+        conn.execute("DELETE FROM users")
+        conn.executemany(INSERT_USER, [_user_params(user) for user in data])
+
+
+def get_user(username):
+    row = _connect().execute(SELECT_USER, (username,)).fetchone()
+    return _user_from_row(row) if row else None
+
+
+def add_user(user):
+    _connect().execute(INSERT_USER, _user_params(user))
+
+
+def update_user(username, fields):
+    with _transaction() as conn:
+        row = conn.execute(SELECT_USER, (username,)).fetchone()
+        if row is None:
+            if not fields.get("password"):
+                return None  # not a user that can log in
+            conn.execute(INSERT_USER, _user_params(fields))
+            return dict(fields)
+        user = _user_from_row(row) | fields
+        conn.execute(UPDATE_USER, _user_params(user) + [username])
+        return user
+
+
+# ---------- PARKING LOTS ----------
+
+SELECT_LOT = "SELECT * FROM parking_lots WHERE id = ?"
+REPLACE_LOT = (
+    "INSERT OR REPLACE INTO parking_lots (id, name, location, address, capacity,"
+    " reserved, tariff, daytariff, created_at, lat, lng, extra)"
+    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+def _lot_from_row(row):
+    lot = {}
+    if row["extra"] is None:
+        # Imported by Database/migrate_parkinglots.py, from records that had an id
+        lot["id"] = str(row["id"])
+    for column in LOT_COLUMNS:
+        if row[column] is not None:
+            lot[column] = row[column]
+    if row["lat"] is not None or row["lng"] is not None:
+        lot["coordinates"] = {"lat": row["lat"], "lng": row["lng"]}
+    if row["extra"] is not None:
+        lot.update(json_codec.loads(row["extra"]))
+    return lot
+
+
+def _lot_params(lid, lot):
+    coordinates = lot.get("coordinates")
+    columns = LOT_COLUMNS
+    if isinstance(coordinates, dict) and set(coordinates) <= {"lat", "lng"}:
+        columns += ("coordinates",)
+    else:
+        coordinates = {}  # kept as it is in extra
+    params = [_int_id(lid)] + [lot.get(column) for column in LOT_COLUMNS]
+    params[1] = params[1] or ""  # name is NOT NULL in the migrated schema
+    return params + [
+        coordinates.get("lat"), coordinates.get("lng"), _extra_fields(lot, columns)
+    ]
+
+
+def load_parking_lot_data():
+    rows = _connect().execute("SELECT * FROM parking_lots ORDER BY id").fetchall()
+    return {str(row["id"]): _lot_from_row(row) for row in rows}
+
+
+def save_parking_lot_data(data):
+    with _transaction() as conn:
+        conn.execute("DELETE FROM parking_lots")
+        conn.executemany(REPLACE_LOT, [_lot_params(lid, lot) for lid, lot in data.items()])
+
+
+def parking_lot_version():
+    row = _connect().execute(
+        "SELECT version FROM table_versions WHERE name = 'parking_lots'"
+    ).fetchone()
+    return f"s{row['version']}"
+
+
+def get_parking_lot(lid):
+    lid = _int_id(lid)
+    if lid is None:
+        return None
+    row = _connect().execute(SELECT_LOT, (lid,)).fetchone()
+    return _lot_from_row(row) if row else None
+
+
+def save_parking_lot(lid, lot):
+    _connect().execute(REPLACE_LOT, _lot_params(lid, lot))
+
+
+def delete_parking_lot(lid):
+    _connect().execute("DELETE FROM parking_lots WHERE id = ?", (_int_id(lid),))
+
+
+# ---------- RESERVATIONS ----------
+
+REPLACE_RESERVATION = (
+    "INSERT OR REPLACE INTO api_reservations (id, user, data) VALUES (?, ?, ?)"
+)
+
+
+def load_reservation_data():
+    rows = _connect().execute("SELECT id, data FROM api_reservations ORDER BY rowid")
+    return {row["id"]: json_codec.loads(row["data"]) for row in rows}
+
+
+def save_reservation_data(data):
+    with _transaction() as conn:
+        conn.execute("DELETE FROM api_reservations")
+        conn.executemany(
+            REPLACE_RESERVATION,
+            [(rid, r.get("user"), _dumps(r)) for rid, r in data.items()],
+        )
+
+
+def get_reservation(rid):
+    row = _connect().execute(
+        "SELECT data FROM api_reservations WHERE id = ?", (rid,)
+    ).fetchone()
+    return json_codec.loads(row["data"]) if row else None
+
+
+def save_reservation(rid, reservation):
+    _connect().execute(
+        REPLACE_RESERVATION, (rid, reservation.get("user"), _dumps(reservation))
+    )
+
+
+def delete_reservation(rid):
+    _connect().execute("DELETE FROM api_reservations WHERE id = ?", (rid,))
+
+
+# ---------- VEHICLES ----------
+
+def load_user_vehicles(username):
+    rows = _connect().execute(
+        "SELECT vehicle_key, data FROM api_vehicles WHERE username = ?", (username,)
+    )
+    return {row["vehicle_key"]: json_codec.loads(row["data"]) for row in rows}
+
+
+def save_vehicle(username, key, vehicle):
+    _connect().execute(
+        "INSERT OR REPLACE INTO api_vehicles (username, vehicle_key, data)"
+        " VALUES (?, ?, ?)",
+        (username, key, _dumps(vehicle)),
+    )
+
+
+def delete_vehicle(username, key):
+    _connect().execute(
+        "DELETE FROM api_vehicles WHERE username = ? AND vehicle_key = ?",
+        (username, key),
+    )
+
+
+# ---------- PARKING SESSIONS ----------
+
+def _started_between(session, start, end):
+    try:
+        started = datetime.strptime(session.get("started") or "", "%d-%m-%Y %H:%M:%S")
+    except ValueError:
+        return False
+    return (start is None or started >= start) and (end is None or started <= end)
+
+
+def load_parking_sessions(lid, start=None, end=None):
+    rows = _connect().execute(
+        "SELECT id, data FROM parking_sessions WHERE parking_lot_id = ? ORDER BY rowid",
+        (str(lid),),
+    )
+    sessions = {row["id"]: json_codec.loads(row["data"]) for row in rows}
+    if start is None and end is None:
+        return sessions
+    # started is stored as DD-MM-YYYY, which doesn't sort, so filter here
+    return {
+        sid: session
+        for sid, session in sessions.items()
+        if _started_between(session, start, end)
+    }
+
+
+def iter_parking_sessions(lid, after=None, start=None, end=None, user=None,
+                          state=None, licenseplate=None):
+    sql = "SELECT id, data FROM parking_sessions WHERE parking_lot_id = ?"
+    params = [str(lid)]
+    if after is not None:
+        sql += " AND CAST(id AS INTEGER) > ?"
+        params.append(int(after))
+    if user is not None:
+        sql += " AND user = ?"
+        params.append(user)
+    if licenseplate is not None:
+        sql += " AND licenseplate = ?"
+        params.append(licenseplate)
+    if state == "open":
+        sql += " AND stopped IS NULL"
+    elif state == "closed":
+        sql += " AND stopped IS NOT NULL"
+    sql += " ORDER BY CAST(id AS INTEGER)"
+    for row in _connect().execute(sql, params):
+        session = json_codec.loads(row["data"])
+        if (start is None and end is None) or _started_between(session, start, end):
+            yield row["id"], session
+
+
+def get_parking_session(lid, sid):
+    row = _connect().execute(
+        "SELECT data FROM parking_sessions WHERE parking_lot_id = ? AND id = ?",
+        (str(lid), sid),
+    ).fetchone()
+    return json_codec.loads(row["data"]) if row else None
+
+
+def save_parking_session(lid, sid, session):
+    _connect().execute(
+        "INSERT OR REPLACE INTO parking_sessions"
+        " (parking_lot_id, id, licenseplate, user, stopped, data)"
+        " VALUES (?, ?, ?, ?, ?, ?)",
+        (
+            str(lid),
+            sid,
+            session.get("licenseplate"),
+            session.get("user"),
+            session.get("stopped"),
+            _dumps(session),
+        ),
+    )
+
+
+def delete_parking_session(lid, sid):
+    _connect().execute(
+        "DELETE FROM parking_sessions WHERE parking_lot_id = ? AND id = ?",
+        (str(lid), sid),
+    )
+
+
+def find_open_session(lid, licenseplate):
+    row = _connect().execute(
+        "SELECT id, data FROM parking_sessions"
+        " WHERE parking_lot_id = ? AND licenseplate = ? AND stopped IS NULL LIMIT 1",
+        (str(lid), licenseplate),
+    ).fetchone()
+    if row is None:
+        return None, None
+    return row["id"], json_codec.loads(row["data"])
+
+
+def load_billing_ledger(username):
+    # parking_sessions is indexed on user, so this already is the ledger
+    rows = _connect().execute(
+        "SELECT parking_lot_id, id, data FROM parking_sessions WHERE user = ?"
+        " ORDER BY rowid",
+        (username,),
+    )
+    return {
+        f"{row['parking_lot_id']}/{row['id']}": {
+            "parkinglot": row["parking_lot_id"],
+            "sid": row["id"],
+            "session": json_codec.loads(row["data"]),
+        }
+        for row in rows
+    }
+
+
+# ---------- PAYMENTS ----------
+
+INSERT_PAYMENT = (
+    'INSERT INTO api_payments ("transaction", initiator, amount, data)'
+    " VALUES (?, ?, ?, ?)"
+)
+
+
+def _payment_params(payment):
+    return (
+        payment.get("transaction"),
+        payment.get("initiator"),
+        payment.get("amount", 0),
+        _dumps(payment),
+    )
+
+
+class _PaymentTotals:
+    """Mapping-like view of transaction hash -> total amount paid."""
+
+    def get(self, transaction, default=0):
+        row = _connect().execute(
+            'SELECT SUM(amount) FROM api_payments WHERE "transaction" = ?',
+            (transaction,),
+        ).fetchone()
+        return default if row[0] is None else row[0]
+
+    def __getitem__(self, transaction):
+        total = self.get(transaction, None)
+        if total is None:
+            raise KeyError(transaction)
+        return total
+
+
+def load_payment_data():
+    rows = _connect().execute("SELECT data FROM api_payments ORDER BY id")
+    return [json_codec.loads(row["data"]) for row in rows]
+
+
+def save_payment_data(data):
+    with _transaction() as conn:
+        conn.execute("DELETE FROM api_payments")
+        conn.executemany(INSERT_PAYMENT, [_payment_params(p) for p in data])
+
+
+def append_payment(payment):
+    _connect().execute(INSERT_PAYMENT, _payment_params(payment))
+
+
+def update_payment(key, payment):
+    _connect().execute(
+        'UPDATE api_payments SET "transaction" = ?, initiator = ?, amount = ?,'
+        " data = ? WHERE id = ?",
+        _payment_params(payment) + (key,),
+    )
+
+
+def find_payment(transaction):
+    row = _connect().execute(
+        'SELECT id, data FROM api_payments WHERE "transaction" = ? ORDER BY id LIMIT 1',
+        (transaction,),
+    ).fetchone()
+    if row is None:
+        return None, None
+    return row["id"], json_codec.loads(row["data"])
+
+
+def load_user_payments(username):
+    rows = _connect().execute(
+        "SELECT data FROM api_payments WHERE initiator = ? ORDER BY id", (username,)
+    )
+    return [json_codec.loads(row["data"]) for row in rows]
+
+
+def load_payment_totals():
+    return _PaymentTotals()
+
+
+def compact_payment_journal():
+    """Nothing to compact, every payment is its own row."""
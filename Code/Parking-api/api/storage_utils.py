@@ -1,33 +1,120 @@
+import atexit
 import json
 import csv
+import itertools
 import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from urllib.parse import quote
+
+import json_codec
+
+try:
+    import fcntl
+except ImportError:  # Windows: locking is limited to the current process
+    fcntl = None
+
+
+# Parsed JSON files keyed by path. Each entry is (signature, data) where the
+# signature is (st_ino, st_mtime_ns, st_size) of the file at the time it was
+# parsed. Files are replaced by a rename on save, so the inode changes even
+# when two saves of the same size land within one mtime tick.
+_json_cache = {}
+_cache_stats = {"hits": 0, "misses": 0}
+
+# One lock per data file, used to serialise read-modify-write cycles when
+# the server handles requests on several threads. Where fcntl is available
+# an flock() on "<file>.lock" extends this to other server processes.
+_file_locks = {}
+_file_locks_guard = threading.Lock()
+_local = threading.local()
+
+# How hard write_json makes sure data has reached the disk: "none" leaves
+# it to the OS, "file" fsyncs the new file before renaming it into place
+# and "full" also fsyncs the directory, so the rename survives a power cut.
+FSYNC = os.getenv("STORAGE_FSYNC", "file")
+
+# With write-behind, JSON saves are held in memory for up to this many
+# seconds and every save of the same file in that window becomes a single
+# write. 0 writes on every save. Pending data is only visible to this
+# process, so it must stay off when several processes share the files.
+WRITE_BEHIND = float(os.getenv("STORAGE_WRITE_BEHIND", 0))
+
+# filename -> (deadline, JSON text, serial) of saves not written yet
+_pending = {}
+_pending_guard = threading.Condition()
+_pending_serial = itertools.count()
+_flusher = None
+
+
+def _empty_structure(filename):
+    """Return the default empty structure for a data file."""
+    if 'users' in filename:
+        return []  # users.json should be a list
+    elif 'parking_lots' in filename:
+        return {}  # parking_lots.json should be a dict
+    elif 'vehicles' in filename:
+        return {}  # vehicles.json should be a dict
+    elif 'reservations' in filename:
+        return {}  # reservations.json should be a dict
+    elif 'payments' in filename:
+        return []  # payments.json should be a list
+    elif 'sessions' in filename:
+        return {}  # sessions files should be dicts
+    else:
+        return {}  # default to dict
+
+
+def _file_signature(filename):
+    stat = os.stat(filename)
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
 
 
 def load_json(filename):
-    """Load JSON data from file, create file if it doesn't exist."""
+    """Load JSON data from file, create file if it doesn't exist.
+
+    Parsed data is cached per path and reused for as long as the file's
+    inode, mtime and size are unchanged. The returned object is shared between
+    callers, so it must only be modified when it is saved afterwards.
+    """
     try:
         # Create directory if it doesn't exist
         os.makedirs(os.path.dirname(filename), exist_ok=True)
 
-        if not os.path.exists(filename):
-            # Return default empty structure based on filename
-            if 'users' in filename:
-                return []  # users.json should be a list
-            elif 'parking_lots' in filename:
-                return {}  # parking_lots.json should be a dict
-            elif 'vehicles' in filename:
-                return {}  # vehicles.json should be a dict
-            elif 'reservations' in filename:
-                return {}  # reservations.json should be a dict
-            elif 'payments' in filename:
-                return []  # payments.json should be a list
-            elif 'sessions' in filename:
-                return {}  # sessions files should be dicts
-            else:
-                return {}  # default to dict
+        # Inside locked() the caller is about to modify the data, so it gets
+        # its own freshly parsed copy instead of the shared cached one.
+        private = filename in getattr(_local, "held", ())
 
-        with open(filename, 'r') as file:
-            return json.load(file)
+        entry = None
+        if _pending:
+            with _pending_guard:
+                entry = _pending.get(filename)
+        if entry is not None:
+            # Saved but not written yet, the serial tells versions apart
+            signature = ("pending", entry[2])
+        else:
+            try:
+                signature = _file_signature(filename)
+            except FileNotFoundError:
+                # Return default empty structure based on filename
+                return _empty_structure(filename)
+
+        cached = _json_cache.get(filename)
+        if not private and cached is not None and cached[0] == signature:
+            _cache_stats["hits"] += 1
+            return cached[1]
+
+        _cache_stats["misses"] += 1
+        if entry is not None:
+            data = json_codec.loads(entry[1])
+        else:
+            with open(filename, 'rb') as file:
+                data = json_codec.loads(file.read())
+        if not private:
+            _json_cache[filename] = (signature, data)
+        return data
     except json.JSONDecodeError:
         # If file is empty or corrupted, return default
         if 'users' in filename:
@@ -36,9 +123,214 @@ def load_json(filename):
             return {}
 
 
-def write_json(filename, data):
-    with open(filename, 'w') as file:
-        json.dump(data, file, default=str)
+def invalidate_cache(filename=None):
+    """Drop the cached data for filename, or for every file if None."""
+    if filename is None:
+        _json_cache.clear()
+    else:
+        _json_cache.pop(filename, None)
+
+
+def _file_lock(filename):
+    with _file_locks_guard:
+        lock = _file_locks.get(filename)
+        if lock is None:
+            lock = _file_locks[filename] = threading.Lock()
+        return lock
+
+
+def _acquire_file(filename, held):
+    if filename in held:
+        # Re-entered by the same thread, the locks are already ours
+        held[filename][0] += 1
+        return
+
+    lock = _file_lock(filename)
+    lock.acquire()
+    fd = None
+    if fcntl is not None:
+        try:
+            directory = os.path.dirname(filename)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            fd = os.open(filename + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        except OSError:
+            if fd is not None:
+                os.close(fd)
+            lock.release()
+            raise
+    held[filename] = [1, fd]
+
+
+def _release_file(filename, held):
+    entry = held[filename]
+    entry[0] -= 1
+    if entry[0] > 0:
+        return
+
+    del held[filename]
+    fd = entry[1]
+    if fd is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+    _file_lock(filename).release()
+
+
+@contextmanager
+def locked(*filenames):
+    """Hold the locks of the given data files for a read-modify-write cycle.
+
+    Locks are always taken in sorted order so that handlers locking more
+    than one file cannot deadlock each other, and the lock files are
+    opened per acquisition so forked worker processes never share them.
+    While the locks are held, load_json returns private copies of these
+    files to the calling thread.
+    """
+    if not hasattr(_local, "held"):
+        _local.held = {}
+    held = _local.held
+
+    acquired = []
+    try:
+        for name in sorted(set(filenames)):
+            _acquire_file(name, held)
+            acquired.append(name)
+        yield
+    finally:
+        for name in reversed(acquired):
+            _release_file(name, held)
+
+
+def data_version(filename):
+    """Return a short string that changes whenever filename is saved.
+
+    Taken before loading the data, it can be used as an ETag: a save in
+    between makes the tag older than the data, never the other way round.
+    """
+    if _pending:
+        with _pending_guard:
+            entry = _pending.get(filename)
+        if entry is not None:
+            return f"p{entry[2]}"
+    try:
+        inode, mtime, size = _file_signature(filename)
+    except FileNotFoundError:
+        return "0"
+    return f"{inode:x}-{mtime:x}-{size:x}"
+
+
+def cache_info():
+    """Return hit/miss counters and the number of cached files."""
+    return {
+        "hits": _cache_stats["hits"],
+        "misses": _cache_stats["misses"],
+        "entries": len(_json_cache),
+    }
+
+
+def _fsync_directory(directory):
+    if not hasattr(os, "O_DIRECTORY"):
+        return  # Windows can't open a directory for fsync
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _replace_file(filename, text, fsync=None):
+    fsync = FSYNC if fsync is None else fsync
+    temp = f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp, 'w') as file:
+            file.write(text)
+            if fsync != "none":
+                file.flush()
+                os.fsync(file.fileno())
+        os.replace(temp, filename)
+    except BaseException:
+        try:
+            os.remove(temp)
+        except FileNotFoundError:
+            pass
+        raise
+    if fsync == "full":
+        _fsync_directory(os.path.dirname(filename) or ".")
+
+
+def write_json(filename, data, fsync=None):
+    """Replace filename with data, atomically.
+
+    The data is written to a temporary file next to it which is then
+    renamed over filename, so a reader or a crash sees either the old or
+    the new contents and never a truncated file. fsync overrides FSYNC.
+    """
+    _replace_file(filename, json_codec.dumps(data), fsync)
+
+
+def _write_behind(filename, data):
+    global _flusher
+    # Serialised now, so later changes to data don't leak into the file
+    # and readers get back the same types as from disk
+    text = json_codec.dumps(data)
+    with _pending_guard:
+        entry = _pending.get(filename)
+        # The deadline is set by the first save, so a file that keeps
+        # changing is still written every WRITE_BEHIND seconds
+        deadline = time.monotonic() + WRITE_BEHIND if entry is None else entry[0]
+        _pending[filename] = (deadline, text, next(_pending_serial))
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = threading.Thread(
+                target=_flush_loop, name="storage-flusher", daemon=True
+            )
+            _flusher.start()
+        elif entry is None:
+            _pending_guard.notify()
+
+
+def _flush_loop():
+    while True:
+        with _pending_guard:
+            while not _pending:
+                _pending_guard.wait()
+            now = time.monotonic()
+            due = [name for name, entry in _pending.items() if entry[0] <= now]
+            if not due:
+                _pending_guard.wait(min(entry[0] for entry in _pending.values()) - now)
+                continue
+        flush_writes(due)
+
+
+def flush_writes(filenames=None):
+    """Write pending write-behind saves to disk now, all of them by default."""
+    with _pending_guard:
+        if filenames is None:
+            filenames = list(_pending)
+    for filename in filenames:
+        with locked(filename):
+            with _pending_guard:
+                entry = _pending.get(filename)
+            if entry is None:
+                continue
+            _replace_file(filename, entry[1])
+            # Only now stop serving it from memory, so nobody reads the old
+            # file in between
+            with _pending_guard:
+                if _pending.get(filename) is entry:
+                    del _pending[filename]
+            invalidate_cache(filename)
+
+
+def set_write_behind(seconds):
+    """Change WRITE_BEHIND; turning it off writes out what is pending."""
+    global WRITE_BEHIND
+    WRITE_BEHIND = seconds
+    if not seconds:
+        flush_writes()
+
+
+atexit.register(flush_writes)
 
 
 def load_csv(filename):
@@ -73,7 +365,11 @@ def write_text(filename, data):
 
 def save_data(filename, data):
     if filename.endswith('.json'):
-        write_json(filename, data)
+        if WRITE_BEHIND > 0:
+            _write_behind(filename, data)
+        else:
+            write_json(filename, data)
+        invalidate_cache(filename)
     elif filename.endswith('.csv'):
         write_csv(filename, data)
     elif filename.endswith('.txt'):
@@ -117,12 +413,807 @@ def save_reservation_data(data):
     save_data('data/reservations.json', data)
 
 
+def _sessions_file(lid):
+    # Where a lot's sessions were kept before they were partitioned
+    return f'data/pdata/p{lid}-sessions.json'
+
+
+# Last ID handed out per collection ("parking-lots", "reservations",
+# "sessions-<lid>"). Kept apart from the data so that deleting a record
+# never makes its ID come back, and so the next ID is known without
+# loading the collection.
+_SEQUENCES = 'data/sequences.json'
+
+
+def next_id(sequence, existing=None):
+    """Reserve the next ID of a sequence and return it as a string.
+
+    existing is only called the first time a sequence is used, to get the
+    records that already exist so the sequence starts after their highest
+    numeric key.
+    """
+    with locked(_SEQUENCES):
+        sequences = load_json(_SEQUENCES)
+        last = sequences.get(sequence)
+        if last is None:
+            keys = existing() if existing is not None else ()
+            last = max((int(key) for key in keys if str(key).isdigit()), default=0)
+        last += 1
+        sequences[sequence] = last
+        # Written straight away, an ID must never be handed out twice
+        write_json(_SEQUENCES, sequences)
+        invalidate_cache(_SEQUENCES)
+    return str(last)
+
+
+# Record-level access used by the request handlers. Multi-step updates
+# still go through locked(); these functions lock on their own as well.
+# With STORAGE_BACKEND=sqlite they are replaced by the versions in
+# sqlite_backend, which read or write a single row instead of a whole file.
+
+# username -> position in users.json, so finding a user is a dict lookup
+# instead of a scan. Built on first use, checked against the file signature
+# like the JSON cache and kept current by add_user() and update_user().
+_user_positions = {"signature": None, "positions": None}
+_user_positions_guard = threading.Lock()
+
+
+def _positions_for(users, signature):
+    with _user_positions_guard:
+        if (
+            _user_positions["positions"] is not None
+            and _user_positions["signature"] == signature
+        ):
+            return _user_positions["positions"]
+    positions = {}
+    for position, user in enumerate(users):
+        positions.setdefault(user.get("username"), position)
+    with _user_positions_guard:
+        _user_positions["signature"] = signature
+        _user_positions["positions"] = positions
+    return positions
+
+
+def _find_user(users, username):
+    cached = _json_cache.get('data/users.json')
+    if cached is not None and cached[1] is users:
+        signature = cached[0]
+        trusted = True
+    else:
+        # A private copy loaded under locked() matches the file, since that
+        # can't change meanwhile. Any other list may be older or newer than
+        # the file the index is built from.
+        signature = _signature_or_none('data/users.json')
+        trusted = 'data/users.json' in getattr(_local, "held", ())
+    position = _positions_for(users, signature).get(username)
+    if position is not None:
+        if 0 <= position < len(users) and users[position].get("username") == username:
+            return position
+    elif trusted:
+        return None
+    for position, user in enumerate(users):
+        if user.get("username") == username:
+            return position
+    return None
+
+
+def _user_positions_written(before, username, position):
+    with _user_positions_guard:
+        positions = _user_positions["positions"]
+        if positions is None:
+            return
+        if _user_positions["signature"] != before:
+            _user_positions["positions"] = None
+            return
+        positions.setdefault(username, position)
+        _user_positions["signature"] = _signature_or_none('data/users.json')
+
+
+def get_user(username):
+    users = load_user_data()
+    if not isinstance(users, list):
+        return None
+    position = _find_user(users, username)
+    return None if position is None else users[position]
+
+
+def add_user(user):
+    with locked('data/users.json'):
+        users = load_user_data()
+        if not isinstance(users, list):
+            users = []
+        before = _signature_or_none('data/users.json')
+        # Index the file as it is now, so the new user can be added to it
+        _find_user(users, user.get("username"))
+        users.append(user)
+        save_user_data(users)
+        _user_positions_written(before, user.get("username"), len(users) - 1)
+
+
+def update_user(username, fields):
+    """Merge fields into the stored user, returning the updated user.
+
+    An unknown username is added as a new user if fields has a password,
+    otherwise None is returned.
+    """
+    with locked('data/users.json'):
+        users = load_user_data()
+        if not isinstance(users, list):
+            users = []
+        before = _signature_or_none('data/users.json')
+        index = _find_user(users, username)
+        if index is None:
+            if not fields.get("password"):
+                return None  # not a user that can log in
+            users.append(fields)
+            index = len(users) - 1
+        else:
+            users[index] = users[index] | fields
+        save_user_data(users)
+        _user_positions_written(before, users[index].get("username"), index)
+        return users[index]
+
+
+def parking_lot_version():
+    return data_version('data/parking-lots.json')
+
+
+def get_parking_lot(lid):
+    parking_lots = load_parking_lot_data()
+    if not isinstance(parking_lots, dict):
+        return None
+    return parking_lots.get(lid)
+
+
+def save_parking_lot(lid, lot):
+    with locked('data/parking-lots.json'):
+        parking_lots = load_parking_lot_data()
+        parking_lots[lid] = lot
+        save_parking_lot_data(parking_lots)
+
+
+def delete_parking_lot(lid):
+    with locked('data/parking-lots.json'):
+        parking_lots = load_parking_lot_data()
+        if parking_lots.pop(lid, None) is not None:
+            save_parking_lot_data(parking_lots)
+
+
+def get_reservation(rid):
+    return load_reservation_data().get(rid)
+
+
+def save_reservation(rid, reservation):
+    with locked('data/reservations.json'):
+        reservations = load_reservation_data()
+        reservations[rid] = reservation
+        save_reservation_data(reservations)
+
+
+def delete_reservation(rid):
+    with locked('data/reservations.json'):
+        reservations = load_reservation_data()
+        if reservations.pop(rid, None) is not None:
+            save_reservation_data(reservations)
+
+
+def load_user_vehicles(username):
+    return load_data('data/vehicles.json').get(username, {})
+
+
+def save_vehicle(username, key, vehicle):
+    with locked('data/vehicles.json'):
+        vehicles = load_data('data/vehicles.json')
+        vehicles.setdefault(username, {})[key] = vehicle
+        save_data('data/vehicles.json', vehicles)
+
+
+def delete_vehicle(username, key):
+    with locked('data/vehicles.json'):
+        vehicles = load_data('data/vehicles.json')
+        if vehicles.get(username, {}).pop(key, None) is not None:
+            save_data('data/vehicles.json', vehicles)
+
+
+# Parking sessions are split per lot and per month in which they started,
+# data/pdata/p<lid>/<YYYY-MM>.json, next to an index.json that lists the
+# partitions with their range of session IDs and number of running
+# sessions. Starting or stopping a session only rewrites its partition,
+# which is the current month's for new sessions, and the small index.
+# A past month without running sessions is sealed: its file is made
+# read-only and starts and stops no longer touch it. Lots still kept in a
+# single p<lid>-sessions.json are split up the first time they are used.
+_UNDATED = '0000-00'
+
+
+def _lot_dir(lid):
+    return f'data/pdata/p{lid}'
+
+
+def _lot_index_file(lid):
+    return f'{_lot_dir(lid)}/index.json'
+
+
+def _partition_file(lid, month):
+    return f'{_lot_dir(lid)}/{month}.json'
+
+
+def _session_started(session):
+    try:
+        return datetime.strptime(session.get("started") or "", "%d-%m-%Y %H:%M:%S")
+    except ValueError:
+        return None
+
+
+def _session_month(session):
+    started = _session_started(session)
+    return _UNDATED if started is None else started.strftime("%Y-%m")
+
+
+def _started_between(session, start, end):
+    started = _session_started(session)
+    return (
+        started is not None
+        and (start is None or started >= start)
+        and (end is None or started <= end)
+    )
+
+
+def _is_open(session):
+    return int(session is not None and not session.get("stopped"))
+
+
+def _describe_partition(sessions):
+    ids = [int(sid) for sid in sessions if str(sid).isdigit()]
+    return {
+        "first": min(ids, default=None),
+        "last": max(ids, default=None),
+        "open": sum(_is_open(session) for session in sessions.values()),
+        "sealed": False,
+    }
+
+
+def _set_read_only(filename, read_only):
+    try:
+        os.chmod(filename, 0o444 if read_only else 0o644)
+    except FileNotFoundError:
+        pass
+
+
+def _split_legacy_sessions(lid):
+    legacy = _sessions_file(lid)
+    index_file = _lot_index_file(lid)
+    with locked(legacy, index_file):
+        if not os.path.exists(legacy):
+            return  # done by another thread or process meanwhile
+        index = _read_lot_index(lid)
+        months = {}
+        for sid, session in load_json(legacy).items():
+            months.setdefault(_session_month(session), {})[sid] = session
+        written = [index_file]
+        for month, sessions in months.items():
+            filename = _partition_file(lid, month)
+            with locked(filename):
+                # Sessions saved to the partition already are at least as new
+                sessions = sessions | (load_json(filename) or {})
+                save_data(filename, sessions)
+            index["partitions"][month] = _describe_partition(sessions)
+            written.append(filename)
+        index["version"] += 1
+        save_data(index_file, index)
+        flush_writes(written)
+        # Kept as a backup, it is not read anymore
+        os.replace(legacy, legacy + '.bak')
+        invalidate_cache(legacy)
+
+
+def _read_lot_index(lid):
+    return load_json(_lot_index_file(lid)) or {"version": 0, "partitions": {}}
+
+
+def _load_lot_index(lid):
+    if os.path.exists(_sessions_file(lid)):
+        _split_legacy_sessions(lid)
+    return _read_lot_index(lid)
+
+
+def _partition_of(lid, index, sid):
+    """Return the month of the partition holding sid, or None."""
+    number = int(sid) if str(sid).isdigit() else None
+    for month, partition in sorted(index["partitions"].items(), reverse=True):
+        if number is not None and (
+            partition["first"] is None
+            or not partition["first"] <= number <= partition["last"]
+        ):
+            continue
+        if sid in load_json(_partition_file(lid, month)):
+            return month
+    return None
+
+
+def _seal_partitions(lid, index):
+    current = datetime.now().strftime("%Y-%m")
+    for month, partition in index["partitions"].items():
+        if month < current and not partition["open"] and not partition["sealed"]:
+            filename = _partition_file(lid, month)
+            flush_writes([filename])
+            _set_read_only(filename, True)
+            partition["sealed"] = True
+
+
+def load_parking_sessions(lid, start=None, end=None):
+    """Return the sessions of a lot as sid -> session.
+
+    With start and/or end (datetimes, both inclusive) only the sessions
+    started in that period are returned, and only the partitions of those
+    months are read.
+    """
+    index = _load_lot_index(lid)
+    ranged = start is not None or end is not None
+    first = start.strftime("%Y-%m") if start is not None else ""
+    last = end.strftime("%Y-%m") if end is not None else "9999-99"
+    sessions = {}
+    for month in sorted(index["partitions"]):
+        if ranged and (month == _UNDATED or not first <= month <= last):
+            continue
+        sessions.update(load_json(_partition_file(lid, month)))
+    if ranged:
+        sessions = {
+            sid: session
+            for sid, session in sessions.items()
+            if _started_between(session, start, end)
+        }
+    return sessions
+
+
+def _sid_key(item):
+    sid = item[0]
+    return (0, int(sid), "") if str(sid).isdigit() else (1, 0, str(sid))
+
+
+def _session_matches(session, start, end, user, state, licenseplate):
+    if (start is not None or end is not None) and not _started_between(session, start, end):
+        return False
+    if user is not None and session.get("user") != user:
+        return False
+    if state is not None and _is_open(session) != (state == "open"):
+        return False
+    if licenseplate is not None and session.get("licenseplate") != licenseplate:
+        return False
+    return True
+
+
+def iter_parking_sessions(lid, after=None, start=None, end=None, user=None,
+                          state=None, licenseplate=None):
+    """Yield (sid, session) of a lot in order of sid, for paging.
+
+    Only sessions with a sid above after and that match the filters are
+    yielded; state is "open" or "closed". Partitions are read one at a
+    time as the caller consumes them, and ones that can't hold a match
+    (sids up to after, months outside start-end) are not read at all.
+    """
+    index = _load_lot_index(lid)
+    ranged = start is not None or end is not None
+    first = start.strftime("%Y-%m") if start is not None else ""
+    last = end.strftime("%Y-%m") if end is not None else "9999-99"
+    after = int(after) if after is not None else None
+    partitions = sorted(
+        index["partitions"].items(),
+        key=lambda item: (item[1]["first"] is None, item[1]["first"] or 0),
+    )
+    for month, partition in partitions:
+        if ranged and (month == _UNDATED or not first <= month <= last):
+            continue
+        if after is not None and partition["last"] is not None and partition["last"] <= after:
+            continue
+        if state == "open" and not partition["open"]:
+            continue
+        for sid, session in sorted(load_json(_partition_file(lid, month)).items(), key=_sid_key):
+            if after is not None and (not str(sid).isdigit() or int(sid) <= after):
+                continue
+            if _session_matches(session, start, end, user, state, licenseplate):
+                yield sid, session
+
+
+def get_parking_session(lid, sid):
+    index = _load_lot_index(lid)
+    month = _partition_of(lid, index, sid)
+    if month is None:
+        return None
+    return load_json(_partition_file(lid, month)).get(sid)
+
+
+def save_parking_session(lid, sid, session):
+    index_file = _lot_index_file(lid)
+    _load_lot_index(lid)  # split up a legacy file before taking the lock
+    with locked(index_file):
+        index = _read_lot_index(lid)
+        before = _lot_signature(lid, index)
+        # A session stays in the partition it was first saved to
+        month = _partition_of(lid, index, sid) or _session_month(session)
+        partition = index["partitions"].setdefault(month, _describe_partition({}))
+        filename = _partition_file(lid, month)
+        with locked(filename):
+            sessions = load_json(filename) or {}
+            previous = sessions.get(sid)
+            sessions[sid] = session
+            if partition["sealed"]:
+                _set_read_only(filename, False)
+                partition["sealed"] = False
+            save_data(filename, sessions)
+            if str(sid).isdigit():
+                number = int(sid)
+                partition["first"] = min(number, partition["first"] or number)
+                partition["last"] = max(number, partition["last"] or number)
+            partition["open"] += _is_open(session) - _is_open(previous)
+            _seal_partitions(lid, index)
+            index["version"] += 1
+            save_data(index_file, index)
+            after = _lot_signature(lid, index)
+            _update_open_sessions(lid, before, after, sid, previous, session)
+            _save_billing_entry(lid, sid, session)
+
+
+def delete_parking_session(lid, sid):
+    index_file = _lot_index_file(lid)
+    _load_lot_index(lid)
+    with locked(index_file):
+        index = _read_lot_index(lid)
+        month = _partition_of(lid, index, sid)
+        if month is None:
+            return
+        partition = index["partitions"][month]
+        filename = _partition_file(lid, month)
+        with locked(filename):
+            sessions = load_json(filename)
+            session = sessions.pop(sid)
+            if partition["sealed"]:
+                _set_read_only(filename, False)
+                partition["sealed"] = False
+            save_data(filename, sessions)
+            partition["open"] -= _is_open(session)
+            index["version"] += 1
+            save_data(index_file, index)
+            with _open_sessions_guard:
+                _open_sessions.pop(str(lid), None)
+            _delete_billing_entry(lid, sid, session)
+
+
+# Open sessions per lot, licenseplate -> (sid, session), so starting and
+# stopping a session doesn't scan the lot's whole history. An index is
+# built from the partitions on first use and kept up to date by
+# save_parking_session(). It carries the signatures of the lot's index and
+# unsealed partitions, so a write from another process makes it rebuild
+# on the next lookup; sealed partitions hold no running sessions.
+_open_sessions = {}
+_open_sessions_guard = threading.Lock()
+
+
+def _signature_or_none(filename):
+    try:
+        return _file_signature(filename)
+    except FileNotFoundError:
+        return None
+
+
+def _lot_signature(lid, index):
+    return (
+        _signature_or_none(_lot_index_file(lid)),
+        tuple(
+            _signature_or_none(_partition_file(lid, month))
+            for month, partition in sorted(index["partitions"].items())
+            if not partition["sealed"]
+        ),
+    )
+
+
+def _open_sessions_for(lid):
+    index = _load_lot_index(lid)
+    signature = _lot_signature(lid, index)
+    with _open_sessions_guard:
+        entry = _open_sessions.get(str(lid))
+        if entry is not None and entry["signature"] == signature:
+            return entry["open"]
+    open_sessions = {
+        session.get("licenseplate"): (sid, session)
+        for sid, session in load_parking_sessions(lid).items()
+        if not session.get("stopped")
+    }
+    with _open_sessions_guard:
+        _open_sessions[str(lid)] = {"signature": signature, "open": open_sessions}
+    return open_sessions
+
+
+def _update_open_sessions(lid, before, after, sid, previous, session):
+    with _open_sessions_guard:
+        entry = _open_sessions.get(str(lid))
+        if entry is None:
+            return
+        if entry["signature"] != before:
+            # Someone else wrote the lot since the index was built
+            del _open_sessions[str(lid)]
+            return
+        open_sessions = entry["open"]
+        if previous is not None:
+            plate = previous.get("licenseplate")
+            if open_sessions.get(plate, (None,))[0] == sid:
+                del open_sessions[plate]
+        if not session.get("stopped"):
+            open_sessions[session.get("licenseplate")] = (sid, session)
+        entry["signature"] = after
+
+
+def find_open_session(lid, licenseplate):
+    """Return (sid, session) of the running session for a licenseplate."""
+    return _open_sessions_for(lid).get(licenseplate, (None, None))
+
+
+# Billing ledger: every parking session of a user, in one file per user
+# (data/billing/<username>.json, "<lid>/<sid>" -> entry), so a bill only
+# reads that user's sessions instead of every file in data/pdata. Kept up
+# to date by save_parking_session() and delete_parking_session(). Ledgers
+# for sessions recorded before the ledger existed are built on first use.
+_BILLING_DIR = 'data/billing'
+_BILLING_BUILT = 'data/billing/.built'
+
+
+def _billing_file(username):
+    return f"{_BILLING_DIR}/{quote(str(username), safe='')}.json"
+
+
+def _load_ledger(filename):
+    # A username can contain "users" or "payments", which load_json would
+    # take as a list file when the ledger doesn't exist yet
+    return load_json(filename) or {}
+
+
+def _save_billing_entry(lid, sid, session):
+    if not session.get("user"):
+        return  # nobody to bill
+    filename = _billing_file(session.get("user"))
+    with locked(filename):
+        ledger = _load_ledger(filename)
+        ledger[f"{lid}/{sid}"] = {"parkinglot": str(lid), "sid": sid, "session": session}
+        save_data(filename, ledger)
+
+
+def _delete_billing_entry(lid, sid, session):
+    if not session.get("user"):
+        return
+    filename = _billing_file(session.get("user"))
+    with locked(filename):
+        ledger = _load_ledger(filename)
+        if ledger.pop(f"{lid}/{sid}", None) is not None:
+            save_data(filename, ledger)
+
+
+def _build_billing_ledgers():
+    with locked(_BILLING_BUILT):
+        if os.path.exists(_BILLING_BUILT):
+            return
+        ledgers = {}
+        for lid in load_parking_lot_data():
+            for sid, session in load_parking_sessions(lid).items():
+                if not session.get("user"):
+                    continue
+                ledgers.setdefault(session.get("user"), {})[f"{lid}/{sid}"] = {
+                    "parkinglot": str(lid),
+                    "sid": sid,
+                    "session": session,
+                }
+        for username, entries in ledgers.items():
+            filename = _billing_file(username)
+            with locked(filename):
+                # Entries written since startup are at least as new
+                ledger = entries | _load_ledger(filename)
+                save_data(filename, ledger)
+        flush_writes([_billing_file(username) for username in ledgers])
+        write_text(_BILLING_BUILT, [])
+
+
+def load_billing_ledger(username):
+    """Return the user's parking sessions as "<lid>/<sid>" -> entry."""
+    if not os.path.exists(_BILLING_BUILT):
+        _build_billing_ledgers()
+    return _load_ledger(_billing_file(username))
+
+
+# Payments are stored as data/payments.json, the last compacted snapshot,
+# plus an append-only journal of JSON lines written since. Each journal
+# record carries the list index it applies to, so replaying a record that
+# already made it into the snapshot is harmless. The merged list is kept in
+# memory and caught up from the journal incrementally, together with an
+# index from transaction hash to the total amount paid for it.
+_PAYMENTS_JOURNAL = 'data/payments.jsonl'
+JOURNAL_COMPACT_MIN = 1000
+_payment_state = {
+    "payments": None,
+    "totals": {},
+    "snapshot": None,
+    "offset": 0,
+    "records": 0,
+}
+_payments_guard = threading.RLock()
+
+
+def _snapshot_signature():
+    try:
+        return _file_signature('data/payments.json')
+    except FileNotFoundError:
+        return None
+
+
+def _add_to_totals(totals, payment, sign=1):
+    transaction = payment.get("transaction")
+    totals[transaction] = totals.get(transaction, 0) + sign * payment.get("amount", 0)
+
+
+def _apply_journal_record(state, record):
+    payments = state["payments"]
+    payment = record["payment"]
+    index = record.get("index", len(payments))
+    if index < len(payments):
+        if record.get("op") == "add":
+            return  # already part of the snapshot
+        _add_to_totals(state["totals"], payments[index], -1)
+        payments[index] = payment
+    else:
+        payments.append(payment)
+    _add_to_totals(state["totals"], payment)
+
+
+def _build_totals(payments):
+    totals = {}
+    for payment in payments:
+        _add_to_totals(totals, payment)
+    return totals
+
+
+def _read_journal(state):
+    """Apply journal records written since the last read.
+
+    Returns False when the journal shrank, i.e. it was compacted by
+    another process and the in-memory list must be rebuilt.
+    """
+    try:
+        size = os.path.getsize(_PAYMENTS_JOURNAL)
+    except FileNotFoundError:
+        size = 0
+    if size < state["offset"]:
+        return False
+    if size == state["offset"]:
+        return True
+
+    with open(_PAYMENTS_JOURNAL, 'rb') as journal:
+        journal.seek(state["offset"])
+        chunk = journal.read(size - state["offset"])
+    # A line without its newline is still being written (or was torn by a
+    # crash); leave it for the next read.
+    end = chunk.rfind(b"\n") + 1
+    for line in chunk[:end].splitlines():
+        try:
+            record = json_codec.loads(line)
+        except json.JSONDecodeError:
+            continue
+        _apply_journal_record(state, record)
+        state["records"] += 1
+    state["offset"] += end
+    return True
+
+
+def _sync_payments():
+    state = _payment_state
+    signature = _snapshot_signature()
+    if (
+        state["payments"] is None
+        or signature is None
+        or signature != state["snapshot"]
+        or not _read_journal(state)
+    ):
+        state["payments"] = list(load_data('data/payments.json') or [])
+        state["totals"] = _build_totals(state["payments"])
+        # The merged list replaces the cached snapshot, don't keep both
+        invalidate_cache('data/payments.json')
+        state["snapshot"] = signature
+        state["offset"] = 0
+        state["records"] = 0
+        _read_journal(state)
+    return state["payments"]
+
+
+def _append_journal_record(record):
+    state = _payment_state
+    try:
+        if os.path.getsize(_PAYMENTS_JOURNAL) > state["offset"]:
+            # Drop a torn line left behind by a crashed writer
+            os.truncate(_PAYMENTS_JOURNAL, state["offset"])
+    except FileNotFoundError:
+        pass
+
+    line = json_codec.encode(record) + b"\n"
+    with open(_PAYMENTS_JOURNAL, 'ab') as journal:
+        journal.write(line)
+    state["offset"] += len(line)
+    state["records"] += 1
+
+
+def _compact_if_needed(payments):
+    # Compacting once the journal reaches half the snapshot size keeps the
+    # amortised cost of an append constant.
+    if _payment_state["records"] >= max(JOURNAL_COMPACT_MIN, len(payments) // 2):
+        save_payment_data(payments)
+
+
 def load_payment_data():
-    return load_data('data/payments.json')
+    with _payments_guard:
+        return _sync_payments()
 
 
 def save_payment_data(data):
-    save_data('data/payments.json', data)
+    """Write all payments as a new snapshot and empty the journal."""
+    with locked('data/payments.json'), _payments_guard:
+        save_data('data/payments.json', data)
+        # The snapshot has to be on disk before the journal is emptied
+        flush_writes(['data/payments.json'])
+        try:
+            os.truncate(_PAYMENTS_JOURNAL, 0)
+        except FileNotFoundError:
+            pass
+        _payment_state["payments"] = data
+        _payment_state["totals"] = _build_totals(data)
+        _payment_state["snapshot"] = _snapshot_signature()
+        _payment_state["offset"] = 0
+        _payment_state["records"] = 0
+
+
+def append_payment(payment):
+    """Add a payment by appending one journal line."""
+    with locked('data/payments.json'), _payments_guard:
+        payments = _sync_payments()
+        if _payment_state["snapshot"] is None:
+            save_payment_data(payments)
+        record = {"op": "add", "index": len(payments), "payment": payment}
+        _append_journal_record(record)
+        _apply_journal_record(_payment_state, record)
+        _compact_if_needed(payments)
+
+
+def update_payment(index, payment):
+    """Replace the payment at index by appending one journal line."""
+    with locked('data/payments.json'), _payments_guard:
+        payments = _sync_payments()
+        record = {"op": "put", "index": index, "payment": payment}
+        _append_journal_record(record)
+        _apply_journal_record(_payment_state, record)
+        _compact_if_needed(payments)
+
+
+def load_payment_totals():
+    """Return the index of transaction hash -> total amount paid."""
+    with _payments_guard:
+        _sync_payments()
+        return _payment_state["totals"]
+
+
+def compact_payment_journal():
+    """Fold the journal into data/payments.json."""
+    with locked('data/payments.json'), _payments_guard:
+        save_payment_data(_sync_payments())
+
+
+def find_payment(transaction):
+    """Return (key, payment) for the first payment of a transaction.
+
+    The key identifies the payment for update_payment().
+    """
+    for index, payment in enumerate(load_payment_data()):
+        if payment.get("transaction") == transaction:
+            return index, payment
+    return None, None
+
+
+def load_user_payments(username):
+    return [p for p in load_payment_data() if p.get("initiator") == username]
 
 
 def load_discounts_data():
@@ -131,3 +1222,7 @@ def load_discounts_data():
 
 def save_discounts_data(data):
     save_data('data/discounts.csv', data)
+
+
+if os.getenv("STORAGE_BACKEND", "json") == "sqlite":
+    from sqlite_backend import *  # noqa: E402,F401,F403
@@ -59,6 +59,57 @@ def test_update_parkinglot(api, created_parkinglot):
     assert r2.json()["name"] == "Lot A updated"
 
 
+def test_unchanged_parkinglot_is_not_modified(api, created_parkinglot):
+    url, headers = api
+    r = requests.get(f"{url}/parking-lots/{created_parkinglot}", headers=headers)
+    etag = r.headers["ETag"]
+
+    r = requests.get(f"{url}/parking-lots/{created_parkinglot}",
+                     headers=headers | {"If-None-Match": etag})
+    assert r.status_code == 304
+    assert r.content == b""
+
+    data = {"name": "Lot A", "location": "Street 9",
+            "tariff": 2, "daytariff": 20, "reserved": 0}
+    requests.put(f"{url}/parking-lots/{created_parkinglot}", headers=headers, json=data)
+    r = requests.get(f"{url}/parking-lots/{created_parkinglot}",
+                     headers=headers | {"If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.headers["ETag"] != etag
+    assert r.json()["location"] == "Street 9"
+
+
+def test_not_modified_matches_the_compressed_response(api, created_parkinglot):
+    url, headers = api
+    gzip_headers = headers | {"Accept-Encoding": "gzip"}
+    r = requests.get(f"{url}/parking-lots/{created_parkinglot}", headers=gzip_headers)
+    etag = r.headers["ETag"]
+    assert etag.startswith("W/")
+    assert r.headers["Vary"] == "Accept-Encoding"
+
+    r = requests.get(f"{url}/parking-lots/{created_parkinglot}",
+                     headers=gzip_headers | {"If-None-Match": etag})
+    assert r.status_code == 304
+    assert r.headers["ETag"] == etag
+    assert r.headers["Vary"] == "Accept-Encoding"
+
+    r = requests.get(f"{url}/parking-lots/{created_parkinglot}",
+                     headers=headers | {"Accept-Encoding": "identity", "If-None-Match": etag})
+    assert r.status_code == 304
+    assert r.headers["ETag"] == etag.removeprefix("W/")
+    assert r.headers["Vary"] == "Accept-Encoding"
+
+
+def test_parkinglot_list_etag_depends_on_query(api, created_parkinglot):
+    url, headers = api
+    etag = requests.get(f"{url}/parking-lots/", headers=headers).headers["ETag"]
+
+    r = requests.get(f"{url}/parking-lots/", headers=headers | {"If-None-Match": etag})
+    assert r.status_code == 304
+    r = requests.get(f"{url}/parking-lots/?fields=name", headers=headers | {"If-None-Match": etag})
+    assert r.status_code == 200
+
+
 def test_delete_parkinglot(api, created_parkinglot):
     url, headers = api
     r = requests.delete(
@@ -83,6 +134,84 @@ def test_get_nonexistent_parkinglot(api):
     assert r.status_code == 404
 
 
+def test_start_and_stop_session(api, created_parkinglot):
+    url, headers = api
+    base = f"{url}/parking-lots/{created_parkinglot}/sessions"
+    plate = {"licenseplate": "SESS-01"}
+
+    r = requests.post(f"{base}/start", headers=headers, json=plate)
+    assert r.status_code == 200
+    # Only one running session per licenseplate
+    r = requests.post(f"{base}/start", headers=headers, json=plate)
+    assert r.status_code == 401
+
+    r = requests.post(f"{base}/stop", headers=headers, json=plate)
+    assert r.status_code == 200
+    # Nothing left to stop
+    r = requests.post(f"{base}/stop", headers=headers, json=plate)
+    assert r.status_code == 401
+
+
+def test_sessions_by_date_range(api, created_parkinglot):
+    url, headers = api
+    base = f"{url}/parking-lots/{created_parkinglot}/sessions"
+    requests.post(f"{base}/start", headers=headers, json={"licenseplate": "RANGE-01"})
+    requests.post(f"{base}/stop", headers=headers, json={"licenseplate": "RANGE-01"})
+
+    r = requests.get(f"{base}?from=2000-01-01&to=2000-12-31", headers=headers)
+    assert r.status_code == 200
+    assert r.json() == {}
+
+    today = time.strftime("%Y-%m-%d")
+    r = requests.get(f"{base}?from={today}&to={today}", headers=headers)
+    assert r.status_code == 200
+    assert [s["licenseplate"] for s in r.json().values()] == ["RANGE-01"]
+
+    r = requests.get(f"{base}?from=01-01-2025", headers=headers)
+    assert r.status_code == 400
+
+
+def test_list_parkinglots_in_pages(api, created_parkinglot):
+    url, headers = api
+    for name in ("Page lot 1", "Page lot 2"):
+        requests.post(f"{url}/parking-lots", headers=headers, json={
+            "name": name, "location": "Paging Street", "tariff": 1, "daytariff": 10, "reserved": 0})
+
+    r = requests.get(f"{url}/parking-lots/?location=paging+street&limit=1&fields=name", headers=headers)
+    assert r.status_code == 200
+    assert list(r.json().values()) == [{"name": "Page lot 1"}]
+    cursor = r.headers["X-Next-Cursor"]
+
+    r = requests.get(f"{url}/parking-lots/?location=paging+street&limit=1&cursor={cursor}", headers=headers)
+    assert [lot["name"] for lot in r.json().values()] == ["Page lot 2"]
+    assert "X-Next-Cursor" not in r.headers
+    for lid in r.json():
+        requests.delete(f"{url}/parking-lots/{lid}", headers=headers)
+    requests.delete(f"{url}/parking-lots/{cursor}", headers=headers)
+
+    r = requests.get(f"{url}/parking-lots/?limit=0", headers=headers)
+    assert r.status_code == 400
+
+
+def test_list_sessions_in_pages(api, created_parkinglot):
+    url, headers = api
+    base = f"{url}/parking-lots/{created_parkinglot}/sessions"
+    for plate in ("PAGE-01", "PAGE-02"):
+        requests.post(f"{base}/start", headers=headers, json={"licenseplate": plate})
+    requests.post(f"{base}/stop", headers=headers, json={"licenseplate": "PAGE-01"})
+
+    r = requests.get(f"{base}?state=open&fields=licenseplate", headers=headers)
+    assert list(r.json().values()) == [{"licenseplate": "PAGE-02"}]
+
+    r = requests.get(f"{base}?limit=1", headers=headers)
+    assert [s["licenseplate"] for s in r.json().values()] == ["PAGE-01"]
+    r = requests.get(f"{base}?limit=1&cursor={r.headers['X-Next-Cursor']}", headers=headers)
+    assert [s["licenseplate"] for s in r.json().values()] == ["PAGE-02"]
+
+    assert requests.get(f"{base}?state=parked", headers=headers).status_code == 400
+    requests.post(f"{base}/stop", headers=headers, json={"licenseplate": "PAGE-02"})
+
+
 def wait_for_server(url, max_attempts=10, delay=2):
     """Wait for server to be available."""
     for attempt in range(max_attempts):
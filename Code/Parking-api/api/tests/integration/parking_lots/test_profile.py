@@ -50,10 +50,28 @@ def test_update_profile(api, test_profile):
     assert data["role"] == test_profile["role"]
 
     # Reset test state
-    reset_payload = {"name": "Test User", "password": "test"}
+    reset_payload = {"name": "Test User", "password": "testpass"}
     requests.put(f"{url}/profile", headers=headers, json=reset_payload)
 
 
+def test_profile_of_logged_in_user(api):
+    """The profile should hold the stored user fields, also with signed tokens."""
+    url, headers = api
+    username = f"profile_{time.time_ns()}"
+    credentials = {"username": username, "password": "secret"}
+    requests.post(f"{url}/register", headers=headers, json=credentials | {"name": "Profile User"})
+    r = requests.post(f"{url}/login", headers=headers, json=credentials)
+    token = r.json()["session_token"]
+
+    r = requests.get(f"{url}/profile", headers={"Authorization": token})
+    assert r.status_code == 200
+    data = r.json()
+    assert data["username"] == username
+    assert data["name"] == "Profile User"
+    if token.startswith("v1."):
+        assert "password" not in data
+
+
 def test_get_profile_unauthorized():
     """Test fetching profile without authorization."""
     url = "http://localhost:8000"
@@ -2,6 +2,7 @@ import pytest
 import json
 import os
 import sys
+import time
 from unittest.mock import patch, mock_open, call
 
 CURRENT_DIR = os.path.dirname(__file__)
@@ -13,6 +14,13 @@ if PROJECT_ROOT not in sys.path:
 import storage_utils
 
 
+@pytest.fixture(autouse=True)
+def work_dir(tmp_path, monkeypatch):
+    """Run every test in its own directory, so the lock files locked() creates
+    next to data files don't end up in the repository's data/."""
+    monkeypatch.chdir(tmp_path)
+
+
 class TestLoadJson:
     def load_json(filename):
         try:
@@ -91,18 +99,588 @@ class TestLoadJson:
 
 
 
+class TestJsonCache:
+    """Tests for the mtime-validated load_json cache."""
+
+    def setup_method(self):
+        storage_utils.invalidate_cache()
+
+    def test_unchanged_file_is_served_from_cache(self, tmp_path):
+        """Second load of an unchanged file should be a cache hit returning the same object."""
+        path = str(tmp_path / "lots.json")
+        with open(path, "w") as f:
+            json.dump({"1": {"name": "Lot A"}}, f)
+
+        before = storage_utils.cache_info()
+        first = storage_utils.load_json(path)
+        second = storage_utils.load_json(path)
+        after = storage_utils.cache_info()
+
+        assert first is second
+        assert after["misses"] - before["misses"] == 1
+        assert after["hits"] - before["hits"] == 1
+
+    def test_modified_file_is_reparsed(self, tmp_path):
+        """A change in file size/mtime should invalidate the cached entry."""
+        path = str(tmp_path / "lots.json")
+        with open(path, "w") as f:
+            json.dump({"1": {}}, f)
+        storage_utils.load_json(path)
+
+        with open(path, "w") as f:
+            json.dump({"1": {}, "2": {}}, f)
+
+        assert storage_utils.load_json(path) == {"1": {}, "2": {}}
+
+    def test_replaced_file_with_same_size_and_mtime_is_reparsed(self, tmp_path):
+        """A file renamed over the cached one should be noticed by its inode."""
+        path = str(tmp_path / "lots.json")
+        with open(path, "w") as f:
+            json.dump({"1": {}}, f)
+        mtime = os.stat(path).st_mtime_ns
+        storage_utils.load_json(path)
+        version = storage_utils.data_version(path)
+
+        with open(path + ".new", "w") as f:
+            json.dump({"2": {}}, f)
+        os.utime(path + ".new", ns=(mtime, mtime))
+        os.replace(path + ".new", path)
+
+        assert storage_utils.load_json(path) == {"2": {}}
+        assert storage_utils.data_version(path) != version
+
+    def test_save_data_invalidates_cache(self, tmp_path):
+        """save_data should drop the cached entry for the written file."""
+        path = str(tmp_path / "lots.json")
+        storage_utils.save_data(path, {"1": {}})
+        storage_utils.load_json(path)
+        assert storage_utils.cache_info()["entries"] == 1
+
+        storage_utils.save_data(path, {"2": {}})
+
+        assert storage_utils.cache_info()["entries"] == 0
+        assert storage_utils.load_json(path) == {"2": {}}
+
+    def test_missing_file_is_not_cached(self, tmp_path):
+        """Missing files should return the default structure without a cache entry."""
+        path = str(tmp_path / "users.json")
+
+        assert storage_utils.load_json(path) == []
+        assert storage_utils.cache_info()["entries"] == 0
+
+    def test_data_version_changes_on_save(self, tmp_path):
+        """data_version should stay the same until the file is saved again."""
+        path = str(tmp_path / "lots.json")
+        assert storage_utils.data_version(path) == "0"
+
+        storage_utils.save_data(path, {"1": {}})
+        version = storage_utils.data_version(path)
+        assert storage_utils.data_version(path) == version
+
+        storage_utils.save_data(path, {"1": {}, "2": {}})
+        assert storage_utils.data_version(path) != version
+
+
+class TestLocked:
+    """Tests for the per-file locks around read-modify-write cycles."""
+
+    def test_concurrent_updates_are_not_lost(self, tmp_path):
+        """Parallel load/append/save cycles under locked() should keep every update."""
+        import threading
+
+        path = str(tmp_path / "payments.json")
+        storage_utils.save_data(path, [])
+
+        def append_payments(worker):
+            for i in range(25):
+                with storage_utils.locked(path):
+                    payments = storage_utils.load_json(path)
+                    payments.append({"transaction": f"{worker}-{i}"})
+                    storage_utils.save_data(path, payments)
+
+        threads = [threading.Thread(target=append_payments, args=(w,)) for w in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert len(storage_utils.load_json(path)) == 100
+
+    @pytest.mark.skipif(storage_utils.fcntl is None or not hasattr(os, "fork"),
+                        reason="cross-process locking needs fcntl and fork")
+    def test_concurrent_processes_do_not_lose_updates(self, tmp_path):
+        """Forked processes doing load/append/save under locked() should keep every update."""
+        path = str(tmp_path / "payments.json")
+        storage_utils.save_data(path, [])
+
+        children = []
+        for worker in range(3):
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    for i in range(20):
+                        with storage_utils.locked(path):
+                            payments = storage_utils.load_json(path)
+                            payments.append({"transaction": f"{worker}-{i}"})
+                            storage_utils.save_data(path, payments)
+                finally:
+                    os._exit(0)
+            children.append(pid)
+        for pid in children:
+            os.waitpid(pid, 0)
+
+        assert len(storage_utils.load_json(path)) == 60
+
+    def test_nested_locked_is_reentrant(self, tmp_path):
+        """Locking a file that the thread already holds should not deadlock."""
+        path = str(tmp_path / "lots.json")
+
+        with storage_utils.locked(path):
+            with storage_utils.locked(path, str(tmp_path / "other.json")):
+                storage_utils.save_data(path, {"1": {}})
+
+        assert storage_utils.load_json(path) == {"1": {}}
+
+    def test_locked_load_returns_private_copy(self, tmp_path):
+        """Data loaded inside locked() must not be the shared cached object."""
+        path = str(tmp_path / "lots.json")
+        storage_utils.save_data(path, {"1": {}})
+        shared = storage_utils.load_json(path)
+
+        with storage_utils.locked(path):
+            private = storage_utils.load_json(path)
+            private["2"] = {}
+
+        assert private is not shared
+        assert "2" not in storage_utils.load_json(path)
+
+
+class TestPaymentJournal:
+    """Tests for the append-only payments journal."""
+
+    @pytest.fixture(autouse=True)
+    def data_dir(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        os.makedirs("data")
+        storage_utils.invalidate_cache()
+        storage_utils._payment_state["payments"] = None
+        yield
+        storage_utils._payment_state["payments"] = None
+
+    def restart(self):
+        """Forget the in-memory state, as a freshly started server would."""
+        storage_utils.invalidate_cache()
+        storage_utils._payment_state["payments"] = None
+
+    def test_append_does_not_rewrite_snapshot(self):
+        """Appending should only add journal lines and leave payments.json alone."""
+        storage_utils.append_payment({"transaction": "t1", "amount": 1})
+        with open("data/payments.json") as f:
+            snapshot = f.read()
+
+        storage_utils.append_payment({"transaction": "t2", "amount": 2})
+        storage_utils.append_payment({"transaction": "t3", "amount": 3})
+
+        with open("data/payments.json") as f:
+            assert f.read() == snapshot
+        with open("data/payments.jsonl") as f:
+            assert len(f.readlines()) == 3
+        assert [p["transaction"] for p in storage_utils.load_payment_data()] == ["t1", "t2", "t3"]
+
+    def test_journal_is_replayed_on_startup(self):
+        """A restarted process should rebuild the list from snapshot plus journal."""
+        storage_utils.save_payment_data([{"transaction": "old", "amount": 5}])
+        storage_utils.append_payment({"transaction": "new", "amount": 1})
+        storage_utils.update_payment(0, {"transaction": "old", "amount": 5, "completed": "yes"})
+
+        self.restart()
+        payments = storage_utils.load_payment_data()
+
+        assert payments == [
+            {"transaction": "old", "amount": 5, "completed": "yes"},
+            {"transaction": "new", "amount": 1},
+        ]
+
+    def test_compaction_folds_journal_into_snapshot(self, monkeypatch):
+        """Reaching the compaction threshold should empty the journal."""
+        monkeypatch.setattr(storage_utils, "JOURNAL_COMPACT_MIN", 3)
+        for i in range(3):
+            storage_utils.append_payment({"transaction": f"t{i}", "amount": i})
+
+        assert os.path.getsize("data/payments.jsonl") == 0
+        with open("data/payments.json") as f:
+            assert len(json.load(f)) == 3
+
+    def test_records_already_in_snapshot_are_not_duplicated(self):
+        """A crash between writing the snapshot and truncating the journal must not duplicate payments."""
+        storage_utils.append_payment({"transaction": "t1", "amount": 1})
+        storage_utils.append_payment({"transaction": "t2", "amount": 2})
+        with open("data/payments.json", "w") as f:
+            json.dump(storage_utils.load_payment_data(), f)
+
+        self.restart()
+
+        assert len(storage_utils.load_payment_data()) == 2
+
+    def test_torn_last_line_is_ignored(self):
+        """A partially written journal line should be skipped and then replaced by the next append."""
+        storage_utils.append_payment({"transaction": "t1", "amount": 1})
+        with open("data/payments.jsonl", "a") as f:
+            f.write('{"op": "add", "index": 1, "paym')
+
+        self.restart()
+        assert len(storage_utils.load_payment_data()) == 1
+
+        storage_utils.append_payment({"transaction": "t2", "amount": 2})
+        self.restart()
+        assert [p["transaction"] for p in storage_utils.load_payment_data()] == ["t1", "t2"]
+
+    def test_totals_follow_appends_updates_and_replay(self):
+        """The transaction index should sum amounts per hash through every kind of write."""
+        storage_utils.save_payment_data([{"transaction": "h1", "amount": 10}])
+        storage_utils.append_payment({"transaction": "h1", "amount": 5})
+        storage_utils.append_payment({"transaction": "h2", "amount": 7})
+        storage_utils.update_payment(2, {"transaction": "h2", "amount": 8})
+        storage_utils.append_payment({"transaction": "h1", "amount": -3})
+
+        totals = storage_utils.load_payment_totals()
+        assert totals == {"h1": 12, "h2": 8}
+
+        self.restart()
+        assert storage_utils.load_payment_totals() == {"h1": 12, "h2": 8}
+
+
+class TestUserIndex:
+    """Tests for the username index behind get_user."""
+
+    @pytest.fixture(autouse=True)
+    def data_dir(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        os.makedirs("data")
+        storage_utils.invalidate_cache()
+        storage_utils._user_positions["positions"] = None
+        yield
+        storage_utils.invalidate_cache()
+        storage_utils._user_positions["positions"] = None
+
+    def test_lookup_follows_add_and_update(self):
+        """Users added or changed through the storage layer should be found right away."""
+        storage_utils.write_json("data/users.json", [{"username": "alice", "name": "Alice"}])
+        assert storage_utils.get_user("alice")["name"] == "Alice"
+
+        storage_utils.add_user({"username": "bob", "name": "Bob"})
+        storage_utils.update_user("alice", {"name": "Alice B"})
+
+        assert storage_utils.get_user("bob")["name"] == "Bob"
+        assert storage_utils.get_user("alice")["name"] == "Alice B"
+        assert storage_utils.get_user("carol") is None
+
+    def test_update_of_unknown_user_without_password(self):
+        """update_user should not add a user that has no password."""
+        storage_utils.write_json("data/users.json", [{"username": "alice"}])
+
+        assert storage_utils.update_user("nobody", {"name": "Nobody"}) is None
+        assert storage_utils.get_user("nobody") is None
+
+    def test_index_is_not_rebuilt_for_unchanged_file(self):
+        """Repeated lookups should reuse the index built on first use."""
+        storage_utils.write_json("data/users.json", [{"username": "alice"}])
+        storage_utils.get_user("alice")
+        positions = storage_utils._user_positions["positions"]
+
+        storage_utils.get_user("alice")
+        storage_utils.add_user({"username": "bob"})
+
+        assert storage_utils._user_positions["positions"] is positions
+
+    def test_outside_write_rebuilds_index(self):
+        """A users.json written elsewhere should not be answered from the old index."""
+        storage_utils.write_json("data/users.json", [{"username": "alice"}, {"username": "bob"}])
+        assert storage_utils.get_user("bob") == {"username": "bob"}
+
+        storage_utils.write_json("data/users.json", [{"username": "bob", "name": "moved"}])
+
+        assert storage_utils.get_user("bob") == {"username": "bob", "name": "moved"}
+        assert storage_utils.get_user("alice") is None
+
+    def test_list_older_than_index_is_not_trusted(self):
+        """A users list loaded before a write should not be read at the index's positions."""
+        storage_utils.write_json("data/users.json", [{"username": "alice"}])
+        old = storage_utils.load_user_data()
+
+        storage_utils.add_user({"username": "bob"})
+        assert storage_utils._find_user(old, "bob") is None
+
+        storage_utils.write_json("data/users.json", [{"username": "bob"}, {"username": "alice"}])
+        storage_utils.get_user("bob")
+        assert storage_utils._find_user(old, "alice") == 0
+
+
+class TestNextId:
+    """Tests for the persisted ID sequences."""
+
+    @pytest.fixture(autouse=True)
+    def data_dir(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        os.makedirs("data")
+        storage_utils.invalidate_cache()
+        yield
+        storage_utils.invalidate_cache()
+
+    def test_sequence_starts_after_existing_keys(self):
+        """A new sequence should continue after the highest numeric key."""
+        existing = lambda: {"1": {}, "4": {}, "x": {}}
+
+        assert storage_utils.next_id("reservations", existing) == "5"
+        assert storage_utils.next_id("reservations", existing) == "6"
+        assert storage_utils.next_id("parking-lots") == "1"
+
+    def test_ids_are_not_reused_after_delete(self):
+        """Removing the newest record must not hand its ID out again."""
+        records = {}
+        for _ in range(3):
+            records[storage_utils.next_id("reservations", lambda: records)] = {}
+        del records["3"]
+        storage_utils.invalidate_cache()
+
+        assert storage_utils.next_id("reservations", lambda: records) == "4"
+
+    def test_concurrent_callers_get_unique_ids(self):
+        """Threads asking at the same time should never get the same ID."""
+        import threading
+
+        ids = []
+
+        def worker():
+            for _ in range(25):
+                ids.append(storage_utils.next_id("sessions-1"))
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert sorted(ids, key=int) == [str(i) for i in range(1, 101)]
+
+
+class TestBillingLedger:
+    """Tests for the per-user billing ledger."""
+
+    @pytest.fixture(autouse=True)
+    def data_dir(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        os.makedirs("data/pdata")
+        storage_utils.invalidate_cache()
+        yield
+        storage_utils.invalidate_cache()
+
+    def session(self, user, stopped=None):
+        return {"licenseplate": "AB-12-CD", "started": "01-01-2025 10:00:00",
+                "stopped": stopped, "user": user}
+
+    def test_ledger_is_built_from_existing_sessions(self):
+        """Sessions recorded before the ledger existed should be picked up once."""
+        storage_utils.write_json("data/parking-lots.json", {"1": {}, "2": {}})
+        storage_utils.write_json("data/pdata/p1-sessions.json", {"1": self.session("alice")})
+        storage_utils.write_json("data/pdata/p2-sessions.json", {
+            "1": self.session("bob"), "2": self.session("alice", "01-01-2025 11:00:00")})
+
+        ledger = storage_utils.load_billing_ledger("alice")
+
+        assert sorted(ledger) == ["1/1", "2/2"]
+        assert ledger["2/2"]["session"]["stopped"] == "01-01-2025 11:00:00"
+        assert list(storage_utils.load_billing_ledger("bob")) == ["2/1"]
+        assert storage_utils.load_billing_ledger("carol") == {}
+
+    def test_ledger_follows_session_writes(self):
+        """Starting, stopping and deleting a session should update the user's ledger."""
+        storage_utils.load_billing_ledger("alice")
+
+        storage_utils.save_parking_session("1", "1", self.session("alice"))
+        assert storage_utils.load_billing_ledger("alice")["1/1"]["session"]["stopped"] is None
+
+        storage_utils.save_parking_session("1", "1", self.session("alice", "01-01-2025 11:00:00"))
+        assert storage_utils.load_billing_ledger("alice")["1/1"]["session"]["stopped"] == "01-01-2025 11:00:00"
+
+        storage_utils.delete_parking_session("1", "1")
+        assert storage_utils.load_billing_ledger("alice") == {}
+
+    def test_username_does_not_change_file_type(self):
+        """A username containing "users" must still get a dict ledger."""
+        storage_utils.save_parking_session("1", "1", self.session("superusers/x"))
+
+        assert list(storage_utils.load_billing_ledger("superusers/x")) == ["1/1"]
+
+    def test_sessions_without_user_get_no_ledger(self):
+        """Sessions without a user should not be billed to a "None" ledger."""
+        storage_utils.write_json("data/parking-lots.json", {"1": {}})
+        storage_utils.write_json("data/pdata/p1-sessions.json", {"1": self.session(None)})
+        storage_utils.load_billing_ledger("alice")
+        storage_utils.save_parking_session("1", "2", {"licenseplate": "XY-99-ZZ"})
+        storage_utils.delete_parking_session("1", "2")
+
+        assert not [name for name in os.listdir("data/billing") if name.endswith(".json")]
+
+
+class TestOpenSessions:
+    """Tests for the index of running parking sessions."""
+
+    @pytest.fixture(autouse=True)
+    def data_dir(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        os.makedirs("data/pdata")
+        storage_utils.invalidate_cache()
+        storage_utils._open_sessions.clear()
+        yield
+        storage_utils.invalidate_cache()
+        storage_utils._open_sessions.clear()
+
+    def session(self, plate, stopped=None):
+        return {"licenseplate": plate, "started": "01-01-2025 10:00:00", "stopped": stopped}
+
+    def test_index_follows_start_and_stop(self):
+        """Starting and stopping through save_parking_session should update the index."""
+        assert storage_utils.find_open_session("1", "AB-12-CD") == (None, None)
+
+        storage_utils.save_parking_session("1", "1", self.session("AB-12-CD"))
+        sid, session = storage_utils.find_open_session("1", "AB-12-CD")
+        assert sid == "1"
+        assert session["stopped"] is None
+
+        storage_utils.save_parking_session("1", "1", self.session("AB-12-CD", "01-01-2025 11:00:00"))
+        assert storage_utils.find_open_session("1", "AB-12-CD") == (None, None)
+
+    def test_index_is_built_from_history(self):
+        """Only sessions without a stop time should be found in an existing file."""
+        storage_utils.write_json("data/pdata/p1-sessions.json", {
+            "1": self.session("AB-12-CD", "01-01-2025 11:00:00"),
+            "2": self.session("AB-12-CD"),
+            "3": self.session("XY-99-ZZ", "01-01-2025 12:00:00"),
+        })
+
+        assert storage_utils.find_open_session("1", "AB-12-CD")[0] == "2"
+        assert storage_utils.find_open_session("1", "XY-99-ZZ") == (None, None)
+        assert storage_utils.find_open_session("2", "AB-12-CD") == (None, None)
+
+    def test_index_is_rebuilt_after_outside_write(self):
+        """A write that bypassed save_parking_session should not leave the index stale."""
+        storage_utils.save_parking_session("1", "1", self.session("AB-12-CD"))
+        assert storage_utils.find_open_session("1", "AB-12-CD")[0] == "1"
+
+        storage_utils.write_json("data/pdata/p1/2025-01.json", {
+            "1": self.session("AB-12-CD", "01-01-2025 11:00:00"),
+            "2": self.session("XY-99-ZZ"),
+        })
+
+        assert storage_utils.find_open_session("1", "AB-12-CD") == (None, None)
+        assert storage_utils.find_open_session("1", "XY-99-ZZ")[0] == "2"
+
+
+class TestSessionPartitions:
+    """Tests for the per-lot, per-month session files."""
+
+    @pytest.fixture(autouse=True)
+    def data_dir(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        os.makedirs("data/pdata")
+        storage_utils.invalidate_cache()
+        storage_utils._open_sessions.clear()
+        yield
+        storage_utils.invalidate_cache()
+        storage_utils._open_sessions.clear()
+
+    def session(self, started, stopped=None, plate="AB-12-CD"):
+        return {"licenseplate": plate, "started": started, "stopped": stopped, "user": "alice"}
+
+    def test_sessions_are_stored_per_month(self):
+        storage_utils.save_parking_session("1", "1", self.session("31-01-2025 23:00:00"))
+        storage_utils.save_parking_session("1", "2", self.session("01-02-2025 08:00:00", plate="XY-99-ZZ"))
+        # Stopped in February, but stays with the January sessions
+        storage_utils.save_parking_session("1", "1", self.session("31-01-2025 23:00:00", "01-02-2025 01:00:00"))
+
+        with open("data/pdata/p1/2025-01.json") as f:
+            assert list(json.load(f)) == ["1"]
+        with open("data/pdata/p1/2025-02.json") as f:
+            assert list(json.load(f)) == ["2"]
+        assert list(storage_utils.load_parking_sessions("1")) == ["1", "2"]
+        assert storage_utils.get_parking_session("1", "1")["stopped"] == "01-02-2025 01:00:00"
+        assert storage_utils.get_parking_session("1", "3") is None
+
+    def test_legacy_file_is_split_up(self):
+        storage_utils.write_json("data/pdata/p1-sessions.json", {
+            "1": self.session("10-12-2024 10:00:00", "10-12-2024 11:00:00"),
+            "2": self.session("05-01-2025 10:00:00"),
+        })
+
+        assert storage_utils.find_open_session("1", "AB-12-CD")[0] == "2"
+        assert not os.path.exists("data/pdata/p1-sessions.json")
+        files = [name for name in os.listdir("data/pdata/p1") if name.endswith(".json")]
+        assert sorted(files) == ["2024-12.json", "2025-01.json", "index.json"]
+        assert storage_utils.get_parking_session("1", "1")["started"] == "10-12-2024 10:00:00"
+
+    def test_past_month_without_running_sessions_is_sealed(self):
+        storage_utils.save_parking_session("1", "1", self.session("10-01-2025 10:00:00"))
+        storage_utils.save_parking_session("1", "1", self.session("10-01-2025 10:00:00", "10-01-2025 12:00:00"))
+        january = "data/pdata/p1/2025-01.json"
+        assert not os.stat(january).st_mode & 0o222
+        mtime = os.stat(january).st_mtime_ns
+
+        storage_utils.save_parking_session("1", "2", self.session("03-02-2025 10:00:00"))
+        assert os.stat(january).st_mtime_ns == mtime
+
+        storage_utils.delete_parking_session("1", "1")
+        assert storage_utils.load_parking_sessions("1") == {"2": self.session("03-02-2025 10:00:00")}
+
+    def test_range_reads_only_overlapping_partitions(self):
+        from datetime import datetime
+        for sid, started in enumerate(["10-11-2024 10:00:00", "10-12-2024 10:00:00", "20-12-2024 10:00:00", "10-01-2025 10:00:00"], 1):
+            storage_utils.save_parking_session("1", str(sid), self.session(started, started))
+        storage_utils.invalidate_cache()
+
+        with patch("storage_utils.load_json", wraps=storage_utils.load_json) as spy:
+            sessions = storage_utils.load_parking_sessions(
+                "1", datetime(2024, 12, 15), datetime(2025, 1, 31, 23, 59, 59))
+
+        assert list(sessions) == ["3", "4"]
+        read = [c.args[0] for c in spy.call_args_list]
+        assert "data/pdata/p1/2024-11.json" not in read
+        assert "data/pdata/p1/2024-12.json" in read
+
+    def test_iter_sessions_pages_through_partitions(self):
+        from itertools import islice
+        for sid, started in enumerate(["10-11-2024 10:00:00", "10-12-2024 10:00:00", "20-12-2024 10:00:00"], 1):
+            storage_utils.save_parking_session("1", str(sid), self.session(started, started))
+        storage_utils.save_parking_session("1", "10", self.session("10-01-2025 10:00:00", plate="XY-99-ZZ"))
+        storage_utils.invalidate_cache()
+
+        with patch("storage_utils.load_json", wraps=storage_utils.load_json) as spy:
+            page = list(islice(storage_utils.iter_parking_sessions("1", after=2), 1))
+
+        assert [sid for sid, session in page] == ["3"]
+        read = [c.args[0] for c in spy.call_args_list]
+        assert "data/pdata/p1/2024-11.json" not in read
+        assert "data/pdata/p1/2025-01.json" not in read
+        assert [sid for sid, s in storage_utils.iter_parking_sessions("1", state="open")] == ["10"]
+        assert [sid for sid, s in storage_utils.iter_parking_sessions("1", licenseplate="AB-12-CD", after=1)] == ["2", "3"]
+        assert list(storage_utils.iter_parking_sessions("1", user="bob")) == []
+
+
 class TestWriteJson:
     """Tests for write_json function with comprehensive scenarios."""
     
     def test_write_json_valid_data(self):
-        """Valid data structure should be serialized and written to file in write mode."""
+        """Valid data should be written to a temporary file that is renamed over the target."""
         test_data = {"users": [{"id": 1, "name": "John"}]}
         mock_file = mock_open()
         
-        with patch("builtins.open", mock_file):
-            storage_utils.write_json("test.json", test_data)
+        with patch("builtins.open", mock_file), patch("os.replace") as mock_replace:
+            storage_utils.write_json("test.json", test_data, fsync="none")
         
-        mock_file.assert_called_once_with("test.json", "w")
+        temp = mock_file.call_args.args[0]
+        assert temp.startswith("test.json.") and temp.endswith(".tmp")
+        mock_file.assert_called_once_with(temp, "w")
+        mock_replace.assert_called_once_with(temp, "test.json")
         written_content = "".join(call.args[0] for call in mock_file().write.call_args_list)
         assert json.loads(written_content) == test_data
     
@@ -120,14 +698,91 @@ class TestWriteJson:
         test_data = {"created": datetime(2023, 1, 1, 12, 0, 0)}
         mock_file = mock_open()
         
-        with patch("builtins.open", mock_file):
-            storage_utils.write_json("datetime.json", test_data)
+        with patch("builtins.open", mock_file), patch("os.replace"):
+            storage_utils.write_json("datetime.json", test_data, fsync="none")
         
-        mock_file.assert_called_once_with("datetime.json", "w")
+        mock_file.assert_called_once()
         # Ensure JSON serialization succeeded with datetime objects (requires default=str)
         written_calls = mock_file().write.call_args_list
         assert len(written_calls) > 0
 
+    @pytest.mark.parametrize("fsync", ["none", "file", "full"])
+    def test_write_json_replaces_file(self, tmp_path, fsync):
+        """The target should hold the new data and no temporary file should be left."""
+        path = tmp_path / "lots.json"
+        path.write_text('{"1": {}}')
+
+        storage_utils.write_json(str(path), {"2": {}}, fsync=fsync)
+
+        assert json.loads(path.read_text()) == {"2": {}}
+        assert os.listdir(tmp_path) == ["lots.json"]
+
+    def test_failed_write_keeps_old_file(self, tmp_path):
+        """An error while writing should leave the old contents and no temporary file."""
+        path = tmp_path / "lots.json"
+        path.write_text('{"1": {}}')
+
+        with patch("os.replace", side_effect=OSError("disk full")):
+            with pytest.raises(OSError):
+                storage_utils.write_json(str(path), {"2": {}})
+
+        assert json.loads(path.read_text()) == {"1": {}}
+        assert os.listdir(tmp_path) == ["lots.json"]
+
+
+class TestWriteBehind:
+    """Tests for coalescing JSON saves with STORAGE_WRITE_BEHIND."""
+
+    @pytest.fixture(autouse=True)
+    def write_behind(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(storage_utils, "WRITE_BEHIND", 60)
+        storage_utils.invalidate_cache()
+        yield
+        storage_utils.flush_writes()
+
+    def test_saves_are_coalesced(self, tmp_path):
+        path = str(tmp_path / "lots.json")
+
+        with patch("os.replace", wraps=os.replace) as mock_replace:
+            for i in range(10):
+                storage_utils.save_data(path, {str(i): {}})
+
+            assert not os.path.exists(path)
+            assert storage_utils.load_json(path) == {"9": {}}
+
+            storage_utils.flush_writes()
+
+        assert mock_replace.call_count == 1
+        with open(path) as f:
+            assert json.load(f) == {"9": {}}
+
+    def test_pending_data_reads_like_the_file(self, tmp_path):
+        from datetime import datetime
+        path = str(tmp_path / "lots.json")
+        lot = {"name": "Lot A", "created_at": datetime(2023, 1, 1)}
+        storage_utils.save_data(path, {"1": lot})
+        lot["name"] = "changed after save"
+
+        with storage_utils.locked(path):
+            data = storage_utils.load_json(path)
+            data["1"]["name"] = "changed"
+
+        assert storage_utils.load_json(path) == {
+            "1": {"name": "Lot A", "created_at": "2023-01-01 00:00:00"}
+        }
+
+    def test_pending_saves_are_written_after_the_window(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(storage_utils, "WRITE_BEHIND", 0.05)
+        path = str(tmp_path / "lots.json")
+        storage_utils.save_data(path, {"1": {}})
+
+        deadline = time.monotonic() + 5
+        while not os.path.exists(path) and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        with open(path) as f:
+            assert json.load(f) == {"1": {}}
+
 
 class TestLoadCsv:
     """Tests for load_csv function."""
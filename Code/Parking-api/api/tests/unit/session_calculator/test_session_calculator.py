@@ -8,7 +8,7 @@ from hashlib import md5
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..')))
 
-from session_calculator import calculate_price, generate_payment_hash, generate_transaction_validation_hash, check_payment_amount
+from session_calculator import calculate_price, generate_payment_hash, generate_transaction_validation_hash, check_payment_amount, build_billing
 
 def load_payment_data():
     return []
@@ -88,21 +88,41 @@ def test_generate_transaction_validation_hash():
     assert hash1 != hash2
 
 def test_check_payment_amount(mocker):
-    mock_payments = [
-        {"transaction": "hash1", "amount": 10.0},
-        {"transaction": "hash2", "amount": 20.0},
-        {"transaction": "hash1", "amount": 5.0},
-        {"transaction": "hash3", "amount": 15.0}
-    ]
-    mocker.patch('session_calculator.load_payment_data', return_value=mock_payments)
+    mock_totals = {"hash1": 15.0, "hash2": 20.0, "hash3": 15.0}
+    mocker.patch('session_calculator.load_payment_totals', return_value=mock_totals)
     total = check_payment_amount("hash1")
     assert total == 15.0
 
 def test_check_payment_amount_no_match(mocker):
-    mock_payments = [
-        {"transaction": "hash2", "amount": 20.0},
-        {"transaction": "hash3", "amount": 15.0}
-    ]
-    mocker.patch('session_calculator.load_payment_data', return_value=mock_payments)
+    mock_totals = {"hash2": 20.0, "hash3": 15.0}
+    mocker.patch('session_calculator.load_payment_totals', return_value=mock_totals)
     total = check_payment_amount("hash1")
-    assert total == 0
\ No newline at end of file
+    assert total == 0
+
+def test_build_billing(mocker):
+    session = {
+        "licenseplate": "AB-12-CD",
+        "started": "01-01-2023 10:00:00",
+        "stopped": "01-01-2023 14:00:00",
+        "user": "testuser"
+    }
+    ledger = {
+        "1/1": {"parkinglot": "1", "sid": "1", "session": session},
+        "9/1": {"parkinglot": "9", "sid": "1", "session": session}
+    }
+    lots = {"1": {"name": "Lot A", "tariff": 2.0, "daytariff": 10.0, "capacity": 5}}
+    thash = generate_payment_hash("1", session)
+    mocker.patch('session_calculator.load_billing_ledger', return_value=ledger)
+    mocker.patch('session_calculator.get_parking_lot', side_effect=lots.get)
+    mocker.patch('session_calculator.load_payment_totals', return_value={thash: 5.0})
+
+    bill = build_billing("testuser")
+
+    # The session in the removed lot 9 is left out
+    assert len(bill) == 1
+    assert bill[0]["amount"] == 8.0
+    assert bill[0]["payed"] == 5.0
+    assert bill[0]["balance"] == 3.0
+    assert bill[0]["thash"] == thash
+    assert bill[0]["parking"] == {"name": "Lot A", "tariff": 2.0, "daytariff": 10.0}
+    assert bill[0]["session"]["hours"] == 4
@@ -0,0 +1,149 @@
+import sys
+import os
+import asyncio
+import threading
+import http.client
+import json
+import gzip
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import async_server
+import json_codec
+import server
+
+
+def start_server():
+    started = threading.Event()
+    info = {}
+
+    def ready(server):
+        info["port"] = server.sockets[0].getsockname()[1]
+        info["server"] = server
+        started.set()
+
+    def run():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        info["loop"] = loop
+        try:
+            loop.run_until_complete(async_server.serve(port=0, threads=2, ready=ready))
+        except asyncio.CancelledError:
+            pass
+        # Let open connections see EOF and finish before the loop goes away
+        pending = asyncio.all_tasks(loop)
+        for task in pending:
+            task.cancel()
+        loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        loop.close()
+
+    info["thread"] = threading.Thread(target=run, daemon=True)
+    info["thread"].start()
+    assert started.wait(5)
+    return info
+
+
+def stop_server(info):
+    info["loop"].call_soon_threadsafe(info["server"].close)
+    info["thread"].join(5)
+
+
+def test_keep_alive_serves_several_requests_on_one_connection():
+    info = start_server()
+    conn = http.client.HTTPConnection("localhost", info["port"], timeout=5)
+
+    for _ in range(3):
+        conn.request("GET", "/")
+        response = conn.getresponse()
+        assert response.status == 200
+        assert response.getheader("Content-Length") == str(len(b"Server is running"))
+        assert response.getheader("Connection") == "keep-alive"
+        assert response.read() == b"Server is running"
+
+    conn.close()
+    stop_server(info)
+
+
+def test_streamed_response_is_chunked_and_keeps_the_connection():
+    def stream_numbers(handler):
+        handler.send_response(200)
+        handler.send_header("Content-type", "application/json")
+        handler.stream_body(json_codec.iter_array({"n": n} for n in range(5000)))
+
+    server.routes.add("GET", "/test-stream", stream_numbers)
+    info = start_server()
+    conn = http.client.HTTPConnection("localhost", info["port"], timeout=5)
+
+    conn.request("GET", "/test-stream")
+    response = conn.getresponse()
+    assert response.getheader("Transfer-Encoding") == "chunked"
+    assert response.getheader("Content-Length") is None
+    assert json.loads(response.read()) == [{"n": n} for n in range(5000)]
+
+    conn.request("GET", "/")
+    assert conn.getresponse().read() == b"Server is running"
+
+    conn.close()
+    stop_server(info)
+
+
+def test_streamed_response_can_be_compressed():
+    def stream_names(handler):
+        handler.send_response(200)
+        handler.send_header("Content-type", "application/json")
+        handler.stream_body(json_codec.iter_array(f"Lot {n}" for n in range(5000)))
+
+    server.routes.add("GET", "/test-stream-gzip", stream_names)
+    info = start_server()
+    conn = http.client.HTTPConnection("localhost", info["port"], timeout=5)
+
+    conn.request("GET", "/test-stream-gzip", headers={"Accept-Encoding": "gzip"})
+    response = conn.getresponse()
+    assert response.getheader("Content-Encoding") == "gzip"
+    assert json.loads(gzip.decompress(response.read())) == [f"Lot {n}" for n in range(5000)]
+
+    conn.close()
+    stop_server(info)
+
+
+def test_small_streamed_response_is_sent_whole():
+    def stream_two(handler):
+        handler.send_response(200)
+        handler.send_header("Content-type", "application/json")
+        handler.send_header("ETag", '"small"')
+        handler.stream_body(json_codec.iter_array(["Lot 1", "Lot 2"]))
+
+    server.routes.add("GET", "/test-stream-small", stream_two)
+    info = start_server()
+    conn = http.client.HTTPConnection("localhost", info["port"], timeout=5)
+
+    conn.request("GET", "/test-stream-small", headers={"Accept-Encoding": "gzip"})
+    response = conn.getresponse()
+    body = response.read()
+    assert response.getheader("Transfer-Encoding") is None
+    assert response.getheader("Content-Encoding") is None
+    assert response.getheader("Content-Length") == str(len(body))
+    assert response.getheader("ETag") == '"small"'
+    assert json.loads(body) == ["Lot 1", "Lot 2"]
+
+    conn.close()
+    stop_server(info)
+
+
+def test_frame_response_adds_length_and_connection():
+    raw = b"HTTP/1.1 200 OK\r\nContent-type: application/json\r\n\r\n{}"
+
+    response, keep_alive = async_server._frame_response(raw, True)
+
+    assert keep_alive is True
+    assert b"Content-Length: 2\r\n" in response
+    assert b"Connection: keep-alive\r\n" in response
+    assert response.endswith(b"\r\n\r\n{}")
+
+
+def test_frame_response_without_output_is_not_found():
+    response, keep_alive = async_server._frame_response(b"", False)
+
+    assert response.startswith(b"HTTP/1.1 404 Not Found\r\n")
+    assert b"Connection: close\r\n" in response
+    assert keep_alive is False
@@ -0,0 +1,71 @@
+import sys
+import os
+import gzip
+import zlib
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import compression
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip, deflate, br", "gzip"),
+    ("deflate", "deflate"),
+    ("gzip;q=0.5, deflate", "deflate"),
+    ("gzip;q=0, deflate;q=0", None),
+    ("*", "gzip"),
+    ("identity", None),
+    ("", None),
+    (None, None),
+])
+def test_choose_encoding(header, expected):
+    assert compression.choose_encoding(header) == expected
+
+
+def test_level_zero_turns_compression_off(monkeypatch):
+    monkeypatch.setattr(compression, "LEVEL", 0)
+
+    assert compression.choose_encoding("gzip") is None
+
+
+def response(body, *headers):
+    head = b"\r\n".join((b"HTTP/1.1 200 OK", b"Content-type: application/json") + headers)
+    return head + b"\r\n\r\n" + body
+
+
+def test_large_response_is_compressed():
+    body = b'{"name": "Parkeergarage Zuid"}' * 100
+    raw = response(body, b'ETag: "abc"')
+
+    encoded = compression.encode_response(raw, "gzip")
+
+    head, _, compressed = encoded.partition(b"\r\n\r\n")
+    assert gzip.decompress(compressed) == body
+    assert b"Content-Encoding: gzip" in head
+    assert b"Content-Length: %d" % len(compressed) in head
+    assert b'ETag: W/"abc"' in head
+
+
+def test_existing_vary_is_not_repeated():
+    raw = response(b"x" * 2000, b"Vary: Accept-Encoding")
+
+    head = compression.encode_response(raw, "gzip").partition(b"\r\n\r\n")[0]
+
+    assert head.count(b"Vary:") == 1
+
+
+def test_deflate_is_zlib_format():
+    body = b"x" * 5000
+
+    encoded = compression.encode_response(response(body), "deflate")
+
+    assert zlib.decompress(encoded.partition(b"\r\n\r\n")[2]) == body
+
+
+def test_small_or_encoded_response_is_left_alone():
+    small = response(b"{}")
+    encoded = response(b"x" * 5000, b"Content-Encoding: gzip")
+
+    assert compression.encode_response(small, "gzip") is small
+    assert compression.encode_response(encoded, "gzip") is encoded
@@ -0,0 +1,61 @@
+import sys
+import os
+import json
+import importlib
+from datetime import datetime
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import json_codec
+
+
+@pytest.fixture(params=["json", "orjson", "ujson"])
+def codec(request, monkeypatch):
+    monkeypatch.setenv("JSON_CODEC", request.param)
+    try:
+        module = importlib.reload(json_codec)
+    except ImportError:
+        pytest.skip(f"{request.param} is not installed")
+    yield module
+    monkeypatch.delenv("JSON_CODEC")
+    importlib.reload(json_codec)
+
+
+def test_round_trip(codec):
+    data = {"1": {"name": "Parkeergarage Zuid", "tariff": 2.5, "reserved": 0, "tags": []}}
+
+    assert codec.loads(codec.dumps(data)) == data
+    assert codec.loads(codec.encode(data)) == data
+    assert isinstance(codec.encode(data), bytes)
+
+
+def test_datetimes_are_written_like_default_str(codec):
+    created = datetime(2024, 5, 1, 12, 30, 15)
+
+    assert codec.loads(codec.dumps({"created_at": created})) == {
+        "created_at": "2024-05-01 12:30:15"
+    }
+
+
+def test_output_matches_stdlib_json(codec):
+    data = {"licenseplate": "AB-12/CD", "user": "jöns", "amount": 10, "created_at": datetime(2024, 1, 1)}
+
+    assert json.loads(codec.dumps(data)) == json.loads(json.dumps(data, default=str))
+
+
+def test_invalid_input_raises_json_decode_error(codec):
+    with pytest.raises(json.JSONDecodeError):
+        codec.loads("{'invalid': json}")
+
+
+def test_iter_array_and_object(codec):
+    rows = [{"sid": "1", "started": datetime(2025, 1, 1)}, {"sid": "2"}]
+
+    assert json.loads(b"".join(codec.iter_array(iter(rows)))) == json.loads(codec.dumps(rows))
+    assert json.loads(b"".join(codec.iter_array([]))) == []
+    assert json.loads(b"".join(codec.iter_object((r["sid"], r) for r in rows))) == {
+        "1": {"sid": "1", "started": "2025-01-01 00:00:00"},
+        "2": {"sid": "2"},
+    }
+    assert b"".join(codec.iter_object({}.items())) == b"{}"
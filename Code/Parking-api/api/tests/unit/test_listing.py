@@ -0,0 +1,57 @@
+import sys
+import os
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import listing
+
+
+def items(count):
+    return ((str(i), {"name": f"Lot {i}", "location": "Rotterdam"}) for i in range(1, count + 1))
+
+
+def test_paginate_returns_next_cursor():
+    page, cursor = listing.paginate(items(5), 2)
+
+    assert [lid for lid, lot in page] == ["1", "2"]
+    assert cursor == "2"
+
+
+def test_last_page_has_no_cursor():
+    assert listing.paginate(items(2), 2)[1] is None
+    assert len(list(listing.paginate(items(5), None)[0])) == 5
+
+
+def test_paginate_consumes_one_item_past_the_page():
+    source = items(100)
+    listing.paginate(source, 10)
+
+    assert next(source)[0] == "12"
+
+
+def test_project():
+    lot = {"name": "Lot 1", "location": "Rotterdam", "tariff": 2}
+
+    assert listing.project(lot, ["name", "tariff", "missing"]) == {"name": "Lot 1", "tariff": 2}
+    assert listing.project(lot, None) is lot
+
+
+def test_query_params():
+    params = listing.query_params("/parking-lots/?limit=10&fields=name,location")
+
+    assert params == {"limit": "10", "fields": "name,location"}
+    assert listing.parse_fields(params["fields"]) == ["name", "location"]
+    assert listing.parse_limit(params["limit"]) == 10
+
+
+@pytest.mark.parametrize("parse, value", [
+    (listing.parse_limit, "0"),
+    (listing.parse_limit, "abc"),
+    (listing.parse_limit, str(listing.MAX_LIMIT + 1)),
+    (listing.parse_cursor, "-1"),
+    (listing.parse_date, "01-02-2025"),
+])
+def test_invalid_values(parse, value):
+    with pytest.raises(listing.QueryError):
+        parse(value)
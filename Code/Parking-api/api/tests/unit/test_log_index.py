@@ -0,0 +1,101 @@
+import sys
+import os
+import json
+import logging
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import log_index
+
+
+class Formatter(logging.Formatter):
+    def format(self, record):
+        return json.dumps({
+            "timestamp": datetime.utcfromtimestamp(record.created).isoformat(),
+            "level": record.levelname,
+            "message": record.getMessage(),
+            "path": getattr(record, "path", None),
+            "method": getattr(record, "method", None),
+        })
+
+
+def make_logger(path, max_bytes=0):
+    handler = log_index.IndexedRotatingFileHandler(path, maxBytes=max_bytes, backupCount=3)
+    handler.setFormatter(Formatter())
+    logger = logging.getLogger(f"test-log-index-{path}")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.handlers = [handler]
+    return logger, handler
+
+
+def log(logger, message, path="/parking-lots", method="GET", level=logging.INFO, created=None):
+    extra = {"path": path, "method": method}
+    if created is None:
+        logger.log(level, message, extra=extra)
+    else:
+        with patch("time.time", return_value=created), patch("time.time_ns", return_value=int(created * 1e9)):
+            logger.log(level, message, extra=extra)
+
+
+def test_filters_use_the_posting_lists(tmp_path):
+    path = str(tmp_path / "api.log")
+    logger, handler = make_logger(path)
+    for n in range(300):
+        log(logger, f"lots {n}")
+        log(logger, f"payment {n}", path="/payments", method="POST")
+    log(logger, "refused", path="/payments", method="POST", level=logging.WARNING)
+    handler.close()
+
+    with patch("json.loads", wraps=json.loads) as parse:
+        results = log_index.search(path, 3, level="WARNING", path="/payments", limit=10)
+
+    assert [r["message"] for r in results] == ["refused"]
+    assert parse.call_count == 1
+
+    results = log_index.search(path, 3, method="POST", limit=2)
+    assert [r["message"] for r in results] == ["refused", "payment 299"]
+    assert log_index.search(path, 3, level="ERROR") == []
+    assert [r["message"] for r in log_index.search(path, 3, text="lots 1", limit=2)] == ["lots 199", "lots 198"]
+
+
+def test_time_range(tmp_path):
+    path = str(tmp_path / "api.log")
+    logger, handler = make_logger(path)
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc).timestamp()
+    for hour in range(24):
+        log(logger, f"hour {hour}", created=start + hour * 3600)
+    handler.close()
+
+    results = log_index.search(
+        path, 3, start=datetime(2026, 1, 1, 10), end=datetime(2026, 1, 1, 12, 30), limit=100)
+
+    assert [r["message"] for r in results] == ["hour 12", "hour 11", "hour 10"]
+
+
+def test_search_continues_into_rotated_files(tmp_path):
+    path = str(tmp_path / "api.log")
+    logger, handler = make_logger(path, max_bytes=2000)
+    for n in range(40):
+        log(logger, f"request {n}")
+    handler.close()
+
+    assert os.path.exists(path + ".1.idx")
+    messages = [r["message"] for r in log_index.search(path, 3, method="GET", limit=1000)]
+    # Whatever is still in the log and its 3 backups, newest first and complete
+    assert messages == [f"request {n}" for n in range(39, 39 - len(messages), -1)]
+    assert len(messages) > 20
+
+
+def test_log_written_before_the_index(tmp_path):
+    path = str(tmp_path / "api.log")
+    with open(path, "w") as f:
+        f.write(json.dumps({"timestamp": "2026-01-01T10:00:00", "level": "INFO",
+                            "message": "old", "path": "/", "method": "GET"}) + "\n")
+    logger, handler = make_logger(path)
+    log(logger, "new")
+    handler.close()
+
+    assert [r["message"] for r in log_index.search(path, 3, method="GET")] == ["new", "old"]
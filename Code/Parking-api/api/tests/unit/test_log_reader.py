@@ -0,0 +1,55 @@
+import sys
+import os
+import io
+import json
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import log_reader
+
+
+def write_log(path, records):
+    with open(path, "w") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+
+def test_reverse_lines_across_blocks():
+    lines = [f"line {n} " * (n % 7) + str(n) for n in range(200)]
+    data = ("\n".join(lines) + "\n").encode()
+
+    result = list(log_reader.reverse_lines(io.BytesIO(data), block_size=16))
+
+    assert result == [line.encode() for line in reversed(lines)]
+
+
+def test_last_line_without_newline():
+    assert list(log_reader.reverse_lines(io.BytesIO(b"a\nb\n\nc"))) == [b"c", b"b", b"a"]
+    assert list(log_reader.reverse_lines(io.BytesIO(b""))) == []
+
+
+def test_records_continue_into_backups(tmp_path):
+    log = str(tmp_path / "api.log")
+    write_log(log + ".2", [{"n": 1}, {"n": 2}])
+    write_log(log + ".1", [{"n": 3}])
+    write_log(log, [{"n": 4}, {"n": 5}])
+    with open(log, "a") as f:
+        f.write('{"n": 6, "message": "half wr')
+
+    records = log_reader.reverse_records(log, backups=5, block_size=8)
+
+    assert [record["n"] for record in records] == [5, 4, 3, 2, 1]
+
+
+def test_reading_stops_at_the_first_matches(tmp_path):
+    log = str(tmp_path / "api.log")
+    write_log(log, [{"n": n} for n in range(10000)])
+    with open(log, "rb") as file:
+        reads = []
+        original = file.read
+        file.read = lambda size=-1: reads.append(size) or original(size)
+
+        lines = log_reader.reverse_lines(file, block_size=1024)
+        assert json.loads(next(lines)) == {"n": 9999}
+
+    assert sum(reads) == 1024
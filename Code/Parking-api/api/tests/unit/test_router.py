@@ -0,0 +1,67 @@
+import sys
+import os
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from router import Router
+
+
+def make_router():
+    router = Router()
+    router.add("GET", "/parking-lots/", "list")
+    router.add("GET", "/parking-lots/{lid:id}", "lot")
+    router.add("GET", "/parking-lots/{lid:id}/sessions/{sid:int}", "session")
+    router.add("GET", "/vehicles/{plate}/history", "history")
+    router.add("DELETE", "/parking-lots/{lid:id}", "delete")
+    return router
+
+
+def test_static_route():
+    assert make_router().match("GET", "/parking-lots/") == ("list", {})
+
+
+def test_typed_parameters():
+    router = make_router()
+
+    assert router.match("GET", "/parking-lots/12") == ("lot", {"lid": "12"})
+    assert router.match("GET", "/parking-lots/12/sessions/3") == (
+        "session",
+        {"lid": "12", "sid": 3},
+    )
+    assert router.match("GET", "/vehicles/AB-12-CD/history") == (
+        "history",
+        {"plate": "AB-12-CD"},
+    )
+
+
+def test_no_match():
+    router = make_router()
+
+    assert router.match("GET", "/parking-lots/abc") == (None, None)
+    assert router.match("GET", "/parking-lots/12/extra") == (None, None)
+    assert router.match("PUT", "/parking-lots/12") == (None, None)
+    assert router.match("DELETE", "/parking-lots/12") == ("delete", {"lid": "12"})
+
+
+def test_query_string_is_ignored():
+    assert make_router().match("GET", "/parking-lots/7?fields=name") == (
+        "lot",
+        {"lid": "7"},
+    )
+
+
+def test_routes_added_later_are_matched():
+    router = make_router()
+    router.match("GET", "/parking-lots/1")
+
+    @router.route("GET", "/reservations/{rid:id}")
+    def show_reservation(handler, rid):
+        pass
+
+    assert router.match("GET", "/reservations/5") == (show_reservation, {"rid": "5"})
+
+
+def test_unknown_parameter_type():
+    with pytest.raises(ValueError):
+        Router().add("GET", "/x/{y:float}", "x")
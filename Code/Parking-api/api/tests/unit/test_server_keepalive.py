@@ -0,0 +1,165 @@
+import sys
+import os
+import json
+import threading
+import http.client
+import socket
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import server
+
+
+def start_server():
+    httpd = server.ThreadPoolHTTPServer(("localhost", 0), server.RequestHandler, threads=2)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+def stop_server(httpd):
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_requests_share_one_connection():
+    httpd = start_server()
+    conn = http.client.HTTPConnection("localhost", httpd.server_address[1], timeout=5)
+
+    for _ in range(3):
+        conn.request("GET", "/")
+        response = conn.getresponse()
+        assert response.version == 11
+        assert response.getheader("Content-Length") == str(len(b"Server is running"))
+        assert response.read() == b"Server is running"
+    sock = conn.sock
+    conn.request("GET", "/does-not-exist")
+    assert conn.getresponse().read() == b"Not found"
+    assert conn.sock is sock
+
+    conn.close()
+    stop_server(httpd)
+
+
+def test_unread_body_does_not_leak_into_next_request():
+    httpd = start_server()
+    conn = http.client.HTTPConnection("localhost", httpd.server_address[1], timeout=5)
+
+    # Refused before the handler reads the body
+    conn.request("POST", "/vehicles", body=json.dumps({"licenseplate": "AB-12-CD"}))
+    response = conn.getresponse()
+    assert response.status == 401
+    response.read()
+
+    conn.request("GET", "/")
+    assert conn.getresponse().read() == b"Server is running"
+
+    conn.close()
+    stop_server(httpd)
+
+
+def test_connection_is_closed_after_request_cap(monkeypatch):
+    monkeypatch.setattr(server, "KEEPALIVE_MAX", 2)
+    httpd = start_server()
+    conn = http.client.HTTPConnection("localhost", httpd.server_address[1], timeout=5)
+
+    conn.request("GET", "/")
+    first = conn.getresponse()
+    first.read()
+    conn.request("GET", "/")
+    second = conn.getresponse()
+    second.read()
+
+    assert first.getheader("Connection") is None
+    assert second.getheader("Connection") == "close"
+
+    conn.close()
+    stop_server(httpd)
+
+
+def test_idle_connections_do_not_hold_the_workers():
+    httpd = start_server()
+    port = httpd.server_address[1]
+    idle = []
+    for _ in range(3):
+        conn = http.client.HTTPConnection("localhost", port, timeout=5)
+        conn.request("GET", "/")
+        conn.getresponse().read()
+        idle.append(conn)
+
+    # Two workers, three idle connections: a new client is served right away
+    conn = http.client.HTTPConnection("localhost", port, timeout=1)
+    conn.request("GET", "/")
+    assert conn.getresponse().read() == b"Server is running"
+    conn.close()
+
+    # and the idle ones are picked up again when they send a request
+    for conn in idle:
+        conn.request("GET", "/")
+        assert conn.getresponse().read() == b"Server is running"
+        conn.close()
+    stop_server(httpd)
+
+
+def test_idle_connection_is_closed_after_timeout(monkeypatch):
+    monkeypatch.setattr(server, "KEEPALIVE_TIMEOUT", 0.2)
+    httpd = start_server()
+    sock = socket.create_connection(("localhost", httpd.server_address[1]), timeout=5)
+
+    sock.sendall(b"GET / HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    response = b""
+    while not response.endswith(b"Server is running"):
+        response += sock.recv(4096)
+    # The server hangs up on its own once the connection has been idle
+    assert sock.recv(4096) == b""
+
+    sock.close()
+    stop_server(httpd)
+
+
+def test_failed_bind_raises_oserror():
+    httpd = start_server()
+    idle_threads = threading.active_count()
+
+    with pytest.raises(OSError):
+        server.ThreadPoolHTTPServer(httpd.server_address, server.RequestHandler, threads=2)
+    # The half-built server cleaned up after itself
+    assert threading.active_count() == idle_threads
+
+    stop_server(httpd)
+
+
+def test_pipelined_requests_are_all_answered():
+    httpd = start_server()
+    sock = socket.create_connection(("localhost", httpd.server_address[1]), timeout=5)
+
+    sock.sendall(b"GET / HTTP/1.1\r\nHost: localhost\r\n\r\n" * 2)
+    response = b""
+    while response.count(b"Server is running") < 2:
+        data = sock.recv(4096)
+        assert data
+        response += data
+
+    sock.close()
+    stop_server(httpd)
+
+
+def test_session_is_looked_up_once_per_request(monkeypatch):
+    lookups = []
+
+    def get_session(token):
+        lookups.append(token)
+        return {"username": "alice", "role": "USER"}
+
+    monkeypatch.setattr(server, "get_session", get_session)
+    httpd = start_server()
+    conn = http.client.HTTPConnection("localhost", httpd.server_address[1], timeout=5)
+
+    for _ in range(2):
+        conn.request("GET", "/profile", headers={"Authorization": "token"})
+        assert json.loads(conn.getresponse().read())["username"] == "alice"
+    assert lookups == ["token", "token"]
+
+    conn.close()
+    stop_server(httpd)
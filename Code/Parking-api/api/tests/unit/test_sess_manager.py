@@ -6,7 +6,8 @@ import pytest
 # Add the project root so Python can find the api module
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..')))
 
-from api.session_manager import add_session, remove_session, get_session, sessions
+import api.session_manager as session_manager
+from api.session_manager import add_session, remove_session, get_session, sessions, use_store, SessionStore
 
 # Clear sessions before each test
 def setup_function():
@@ -39,3 +40,172 @@ def test_remove_session():
     assert get_session("token3") is None
     # Removing a non-existent token returns None
     assert remove_session("nonexistent") is None
+
+
+def test_use_store_moves_sessions():
+    add_session("token4", {"username": "user4"})
+    store = {}
+    use_store(store)
+    try:
+        assert store["token4"][0] == {"username": "user4"}
+        assert get_session("token4") == {"username": "user4"}
+        add_session("token5", {"username": "user5"})
+        assert "token5" in store
+        assert get_session("token5") == {"username": "user5"}
+    finally:
+        session_manager.sessions = sessions
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_store(**settings):
+    clock = FakeClock()
+    defaults = {"idle_ttl": 60, "max_age": 300, "max_sessions": 10, "sweep_interval": 30}
+    return SessionStore(clock=clock, **(defaults | settings)), clock
+
+
+def test_idle_session_expires():
+    store, clock = make_store()
+    store["token"] = {"username": "user"}
+
+    clock.now += 50
+    assert store.get("token") == {"username": "user"}
+    # The lookup above counts as use, so the idle time starts over
+    clock.now += 50
+    assert store.get("token") == {"username": "user"}
+
+    clock.now += 61
+    assert store.get("token") is None
+    assert store.stats()["expired"] == 1
+
+
+def test_session_expires_at_max_age_even_when_used():
+    store, clock = make_store()
+    store["token"] = {"username": "user"}
+
+    for _ in range(6):
+        clock.now += 50
+        assert store.get("token") is not None
+    clock.now += 50
+    assert store.get("token") is None
+
+
+def test_least_recently_used_session_is_evicted():
+    store, clock = make_store(max_sessions=2)
+    store["a"] = {"username": "a"}
+    store["b"] = {"username": "b"}
+    store.get("a")
+    store["c"] = {"username": "c"}
+
+    assert "b" not in store
+    assert "a" in store and "c" in store
+    assert store.stats() == {"live": 2, "expired": 0, "evicted": 1, "max": 2}
+
+
+def test_shared_store_evicts_oldest_by_last_use():
+    # A plain dict stands in for the Manager dict used by prefork workers
+    clock = FakeClock()
+    store = SessionStore(
+        {}, idle_ttl=60, max_age=300, max_sessions=2, sweep_interval=30, clock=clock
+    )
+    store["a"] = {"username": "a"}
+    clock.now += 5
+    store["b"] = {"username": "b"}
+    clock.now += 5
+    store.get("a")
+    store["c"] = {"username": "c"}
+
+    assert store.get("b") is None
+    assert store.get("a") is not None
+
+
+def test_sweep_removes_expired_sessions_without_lookups():
+    store, clock = make_store()
+    store["old"] = {"username": "old"}
+    clock.now += 40
+    store["new"] = {"username": "new"}
+
+    # Adding a session after the sweep interval triggers the sweep
+    clock.now += 40
+    store["newer"] = {"username": "newer"}
+
+    assert len(store) == 2
+    assert store.stats()["expired"] == 1
+
+
+def test_sqlite_entries_survive_restart_and_are_shared(tmp_path):
+    from api.session_sqlite import SqliteSessionEntries
+
+    path = str(tmp_path / "sessions.db")
+    clock = FakeClock()
+    worker1 = SessionStore(SqliteSessionEntries(path), clock=clock)
+    worker2 = SessionStore(SqliteSessionEntries(path), clock=clock)
+
+    worker1["token"] = {"username": "user", "role": "ADMIN"}
+    assert worker2.get("token") == {"username": "user", "role": "ADMIN"}
+
+    # A logout in one worker must not be served from the other's cache
+    worker1.pop("token")
+    assert worker2.get("token") is None
+
+    worker1["token2"] = {"username": "user2"}
+    restarted = SessionStore(SqliteSessionEntries(path), clock=clock)
+    assert restarted.get("token2") == {"username": "user2"}
+
+
+def test_sqlite_entries_leave_out_the_password(tmp_path):
+    import sqlite3
+    from api.session_sqlite import SqliteSessionEntries
+
+    path = str(tmp_path / "sessions.db")
+    store = SessionStore(SqliteSessionEntries(path), clock=FakeClock())
+    store["token"] = {"username": "user", "role": "USER", "password": "5f4dcc3b"}
+
+    assert store.get("token") == {"username": "user", "role": "USER"}
+    stored = sqlite3.connect(path).execute("SELECT user FROM sessions").fetchone()[0]
+    assert "password" not in stored and "5f4dcc3b" not in stored
+
+
+def test_sqlite_entries_keep_count(tmp_path):
+    from api.session_sqlite import SqliteSessionEntries
+
+    path = str(tmp_path / "sessions.db")
+    entries = SqliteSessionEntries(path)
+    entries["a"] = ({"username": "a"}, 1, 1)
+    entries["a"] = ({"username": "a"}, 1, 2)
+    entries["b"] = ({"username": "b"}, 1, 1)
+    assert len(entries) == 2
+    assert len(SqliteSessionEntries(path)) == 2
+
+    entries.pop("a")
+    assert len(entries) == 1
+    entries.delete_expired(idle_before=5, created_before=0)
+    assert len(entries) == 0
+
+
+def test_sqlite_entries_expire_and_evict(tmp_path):
+    from api.session_sqlite import SqliteSessionEntries
+
+    clock = FakeClock()
+    store = SessionStore(
+        SqliteSessionEntries(str(tmp_path / "sessions.db")),
+        idle_ttl=60, max_age=300, max_sessions=2, sweep_interval=30, clock=clock,
+    )
+    store["a"] = {"username": "a"}
+    clock.now += 5
+    store["b"] = {"username": "b"}
+    clock.now += 5
+    store.get("a")
+    store["c"] = {"username": "c"}
+    assert store.get("b") is None
+    assert store.stats()["evicted"] == 1
+
+    clock.now += 100
+    assert store.sweep() == 2
+    assert len(store) == 0
@@ -0,0 +1,70 @@
+import sys
+import os
+import json
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import signed_tokens
+from signed_tokens import DenyList
+
+
+@pytest.fixture(autouse=True)
+def denylist(tmp_path, monkeypatch):
+    denylist = DenyList(str(tmp_path / "revoked.jsonl"), refresh=0)
+    monkeypatch.setattr(signed_tokens, "_denylist", denylist)
+    return denylist
+
+
+def test_token_round_trip():
+    token = signed_tokens.issue({"username": "alice", "role": "ADMIN", "password": "x"}, 60)
+
+    assert signed_tokens.is_signed(token)
+    assert signed_tokens.verify(token) == {"username": "alice", "role": "ADMIN"}
+    # Nothing besides the claims ends up in the token
+    assert "password" not in token
+
+
+def test_tampered_token_is_rejected():
+    token = signed_tokens.issue({"username": "alice"}, 60)
+    payload, _, signature = token.rpartition(".")
+    claims = json.loads(signed_tokens._b64decode(payload[len(signed_tokens.PREFIX):]))
+    claims["role"] = "ADMIN"
+    forged = signed_tokens.PREFIX + signed_tokens._b64encode(json.dumps(claims).encode())
+
+    assert signed_tokens.verify(forged + "." + signature) is None
+    assert signed_tokens.verify(token[:-2]) is None
+    assert signed_tokens.verify("v1.garbage") is None
+    assert signed_tokens.verify("v1.ïnvalid.sig") is None
+
+
+def test_expired_token_is_rejected():
+    token = signed_tokens.issue({"username": "alice"}, 60, now=1000)
+
+    assert signed_tokens.verify(token, now=1059) is not None
+    assert signed_tokens.verify(token, now=1060) is None
+
+
+def test_revoked_token_is_denied_in_other_processes(tmp_path, denylist):
+    token = signed_tokens.issue({"username": "alice"}, 60)
+    # Another worker reading the same deny-list file
+    other = DenyList(denylist.filename, refresh=0)
+
+    assert signed_tokens.revoke(token) == {"username": "alice"}
+    assert signed_tokens.verify(token) is None
+
+    claims = signed_tokens._claims(token, 0)
+    assert other.contains(claims["jti"], claims["exp"] - 1)
+
+
+def test_denylist_forgets_expired_tokens_and_compacts(denylist):
+    for i in range(200):
+        denylist.add(f"old{i}", 100, now=50)
+    size = os.path.getsize(denylist.filename)
+
+    denylist.add("new", 1000, now=500)
+
+    assert os.path.getsize(denylist.filename) < size
+    assert not denylist.contains("old1", 500)
+    assert denylist.contains("new", 500)
+    assert DenyList(denylist.filename).contains("new", 500)
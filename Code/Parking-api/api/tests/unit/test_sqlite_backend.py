@@ -0,0 +1,140 @@
+import sys
+import os
+import threading
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import sqlite_backend
+
+
+@pytest.fixture(autouse=True)
+def database(tmp_path, monkeypatch):
+    monkeypatch.setattr(sqlite_backend, "DB_PATH", str(tmp_path / "test.db"))
+    monkeypatch.setattr(sqlite_backend, "_schema_pid", None)
+    monkeypatch.setattr(sqlite_backend, "_local", threading.local())
+    yield
+    conn = getattr(sqlite_backend._local, "conn", None)
+    if conn is not None:
+        conn.close()
+
+
+def test_users_round_trip():
+    sqlite_backend.add_user({"username": "alice", "password": "x", "name": "Alice"})
+
+    assert sqlite_backend.get_user("alice")["name"] == "Alice"
+    assert sqlite_backend.get_user("bob") is None
+
+    user = sqlite_backend.update_user("alice", {"name": "Alice B", "active": True})
+    assert user["name"] == "Alice B"
+    assert sqlite_backend.get_user("alice")["active"] is True
+    assert [u["username"] for u in sqlite_backend.load_user_data()] == ["alice"]
+
+
+def test_records_keep_the_shape_of_the_json_backend():
+    sqlite_backend.add_user({"username": "alice", "password": "x", "nickname": "Al"})
+    assert sqlite_backend.get_user("alice") == {"username": "alice", "password": "x", "nickname": "Al"}
+
+    lot = {"name": "Centrum", "capacity": 10, "opening_hours": {"mon": "08-18"}}
+    sqlite_backend.save_parking_lot("7", lot)
+    assert sqlite_backend.get_parking_lot("7") == lot
+    assert sqlite_backend.load_parking_lot_data() == {"7": lot}
+
+
+def test_migrated_rows_keep_their_id():
+    conn = sqlite_backend._connect()
+    conn.execute("INSERT INTO users (id, username, password) VALUES (3, 'bob', 'x')")
+    assert sqlite_backend.get_user("bob") == {"id": "3", "username": "bob", "password": "x"}
+
+
+def test_update_of_unknown_user_without_password():
+    assert sqlite_backend.update_user("nobody", {"name": "Nobody"}) is None
+    assert sqlite_backend.get_user("nobody") is None
+
+
+def test_parking_lot_keeps_coordinates():
+    lot = {"name": "Centrum", "capacity": 10, "coordinates": {"lat": 52.1, "lng": 4.3}}
+    sqlite_backend.save_parking_lot("7", lot)
+
+    stored = sqlite_backend.get_parking_lot("7")
+    assert stored["name"] == "Centrum"
+    assert stored["coordinates"] == {"lat": 52.1, "lng": 4.3}
+    assert list(sqlite_backend.load_parking_lot_data()) == ["7"]
+
+    sqlite_backend.delete_parking_lot("7")
+    assert sqlite_backend.get_parking_lot("7") is None
+
+
+def test_parking_lot_version_follows_changes():
+    first = sqlite_backend.parking_lot_version()
+    sqlite_backend.save_parking_lot("7", {"name": "Centrum"})
+    second = sqlite_backend.parking_lot_version()
+    assert second != first
+    assert sqlite_backend.parking_lot_version() == second
+
+    sqlite_backend.delete_parking_lot("7")
+    assert sqlite_backend.parking_lot_version() not in (first, second)
+
+
+def test_parking_sessions_in_pages():
+    for sid, plate in enumerate(["AB-12-CD", "XY-99-ZZ", "AB-12-CD"], 1):
+        session = {"licenseplate": plate, "user": "alice", "stopped": None if sid == 3 else "x"}
+        sqlite_backend.save_parking_session("1", str(sid), session)
+
+    assert [sid for sid, s in sqlite_backend.iter_parking_sessions("1", after=1)] == ["2", "3"]
+    assert [sid for sid, s in sqlite_backend.iter_parking_sessions("1", state="open")] == ["3"]
+    assert [sid for sid, s in sqlite_backend.iter_parking_sessions("1", licenseplate="AB-12-CD")] == ["1", "3"]
+
+
+def test_vehicles_are_kept_per_user():
+    sqlite_backend.save_vehicle("alice", "AB-12-CD", {"name": "Car"})
+    sqlite_backend.save_vehicle("bob", "XY-99-ZZ", {"name": "Van"})
+
+    assert sqlite_backend.load_user_vehicles("alice") == {"AB-12-CD": {"name": "Car"}}
+
+    sqlite_backend.delete_vehicle("alice", "AB-12-CD")
+    assert sqlite_backend.load_user_vehicles("alice") == {}
+    assert "XY-99-ZZ" in sqlite_backend.load_user_vehicles("bob")
+
+
+def test_parking_sessions_are_kept_per_lot():
+    session = {"licenseplate": "AB-12-CD", "user": "alice", "stopped": None}
+    sqlite_backend.save_parking_session("1", "1", session)
+    sqlite_backend.save_parking_session("2", "1", dict(session, user="bob"))
+
+    assert sqlite_backend.load_parking_sessions("1") == {"1": session}
+    assert sqlite_backend.get_parking_session("2", "1")["user"] == "bob"
+    assert sqlite_backend.find_open_session("1", "AB-12-CD")[0] == "1"
+
+    sqlite_backend.save_parking_session("1", "1", dict(session, stopped="01-01-2025 11:00:00"))
+    assert sqlite_backend.find_open_session("1", "AB-12-CD") == (None, None)
+
+    sqlite_backend.delete_parking_session("1", "1")
+    assert sqlite_backend.get_parking_session("1", "1") is None
+
+
+def test_next_id_continues_after_existing_records():
+    sqlite_backend.save_reservation("3", {"user": "alice"})
+
+    existing = sqlite_backend.load_reservation_data
+    assert sqlite_backend.next_id("reservations", existing) == "4"
+    sqlite_backend.delete_reservation("3")
+    assert sqlite_backend.next_id("reservations", existing) == "5"
+
+
+def test_payments_totals_and_updates():
+    sqlite_backend.append_payment({"transaction": "t1", "amount": 5, "initiator": "alice"})
+    sqlite_backend.append_payment({"transaction": "t1", "amount": -2, "initiator": "admin"})
+    sqlite_backend.append_payment({"transaction": "t2", "amount": 3, "initiator": "alice"})
+
+    totals = sqlite_backend.load_payment_totals()
+    assert totals.get("t1") == 3
+    assert totals.get("missing", 0) == 0
+    assert len(sqlite_backend.load_user_payments("alice")) == 2
+
+    key, payment = sqlite_backend.find_payment("t1")
+    payment["completed"] = "01-01-2025 10:00:00"
+    sqlite_backend.update_payment(key, payment)
+
+    assert sqlite_backend.load_payment_data()[0]["completed"] == "01-01-2025 10:00:00"
+    assert sqlite_backend.find_payment("nope") == (None, None)